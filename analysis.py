@@ -1,110 +1,207 @@
-from os import listdir
-from os.path import isfile, join
-from columnar import columnar
 import argparse
-from progressbar import progressbar
-import click
+import itertools
+import csv
+import os
 import time
-
-import assembler
-from simple_processor import SimpleProcessor
-from pipelined_processor import PipelinedProcessor
-from scheduled_processor import ScheduledProcessor
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import Counter
+from tqdm import tqdm
 
 from tests import tests
-
-parser = argparse.ArgumentParser(
-    description="Run the test suite for all programs")
-
-parser.add_argument(
-    "-s",
-    required=True,
-    help="Superscalar factor",
-    type=int,
-    dest="instructions_per_cycle",
-)
-
-parser.add_argument(
-    "-pred",
-    "--predictor",
-    required=True,
-    help="Choose the branch prediction method.",
-    choices=["taken", "not_taken", "one_bit", "two_bit"],
-    dest="prediction_method",
-)
-
-args = parser.parse_args()
-
-files = [k for k in tests.keys()]
-processors = [SimpleProcessor, PipelinedProcessor, ScheduledProcessor]
-names = [proc.__name__ for proc in processors]
-tables_data = []
-
-for processor in progressbar(processors):
-    data = []
-    for ffile in files:
-        try:
-            with open(ffile) as f:
-                program = f.readlines()
-        except:
-            raise RuntimeError(f"File {ffile} not found, please check path.")
-
-        instructions, symbols = assembler.assemble(program)
-
-        cpu = processor(
-            instructions,
-            symbols,
-            prediction_method=args.prediction_method,
-            instructions_per_cycle=args.instructions_per_cycle,
-        )
-
-        start = time.time()
-
-        while cpu.running():
-            cpu.cycle()
-
-        end = time.time()
-
-        elapsed_simple = end - start
-
-        row = [
-            ffile,
-            click.style("PASSED", fg="green")
-            if tests[ffile](cpu)
-            else click.style("FAILED", fg="red"),
-            "{:#.4f}".format(elapsed_simple),
-            cpu.cycles,
-            cpu.executed,
-            cpu.cycles / cpu.executed,
-        ]
-
-        if isinstance(cpu, PipelinedProcessor):
-            row += [cpu.num_stalls]
-
-        if isinstance(cpu, ScheduledProcessor):
-            row += [cpu.predictor.prediction_accuracy()]
-
-        data.append(row)
-
-    tables_data.append(data)
-
-
-header = [
-    "filename",
-    "test result",
-    "elapsed (s)",
+from scheduled_processor import ScheduledProcessor
+import registry
+from simulation import simulate
+
+
+"""
+Sweep the design space of the scheduled processor. Every (program, prediction_method, fetches_per_cycle)
+configuration is a job for a process pool, rows are appended to the csv file as soon as a job finishes.
+"""
+
+opcodes = {
+    "arithmetic": ["add", "sub", "mul", "mod", "div", "imul", "idiv"],
+    "immediate": ["addi"],
+    "memory": ["lw", "sw"],
+    "branches": ["beq", "bne", "blt", "ble", "j"],
+}
+
+# header fields
+configuration_fields = ["filename", "prediction_method", "fetches_per_cycle"]
+fields = [
+    "status",
+    "elapsed",
     "cycles",
-    "instructions executed",
-    "CPI",
+    "executed",
+    "branch_prediction_accuracy",
+    "av_branch_distance",
 ]
+header = configuration_fields + fields + list(opcodes.keys())
+
+
+def run_job(ffile, prediction_method, fetches_per_cycle, timeout):
+    start = time.time()
+
+    stats = simulate(
+        ffile,
+        ScheduledProcessor,
+        {
+            "prediction_method": prediction_method,
+            "instructions_per_cycle": fetches_per_cycle,
+        },
+        timeout=timeout,
+    )
+
+    if stats.status == "timeout":
+        raise TimeoutError(f"timed out after {stats.cycles} cycles")
+
+    # count the committed instructions by type
+    instruction_type_counter = Counter()
+    for opcode, count in stats.details["committed"].items():
+        for k, v in opcodes.items():
+            if opcode in v:
+                instruction_type_counter[k] += count
+
+    assert sum(instruction_type_counter.values()) == stats.executed
+
+    return [
+        "ok",
+        time.time() - start,
+        stats.cycles,
+        stats.executed,
+        stats.details["prediction_accuracy"],
+        stats.details["average_branch_distance"],
+    ] + [instruction_type_counter[k] for k in opcodes.keys()]
+
+
+def completed_configurations(output):
+    # configurations that already have a successful row, used to resume a sweep
+    if not os.path.isfile(output):
+        return set()
+
+    with open(output) as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=",", quotechar="|")
+        return {
+            (row["filename"], row["prediction_method"], int(row["fetches_per_cycle"]))
+            for row in reader
+            if row["status"] == "ok"
+        }
+
+
+def sweep(configurations, output, jobs=None, timeout=None, resume=False):
+    done = completed_configurations(output) if resume else set()
+    pending = [c for c in configurations if c not in done]
+
+    mode = "a" if resume and os.path.isfile(output) else "w"
+
+    with open(output, mode, newline="") as csvfile:
+        cwriter = csv.writer(
+            csvfile, delimiter=",", quotechar="|", quoting=csv.QUOTE_MINIMAL
+        )
 
-for table_data, proc_name in zip(tables_data, names):
-    if proc_name == "ScheduledProcessor":
-        h = header + ["branch prediction accuracy"]
-    elif proc_name == "PipelinedProcessor":
-        h = header + ["number of stalls"]
-    else:
-        h = header
-    table = columnar(table_data, h, no_borders=True)
-    print(click.style(proc_name, fg="cyan"))
-    print(table)
+        if mode == "w":
+            cwriter.writerow(header)
+            csvfile.flush()
+
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                pool.submit(run_job, *configuration, timeout): configuration
+                for configuration in pending
+            }
+
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                configuration = futures[future]
+
+                try:
+                    row = future.result()
+                except Exception as e:
+                    status = "timeout" if isinstance(e, TimeoutError) else "failed"
+                    row = [f"{status}: {e}"] + [None] * (len(header) - 4)
+
+                # stream the row out straight away
+                cwriter.writerow(list(configuration) + row)
+                csvfile.flush()
+
+    return len(pending)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sweep scheduled processor configurations for a set of programs."
+    )
+
+    parser.add_argument(
+        "-f",
+        "--files",
+        nargs="+",
+        default=list(tests.keys()),
+        help="Programs to simulate, defaults to every program in the test suite.",
+        dest="files",
+    )
+
+    parser.add_argument(
+        "-pred",
+        "--predictors",
+        nargs="+",
+        default=["not_taken", "one_bit", "two_bit", "gshare", "tournament"],
+        choices=list(registry.predictors),
+        help="Branch prediction methods to sweep.",
+        dest="prediction_methods",
+    )
+
+    parser.add_argument(
+        "-s",
+        nargs="+",
+        default=[1, 4],
+        type=int,
+        help="Superscalar factors to sweep.",
+        dest="fetches_per_cycle",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes.",
+        dest="jobs",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=None,
+        help="Give up on a configuration after this many seconds.",
+        dest="timeout",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="log.csv",
+        help="Csv file the rows are written to.",
+        dest="output",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Keep the rows already in the output and only run the missing configurations.",
+        dest="resume",
+    )
+
+    args = parser.parse_args()
+
+    configurations = list(
+        itertools.product(args.files, args.prediction_methods, args.fetches_per_cycle)
+    )
+
+    sweep(
+        configurations,
+        args.output,
+        jobs=args.jobs,
+        timeout=args.timeout,
+        resume=args.resume,
+    )
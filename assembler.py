@@ -1,3 +1,59 @@
+import re
+from typing import NamedTuple, Optional
+
+OPCODES = [
+    "add",
+    "sub",
+    "mul",
+    "mod",
+    "div",
+    "imul",
+    "idiv",
+    "addi",
+    "lw",
+    "sw",
+    "beq",
+    "bne",
+    "blt",
+    "ble",
+    "j",
+]
+
+# operand layouts from grammar.txt, keyed by opcode
+OPERAND_PATTERNS = {
+    **{
+        opcode: r"^(?P<rd>\$\w*) (?P<rs>\$\w*) (?P<rt>\$\w*)$"
+        for opcode in ["add", "sub", "mul", "mod", "div", "imul", "idiv"]
+    },
+    "addi": r"^(?P<rt>\$\w*) (?P<rs>\$\w*) (?P<imm>-*\d+)$",
+    **{
+        opcode: r"^(?P<rt>\$\w*) *(?P<imm>\w+)\((?P<rs>\$\w*|\d*)\)$"
+        for opcode in ["lw", "sw"]
+    },
+    **{
+        opcode: r"^(?P<rs>\$\w*) (?P<rt>\$\w*) (?P<imm>-*\d+|\$*\w*)$"
+        for opcode in ["beq", "bne", "blt", "ble"]
+    },
+    "j": r"^(?P<imm>\w*)$",
+}
+
+
+class DecodedInstruction(NamedTuple):
+    """
+    One entry of the predecoded program image. Register fields follow the
+    operand names used in grammar.txt, unused fields are None and labels are
+    already resolved into imm.
+    """
+
+    op: int  # index into OPCODES
+    opcode: str
+    rd: Optional[int]
+    rs: Optional[int]
+    rt: Optional[int]
+    imm: Optional[int]
+    text: str
+
+
 def remove_comments(assembly):
     commentless = []
     for line in assembly:
@@ -52,3 +108,53 @@ def assemble(assembly):
     prog = resolve_labels(assembly, symbols)
 
     return prog, symbols
+
+
+def parse_operands(opcode, operand_str, symbols):
+    match = re.match(OPERAND_PATTERNS[opcode], operand_str)
+    if not match:
+        raise RuntimeError(f"Match broken for instruction {opcode} {operand_str}")
+
+    operands = {}
+
+    for k, v in match.groupdict().items():
+        if v in symbols:
+            operands[k] = symbols[v]
+        elif v[0] == "$":
+            operands[k] = int(v[1:])
+        else:
+            operands[k] = int(v)
+
+    return operands
+
+
+"""
+Decode every instruction of the program once, so that the processors fetch
+from the image instead of parsing instruction strings each cycle.
+Needs the data labels to be resolved, see Processor.resolve_labels
+"""
+
+
+def predecode(program, symbols):
+    image = []
+    for line in program:
+        opcode, operand_str = (line.split(None, 1) + [""])[:2]
+
+        if opcode not in OPERAND_PATTERNS:
+            raise RuntimeError(f"Decoding {line} -> Not implemented")
+
+        operands = parse_operands(opcode, operand_str.strip(), symbols)
+
+        image.append(
+            DecodedInstruction(
+                op=OPCODES.index(opcode),
+                opcode=opcode,
+                rd=operands.get("rd"),
+                rs=operands.get("rs"),
+                rt=operands.get("rt"),
+                imm=operands.get("imm"),
+                text=line,
+            )
+        )
+
+    return image
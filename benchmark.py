@@ -0,0 +1,316 @@
+import argparse
+import gc
+import json
+import platform
+import statistics
+import sys
+from typing import *
+
+from columnar import columnar
+
+import registry
+from simulation import load_program, simulate
+from simple_processor import SimpleProcessor
+from pipelined_processor import PipelinedProcessor
+from scheduled_processor import ScheduledProcessor
+from functional_processor import FunctionalProcessor
+
+from tests import tests
+
+"""
+Throughput of the simulator itself: simulated instructions and cycles per second of host time, for every
+processor on every program of the test suite.
+
+Every measurement builds a fresh processor and times run() only, with the garbage collector off like timeit
+does. A few warmup runs go first so imports and the host's caches are settled, then the median and the
+interquartile range of the repeated runs are reported. The translated blocks of the functional processor
+belong to the processor, so every run starts with none, like a real run does. The results can be written as
+JSON and compared against an earlier file, the comparison fails when throughput dropped by more than the
+threshold.
+"""
+
+processors = {
+    proc.__name__: proc
+    for proc in [
+        FunctionalProcessor,
+        SimpleProcessor,
+        PipelinedProcessor,
+        ScheduledProcessor,
+    ]
+}
+
+
+class Measurement(NamedTuple):
+    instructions: int
+    cycles: int
+    seconds: List[float]
+
+    def rates(self, count):
+        return [count / s for s in self.seconds]
+
+    def summary(self):
+        # median and interquartile range of the per run rates
+        result = {
+            "instructions": self.instructions,
+            "cycles": self.cycles,
+            "runs": len(self.seconds),
+        }
+
+        for name, count in [
+            ("instructions", self.instructions),
+            ("cycles", self.cycles),
+        ]:
+            rates = self.rates(count)
+            result[f"{name}_per_second"] = statistics.median(rates)
+            result[f"{name}_per_second_iqr"] = iqr(rates)
+
+        result["median_seconds"] = statistics.median(self.seconds)
+
+        return result
+
+
+def iqr(values):
+    if len(values) < 2:
+        return 0.0
+
+    q1, _, q3 = statistics.quantiles(values, n=4, method="inclusive")
+    return q3 - q1
+
+
+def measure(processor, filename, repeat=5, warmup=1, **kwargs) -> Measurement:
+    program = load_program(filename)
+
+    seconds = []
+    for run in range(warmup + repeat):
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            # simulate times the run alone, building the processor and checking the result are left out
+            stats = simulate(program, processor, kwargs)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        if run >= warmup:
+            seconds.append(stats.elapsed)
+
+    return Measurement(stats.executed, stats.cycles, seconds)
+
+
+def benchmark(names, files, repeat=5, warmup=1, **kwargs):
+    results = {}
+
+    for name in names:
+        results[name] = {}
+        for filename in files:
+            results[name][filename] = measure(
+                processors[name], filename, repeat, warmup, **kwargs
+            ).summary()
+
+    return results
+
+
+"""
+Compare against a baseline, returns the rows of the report and whether any throughput dropped by more than
+threshold (a fraction). Only pairs present in both are compared. Simulated cycles that differ from the
+baseline are flagged too, a faster simulator that simulates something else is not an optimisation.
+"""
+
+
+def compare(results, baseline, threshold=0.1):
+    rows = []
+    regressed = False
+
+    for name, programs in results.items():
+        for filename, result in programs.items():
+            base = baseline.get(name, {}).get(filename)
+            if base is None:
+                continue
+
+            ratio = result["instructions_per_second"] / base["instructions_per_second"]
+
+            notes = []
+            if ratio < 1 - threshold:
+                regressed = True
+                notes.append("REGRESSION")
+            if (result["instructions"], result["cycles"]) != (
+                base["instructions"],
+                base["cycles"],
+            ):
+                notes.append("simulated cycles changed")
+
+            rows.append(
+                [
+                    name,
+                    filename,
+                    f"{base['instructions_per_second']:.0f}",
+                    f"{result['instructions_per_second']:.0f}",
+                    f"{ratio:.3f}",
+                    " ".join(notes),
+                ]
+            )
+
+    return rows, regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput of the simulator on the test programs."
+    )
+
+    parser.add_argument(
+        "-proc",
+        "--processor",
+        nargs="+",
+        choices=list(processors),
+        default=list(processors),
+        help="Processors to benchmark.",
+        dest="processors",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--file",
+        nargs="+",
+        default=list(tests),
+        help="Programs to run, defaults to the test suite.",
+        dest="files",
+    )
+
+    parser.add_argument(
+        "-pred",
+        "--predictor",
+        default="two_bit",
+        choices=list(registry.predictors),
+        help="Branch prediction method.",
+        dest="prediction_method",
+    )
+
+    parser.add_argument(
+        "-s",
+        type=int,
+        default=1,
+        help="Superscalar factor.",
+        dest="instructions_per_cycle",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=5,
+        help="Timed runs per program.",
+        dest="repeat",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--warmup",
+        type=int,
+        default=1,
+        help="Untimed runs per program before the timed ones.",
+        dest="warmup",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Write the results to this JSON file.",
+        dest="output",
+    )
+
+    parser.add_argument(
+        "--compare",
+        help="JSON file of an earlier run to compare against.",
+        dest="baseline",
+    )
+
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Fraction of throughput that can be lost before the comparison fails.",
+        dest="threshold",
+    )
+
+    args = parser.parse_args()
+
+    if args.repeat < 1:
+        parser.error("need at least one timed run")
+
+    results = benchmark(
+        args.processors,
+        args.files,
+        args.repeat,
+        args.warmup,
+        prediction_method=args.prediction_method,
+        instructions_per_cycle=args.instructions_per_cycle,
+    )
+
+    rows = [
+        [
+            name,
+            filename,
+            r["instructions"],
+            r["cycles"],
+            f"{r['instructions_per_second']:.0f}",
+            f"{r['instructions_per_second_iqr']:.0f}",
+            f"{r['cycles_per_second']:.0f}",
+            f"{r['cycles_per_second_iqr']:.0f}",
+        ]
+        for name, programs in results.items()
+        for filename, r in programs.items()
+    ]
+    header = [
+        "processor",
+        "filename",
+        "instructions",
+        "cycles",
+        "instr/s",
+        "IQR",
+        "cycles/s",
+        "IQR",
+    ]
+    print(columnar(rows, header, no_borders=True))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "settings": {
+                        "prediction_method": args.prediction_method,
+                        "instructions_per_cycle": args.instructions_per_cycle,
+                        "repeat": args.repeat,
+                        "warmup": args.warmup,
+                        "python": platform.python_version(),
+                        "machine": platform.machine(),
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        settings = baseline.get("settings", {})
+        if (settings.get("prediction_method"), settings.get("instructions_per_cycle")) != (
+            args.prediction_method,
+            args.instructions_per_cycle,
+        ):
+            print("warning: the baseline was measured with different settings")
+
+        rows, regressed = compare(results, baseline["results"], args.threshold)
+        print(
+            columnar(
+                rows,
+                ["processor", "filename", "baseline instr/s", "instr/s", "ratio", ""],
+                no_borders=True,
+            )
+        )
+
+        if regressed:
+            print(f"throughput dropped by more than {args.threshold:.0%}")
+            sys.exit(1)
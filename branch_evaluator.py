@@ -0,0 +1,250 @@
+import argparse
+from typing import *
+
+from commit_trace import TraceReader
+
+"""
+Replays the branch outcomes of a commit trace through models of the scheduled processor's predictors. Every
+configuration sees the stream in the same single pass, so comparing predictors and table sizes does not need
+a simulation per configuration.
+
+The models follow Predictor.check exactly: predictions only change on a miss, not_taken counts every branch
+as a miss because the processor flushes on all of them, and the tables are indexed by pc modulo their size
+(the processor uses 1024 entries indexed by pc). With a small table the branches alias, so a branch can also
+be predicted taken with someone else's target, which counts as a miss as well.
+"""
+
+methods = ["not_taken", "one_bit", "two_bit"]
+
+# on a miss, the next state of the prediction bits and whether the target buffer is updated,
+# indexed by [method][bits][taken]. Entries that can not miss are left as they are.
+MISS_NEXT = [
+    [[0, 0], [1, 1], [2, 2], [3, 3]],
+    [[1, 1], [0, 0], [2, 2], [3, 3]],
+    [[0, 1], [1, 2], [1, 3], [2, 3]],
+]
+
+MISS_BTB = [
+    [[False, False]] * 4,
+    [[True, True]] * 4,
+    [[False, False], [False, True], [True, False], [False, False]],
+]
+
+# predicted direction for [method][bits]
+PREDICT_TAKEN = [
+    [False] * 4,
+    [False, True, False, False],
+    [False, False, True, True],
+]
+
+
+class PredictorConfig(NamedTuple):
+    method: str
+    table_size: int = 1024
+
+
+class Evaluation:
+    def __init__(self, config: PredictorConfig):
+        self.config = config
+
+        self.predicted = 0
+        self.misses = 0
+
+    def prediction_accuracy(self):
+        if self.predicted == 0:
+            return 1
+        return 1 - (self.misses / self.predicted)
+
+    def __str__(self):
+        return f"{self.config.method} {self.config.table_size}: {self.prediction_accuracy()}"
+
+
+def branch_outcomes(reader: TraceReader):
+    # (pc, taken, target) of every branch and jump in the trace
+    for record in reader:
+        if record.taken is not None:
+            yield record.pc, record.taken, record.target
+
+
+def check_configs(configs):
+    for config in configs:
+        if config.method not in methods:
+            raise RuntimeError(f"Prediction method {config.method} not implemented")
+
+        if config.table_size < 1:
+            raise RuntimeError(f"Table size has to be positive, got {config.table_size}")
+
+
+"""
+One configuration at a time for every branch, no dependencies needed
+"""
+
+
+def evaluate_python(stream, configs: List[PredictorConfig]) -> List[Evaluation]:
+    check_configs(configs)
+
+    evaluations = [Evaluation(config) for config in configs]
+    models = [
+        (
+            methods.index(config.method),
+            config.table_size,
+            [0] * config.table_size,
+            [None] * config.table_size,
+            evaluation,
+        )
+        for config, evaluation in zip(configs, evaluations)
+    ]
+
+    for pc, taken, target in stream:
+        correct_pc = target if taken else pc + 1
+
+        for method, size, bits, btb, evaluation in models:
+            ix = pc % size
+            bit = bits[ix]
+
+            evaluation.predicted += 1
+
+            predict_taken = PREDICT_TAKEN[method][bit]
+
+            if method == 0 or predict_taken != taken:
+                evaluation.misses += 1
+
+                if MISS_BTB[method][bit][taken]:
+                    btb[ix] = correct_pc
+                bits[ix] = MISS_NEXT[method][bit][taken]
+
+            elif predict_taken and btb[ix] != target:
+                # right direction, wrong target from an aliased branch
+                evaluation.misses += 1
+                btb[ix] = target
+
+    return evaluations
+
+
+"""
+All configurations at once for every branch, the state of every configuration is a row of the same arrays
+"""
+
+
+def evaluate_numpy(stream, configs: List[PredictorConfig]) -> List[Evaluation]:
+    try:
+        import numpy as np
+    except ImportError:
+        raise RuntimeError("The numpy evaluator needs numpy installed")
+
+    check_configs(configs)
+
+    method = np.array([methods.index(c.method) for c in configs])
+    size = np.array([c.table_size for c in configs])
+    rows = np.arange(len(configs))
+
+    bits = np.zeros((len(configs), size.max()), dtype=np.int8)
+    btb = np.full((len(configs), size.max()), -1, dtype=np.int64)
+
+    miss_next = np.array(MISS_NEXT, dtype=np.int8)
+    miss_btb = np.array(MISS_BTB)
+    predict_taken = np.array(PREDICT_TAKEN)
+    always_miss = method == 0
+
+    predicted = 0
+    misses = np.zeros(len(configs), dtype=np.int64)
+
+    for pc, taken, target in stream:
+        taken = int(taken)
+        correct_pc = target if taken else pc + 1
+
+        ix = pc % size
+        bit = bits[rows, ix]
+        guess = predict_taken[method, bit]
+
+        direction_miss = always_miss | (guess != taken)
+        target_miss = ~direction_miss & guess & (btb[rows, ix] != target)
+
+        predicted += 1
+        misses += direction_miss | target_miss
+
+        update = direction_miss & miss_btb[method, bit, taken]
+        btb[rows[update], ix[update]] = correct_pc
+        btb[rows[target_miss], ix[target_miss]] = target
+
+        bits[rows[direction_miss], ix[direction_miss]] = miss_next[
+            method[direction_miss], bit[direction_miss], taken
+        ]
+
+    evaluations = []
+    for config, m in zip(configs, misses):
+        evaluation = Evaluation(config)
+        evaluation.predicted = predicted
+        evaluation.misses = int(m)
+        evaluations.append(evaluation)
+
+    return evaluations
+
+
+def evaluate(stream, configs: List[PredictorConfig], use_numpy=None):
+    # numpy pays off once there are enough configurations to share the per branch overhead
+    if use_numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            use_numpy = False
+        else:
+            use_numpy = len(configs) >= 16
+
+    if use_numpy:
+        return evaluate_numpy(stream, configs)
+
+    return evaluate_python(stream, configs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Accuracy of branch predictor configurations on a commit trace."
+    )
+
+    parser.add_argument("trace", help="Trace file written with main.py --trace.")
+
+    parser.add_argument(
+        "-pred",
+        "--predictor",
+        nargs="+",
+        choices=methods,
+        default=["one_bit", "two_bit"],
+        help="Prediction methods to evaluate.",
+        dest="methods",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--table-sizes",
+        nargs="+",
+        type=int,
+        default=[4, 8, 16, 32, 64, 128, 256, 512, 1024],
+        help="Prediction table sizes to evaluate.",
+        dest="table_sizes",
+    )
+
+    parser.add_argument(
+        "--numpy",
+        action="store_true",
+        default=None,
+        help="Always use the numpy evaluator.",
+        dest="use_numpy",
+    )
+
+    args = parser.parse_args()
+
+    configs = [
+        PredictorConfig(method, table_size)
+        for method in args.methods
+        for table_size in args.table_sizes
+    ]
+
+    with TraceReader(args.trace) as reader:
+        evaluations = evaluate(branch_outcomes(reader), configs, args.use_numpy)
+
+    print("method,table_size,predicted,misses,accuracy")
+    for e in evaluations:
+        print(
+            f"{e.config.method},{e.config.table_size},{e.predicted},{e.misses},{e.prediction_accuracy()}"
+        )
@@ -0,0 +1,169 @@
+import random
+from typing import *
+
+import registry
+
+
+"""
+Replacement policies. Each keeps its own state per set, touch() is called on every access to a way
+and victim() picks the way to evict from a full set.
+"""
+
+
+class LRU:
+    def __init__(self, num_sets, associativity):
+        # ways of every set from least to most recently used
+        self.order = [list(range(associativity)) for _ in range(num_sets)]
+
+    def touch(self, set_ix, way):
+        order = self.order[set_ix]
+        order.remove(way)
+        order.append(way)
+
+    def victim(self, set_ix):
+        return self.order[set_ix][0]
+
+
+class PLRU:
+    def __init__(self, num_sets, associativity):
+        if associativity & (associativity - 1):
+            raise ValueError("Tree PLRU needs a power of two associativity")
+
+        self.associativity = associativity
+        # binary tree of associativity - 1 bits per set, a bit points towards the half to evict from next
+        self.bits = [[0] * max(associativity - 1, 1) for _ in range(num_sets)]
+
+    def touch(self, set_ix, way):
+        bits = self.bits[set_ix]
+        node, lo, hi = 0, 0, self.associativity
+
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if way < mid:
+                bits[node] = 1  # point away, to the right half
+                node, hi = 2 * node + 1, mid
+            else:
+                bits[node] = 0
+                node, lo = 2 * node + 2, mid
+
+    def victim(self, set_ix):
+        bits = self.bits[set_ix]
+        node, lo, hi = 0, 0, self.associativity
+
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if bits[node] == 0:
+                node, hi = 2 * node + 1, mid
+            else:
+                node, lo = 2 * node + 2, mid
+
+        return lo
+
+
+class Random:
+    def __init__(self, num_sets, associativity, seed=0):
+        self.associativity = associativity
+        self.rng = random.Random(seed)
+
+    def touch(self, set_ix, way):
+        pass
+
+    def victim(self, set_ix):
+        return self.rng.randrange(self.associativity)
+
+
+"""
+Set associative data cache sitting between the load store queue and memory. It only models timing,
+the values always come from the processor's memory. Sizes are in words, like memory addresses.
+"""
+
+
+class Cache:
+    def __init__(
+        self,
+        size=1024,
+        associativity=2,
+        line_size=4,
+        replacement="lru",
+        hit_latency=1,
+        miss_latency=10,
+    ):
+        if size % (associativity * line_size):
+            raise ValueError(
+                "Cache size has to be a multiple of associativity * line size"
+            )
+
+        if replacement not in registry.cache_policies:
+            raise ValueError(f"Replacement policy {replacement} not implemented")
+
+        self.size = size
+        self.associativity = associativity
+        self.line_size = line_size
+        self.num_sets = size // (associativity * line_size)
+
+        self.hit_latency = hit_latency
+        self.miss_latency = miss_latency
+
+        self.replacement = replacement
+        self.policy = registry.cache_policy(replacement)(self.num_sets, associativity)
+
+        # tag held by every way of every set, None if the way is invalid
+        self.tags = [[None] * associativity for _ in range(self.num_sets)]
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.per_pc: Dict[int, List[int]] = {}  # pc -> [hits, misses]
+
+    """
+    Look the address up, fill the line on a miss and return the latency of the access
+    """
+
+    def access(self, address, pc):
+        line = address // self.line_size
+        set_ix = line % self.num_sets
+        tag = line // self.num_sets
+
+        tags = self.tags[set_ix]
+        counters = self.per_pc.setdefault(pc, [0, 0])
+
+        if tag in tags:
+            way = tags.index(tag)
+            self.policy.touch(set_ix, way)
+
+            self.hits += 1
+            counters[0] += 1
+
+            return self.hit_latency
+
+        if None in tags:
+            way = tags.index(None)
+        else:
+            way = self.policy.victim(set_ix)
+
+        tags[way] = tag
+        self.policy.touch(set_ix, way)
+
+        self.misses += 1
+        counters[1] += 1
+
+        return self.miss_latency
+
+    def hit_rate(self):
+        accesses = self.hits + self.misses
+        if accesses == 0:
+            return 1
+        return self.hits / accesses
+
+    def __str__(self):
+        lines = [
+            f"DATA CACHE {self.size} words, {self.associativity} way, {self.line_size} word lines, {self.replacement}",
+            f"hits: {self.hits}, misses: {self.misses}, hit rate: {self.hit_rate()}",
+        ]
+
+        for pc, (hits, misses) in sorted(self.per_pc.items()):
+            lines.append(f"pc {pc}: hits {hits}, misses {misses}")
+
+        return "\n".join(lines)
@@ -0,0 +1,364 @@
+import argparse
+import mmap
+import struct
+from collections import Counter
+from typing import *
+
+from assembler import OPCODES
+
+"""
+Binary trace of committed instructions.
+
+The file starts with a 16 byte header (magic, version, record size and the length of the opcode table),
+followed by the comma separated opcode table and then one fixed width record per committed instruction:
+
+    cycle     u64   cycle the instruction committed in
+    pc        i32   address of the instruction
+    target    i32   pc of the next instruction for branches and jumps, -1 otherwise
+    address   i64   memory address of loads and stores
+    result    i64   value written to the register or to memory, a double if FLOAT is set
+    opcode    u8    index into the opcode table
+    register  u8    destination register, 255 if there is none
+    flags     u8    see below
+    padding   1 byte
+
+Records are little endian and not aligned, so a trace can be written and read on any machine. They are in commit
+order, except for the pipelined processor which finishes branches in decode ahead of older instructions.
+
+Integers in this ISA have no width, a result or address outside the i64 range is clamped to it and the record
+gets the WIDE flag, the trace then only tells which side of the range the value was on.
+"""
+
+MAGIC = b"ACATRACE"
+VERSION = 1
+
+HEADER = struct.Struct("<8sHHH2x")
+RECORD = struct.Struct("<QiiqqBBBx")
+FLOAT_RECORD = struct.Struct("<QiiqdBBBx")  # same layout with a double result
+
+# flags
+BRANCH = 1
+TAKEN = 2
+MISPREDICTED = 4
+HAS_RESULT = 8
+HAS_ADDRESS = 16
+FLOAT = 32
+WIDE = 64
+
+NO_REGISTER = 255
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+
+class TraceRecord(NamedTuple):
+    cycle: int
+    pc: int
+    opcode: str
+    register: Optional[int]
+    result: Optional[Union[int, float]]
+    address: Optional[int]
+    target: Optional[int]
+    taken: Optional[bool]
+    mispredicted: bool
+    wide: bool = False  # result or address clamped to 64 bits
+
+
+"""
+Writes the trace as instructions commit. Records are packed into a preallocated buffer that is flushed
+to the file whenever it fills up, so memory use does not grow with the length of the run.
+"""
+
+
+class TraceWriter:
+    def __init__(self, file, buffer_records=4096):
+        # a path or a file opened in binary mode
+        self.owns_file = isinstance(file, str)
+        self.file = open(file, "wb") if self.owns_file else file
+
+        self.opcodes = {opcode: ix for ix, opcode in enumerate(OPCODES)}
+
+        table = ",".join(OPCODES).encode()
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(table)))
+        self.file.write(table)
+
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.buffered = 0
+        self.written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.written + self.buffered
+
+    def commit(
+        self,
+        cycle,
+        pc,
+        opcode,
+        register=None,
+        result=None,
+        address=None,
+        target=None,
+        taken=None,
+        mispredicted=False,
+    ):
+        flags = 0
+        record = RECORD
+
+        if taken is not None:
+            flags |= BRANCH
+            if taken:
+                flags |= TAKEN
+
+        if mispredicted:
+            flags |= MISPREDICTED
+
+        if result is not None:
+            flags |= HAS_RESULT
+            if isinstance(result, float):
+                flags |= FLOAT
+                record = FLOAT_RECORD
+            elif not INT64_MIN <= result <= INT64_MAX:
+                flags |= WIDE
+                result = min(max(result, INT64_MIN), INT64_MAX)
+        else:
+            result = 0
+
+        if address is not None:
+            flags |= HAS_ADDRESS
+            if not INT64_MIN <= address <= INT64_MAX:
+                flags |= WIDE
+                address = min(max(address, INT64_MIN), INT64_MAX)
+        else:
+            address = 0
+
+        record.pack_into(
+            self.buffer,
+            self.buffered * RECORD.size,
+            cycle,
+            pc,
+            -1 if target is None else target,
+            address,
+            result,
+            self.opcodes[opcode],
+            NO_REGISTER if register is None else register,
+            flags,
+        )
+
+        self.buffered += 1
+        if self.buffered * RECORD.size == len(self.buffer):
+            self.flush()
+
+    """
+    Record an instruction object of the simple or pipelined processor, stores record the value they wrote
+    """
+
+    def commit_instruction(self, cycle, instruction, MEM):
+        opcode = instruction.opcode
+
+        if instruction.branch_target is not None:
+            taken = instruction.branch_target != -1
+            self.commit(
+                cycle,
+                instruction.pc,
+                opcode,
+                target=instruction.branch_target if taken else instruction.pc + 1,
+                taken=taken,
+            )
+
+        elif opcode == "sw":
+            self.commit(
+                cycle,
+                instruction.pc,
+                opcode,
+                result=MEM[instruction.target_address],
+                address=instruction.target_address,
+            )
+
+        else:
+            self.commit(
+                cycle,
+                instruction.pc,
+                opcode,
+                register=instruction.target_register,
+                result=instruction.result,
+                address=instruction.target_address,
+            )
+
+    def flush(self):
+        if self.buffered:
+            self.file.write(memoryview(self.buffer)[: self.buffered * RECORD.size])
+            self.written += self.buffered
+            self.buffered = 0
+
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+
+        if self.owns_file:
+            self.file.close()
+
+
+"""
+Reads a trace without loading it, the file is memory mapped and records are unpacked as they are visited
+"""
+
+
+class TraceReader:
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, record_size, table_length = HEADER.unpack_from(self.map)
+
+        if magic != MAGIC:
+            raise RuntimeError(f"{path} is not a commit trace")
+
+        if version != VERSION or record_size != RECORD.size:
+            raise RuntimeError(
+                f"{path} has trace version {version} with {record_size} byte records, expected version {VERSION}"
+            )
+
+        table = self.map[HEADER.size : HEADER.size + table_length]
+        self.opcodes = table.decode().split(",")
+
+        self.offset = HEADER.size + table_length
+        self.length = (len(self.map) - self.offset) // RECORD.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, ix):
+        if ix < 0:
+            ix += self.length
+
+        if not 0 <= ix < self.length:
+            raise IndexError("trace record out of range")
+
+        return self.decode(RECORD.unpack_from(self.map, self.offset + ix * RECORD.size))
+
+    def __iter__(self, chunk_records=4096):
+        # copy a chunk at a time out of the map, a view into it would keep the map from closing
+        end = self.offset + self.length * RECORD.size
+        step = chunk_records * RECORD.size
+
+        for start in range(self.offset, end, step):
+            for fields in RECORD.iter_unpack(self.map[start : min(start + step, end)]):
+                yield self.decode(fields)
+
+    def decode(self, fields):
+        cycle, pc, target, address, result, opcode, register, flags = fields
+
+        if flags & FLOAT:
+            # the slot holds the bits of a double
+            result = FLOAT_RECORD.unpack(RECORD.pack(*fields))[4]
+
+        return TraceRecord(
+            cycle=cycle,
+            pc=pc,
+            opcode=self.opcodes[opcode],
+            register=None if register == NO_REGISTER else register,
+            result=result if flags & HAS_RESULT else None,
+            address=address if flags & HAS_ADDRESS else None,
+            target=None if target == -1 else target,
+            taken=bool(flags & TAKEN) if flags & BRANCH else None,
+            mispredicted=bool(flags & MISPREDICTED),
+            wide=bool(flags & WIDE),
+        )
+
+    """
+    The whole trace as a NumPy structured array backed by the file, nothing is read until it is used.
+    Results with the FLOAT flag hold the bits of a double, view them as float64.
+    """
+
+    def arrays(self):
+        try:
+            import numpy as np
+        except ImportError:
+            raise RuntimeError("Reading a trace as arrays needs numpy installed")
+
+        dtype = np.dtype(
+            [
+                ("cycle", "<u8"),
+                ("pc", "<i4"),
+                ("target", "<i4"),
+                ("address", "<i8"),
+                ("result", "<i8"),
+                ("opcode", "u1"),
+                ("register", "u1"),
+                ("flags", "u1"),
+                ("padding", "u1"),
+            ]
+        )
+
+        return np.memmap(
+            self.path, dtype=dtype, mode="r", offset=self.offset, shape=(self.length,)
+        )
+
+    def close(self):
+        self.map.close()
+
+
+def summary(reader: TraceReader):
+    opcodes = Counter()
+    branches = taken = mispredicted = 0
+    last_cycle = 0
+
+    for record in reader:
+        opcodes[record.opcode] += 1
+        last_cycle = record.cycle
+
+        if record.taken is not None:
+            branches += 1
+            taken += record.taken
+            mispredicted += record.mispredicted
+
+    return {
+        "instructions": len(reader),
+        "last commit cycle": last_cycle,
+        "branches": branches,
+        "taken": taken,
+        "mispredicted": mispredicted,
+        **{opcode: opcodes[opcode] for opcode in reader.opcodes if opcodes[opcode]},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise or dump a commit trace.")
+
+    parser.add_argument("trace", help="Trace file written with main.py --trace.")
+
+    parser.add_argument(
+        "-n",
+        "--dump",
+        type=int,
+        default=0,
+        help="Print the first N records as well.",
+        dest="dump",
+    )
+
+    args = parser.parse_args()
+
+    with TraceReader(args.trace) as reader:
+        for record in reader:
+            if args.dump <= 0:
+                break
+            print(record)
+            args.dump -= 1
+
+        for k, v in summary(reader).items():
+            print(f"{k}: {v}")
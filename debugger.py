@@ -0,0 +1,270 @@
+from collections import deque
+from typing import *
+
+from observers import Observer
+
+"""
+A debugger that runs the processor at full speed until a breakpoint hits, instead of stopping on every
+cycle like the debug flag does. It watches the run through the observer hooks, so it works for every
+processor with a cycle method, and only listens to the events its breakpoints need. The last few cycles are
+kept in a ring buffer of snapshots, the pc, the registers and the buffers of the processor as plain values,
+so any of them can be shown later. Nothing is formatted until a snapshot is shown, and --history bounds
+what is kept, 0 keeps nothing and runs at full speed.
+
+Breakpoints are given as specs:
+
+    pc=12          the instruction at this pc commits
+    label=loop     the instruction at this label commits
+    cycle=10000    the run reaches this cycle, or jumps past it while skipping idle cycles
+    reg=5          a committed instruction writes this register, $5 works too
+    mem=A          a committed store writes this address, or the first word of a data label
+    mispredict     the pipeline is flushed, a misprediction or a taken branch in decode for the pipelined one
+"""
+
+
+class Breakpoint(NamedTuple):
+    kind: str
+    value: Optional[int]
+    spec: str  # as given, to show when it hits
+
+
+class Snapshot(NamedTuple):
+    cycle: int
+    PC: int
+    RF: Tuple[int, ...]
+    tables: Dict[str, Tuple[List[str], List[list]]]  # see Processor.tables
+    events: List[tuple]  # the events that hit a breakpoint during the cycle
+
+
+kinds = ["pc", "label", "cycle", "reg", "mem", "mispredict"]
+
+
+def parse_breakpoint(spec, symbols):
+    kind, _, value = spec.partition("=")
+
+    if kind not in kinds or (kind == "mispredict") != (value == ""):
+        raise ValueError(f"Bad breakpoint {spec}")
+
+    if kind == "mispredict":
+        return Breakpoint(kind, None, spec)
+
+    if kind == "label" or (kind == "mem" and not value.isdigit()):
+        if value not in symbols:
+            raise ValueError(f"Label {value} not found in the program")
+        return Breakpoint("pc" if kind == "label" else kind, symbols[value], spec)
+
+    if kind == "reg":
+        value = value.lstrip("$")
+
+    if not value.isdigit():
+        raise ValueError(f"Bad breakpoint {spec}")
+
+    return Breakpoint(kind, int(value), spec)
+
+
+class Debugger(Observer):
+    def __init__(self, cpu, breakpoints=(), history=32):
+        self.cpu = cpu
+
+        # the last cycles, oldest first
+        self.snapshots: Deque[Snapshot] = deque(maxlen=history)
+
+        # breakpoints by what they watch, so a commit only costs a few lookups
+        self.at_pc: Dict[int, Breakpoint] = {}
+        self.registers: Dict[int, Breakpoint] = {}
+        self.addresses: Dict[int, Breakpoint] = {}
+        self.at_cycles: List[Breakpoint] = []  # sorted, each one hits once
+        self.mispredict: Optional[Breakpoint] = None
+
+        for breakpoint in breakpoints:
+            self.add(breakpoint)
+
+        self.hits: List[Tuple[Breakpoint, Optional[tuple]]] = []
+
+        self.subscribe()
+        cpu.attach(self)
+
+    def subscribe(self):
+        # only the hooks a breakpoint needs are bound, the others cost the processor nothing
+        watching = self.at_pc or self.registers or self.addresses
+        self.on_commit = self.commit if watching else None
+        self.on_flush = self.flush if self.mispredict is not None else None
+
+        if self in self.cpu.observers:
+            self.cpu.bind_observers()
+
+    def add(self, breakpoint: Breakpoint):
+        if breakpoint.kind == "pc":
+            self.at_pc[breakpoint.value] = breakpoint
+        elif breakpoint.kind == "reg":
+            self.registers[breakpoint.value] = breakpoint
+        elif breakpoint.kind == "mem":
+            self.addresses[breakpoint.value] = breakpoint
+        elif breakpoint.kind == "cycle":
+            self.at_cycles.append(breakpoint)
+            self.at_cycles.sort(key=lambda b: b.value)
+        elif breakpoint.kind == "mispredict":
+            self.mispredict = breakpoint
+        else:
+            raise RuntimeError(f"Breakpoint kind {breakpoint.kind} not implemented")
+
+        self.subscribe()
+
+    def remove(self, breakpoint: Breakpoint):
+        for watched in [self.at_pc, self.registers, self.addresses]:
+            if watched.get(breakpoint.value) == breakpoint:
+                del watched[breakpoint.value]
+
+        if breakpoint in self.at_cycles:
+            self.at_cycles.remove(breakpoint)
+
+        if self.mispredict == breakpoint:
+            self.mispredict = None
+
+        self.subscribe()
+
+    def breakpoints(self):
+        return [
+            *self.at_pc.values(),
+            *self.registers.values(),
+            *self.addresses.values(),
+            *self.at_cycles,
+            *([self.mispredict] if self.mispredict is not None else []),
+        ]
+
+    def clear(self):
+        for breakpoint in self.breakpoints():
+            self.remove(breakpoint)
+
+    def commit(self, event):
+        if event.pc in self.at_pc:
+            self.hits.append((self.at_pc[event.pc], event))
+
+        if event.register in self.registers:
+            self.hits.append((self.registers[event.register], event))
+
+        if event.opcode == "sw" and event.address in self.addresses:
+            self.hits.append((self.addresses[event.address], event))
+
+    def flush(self, event):
+        self.hits.append((self.mispredict, event))
+
+    """
+    Run until a breakpoint hits, the program halts or the given number of cycles has gone by. Returns the
+    breakpoints that hit in the last cycle with the event that hit them, empty if none did.
+    """
+
+    def run(self, cycles=None):
+        cpu = self.cpu
+        end = None if cycles is None else cpu.cycles + cycles
+        self.hits = hits = []
+
+        # checked once a cycle, kept in locals
+        keep = self.snapshots.append if self.snapshots.maxlen else None
+        at_cycles = self.at_cycles
+        watch = at_cycles[0].value if at_cycles else None
+
+        while cpu.running():
+            cpu.cycle()
+
+            if watch is not None and cpu.cycles >= watch:
+                while at_cycles and cpu.cycles >= at_cycles[0].value:
+                    hits.append((at_cycles.pop(0), None))
+                watch = at_cycles[0].value if at_cycles else None
+
+            if keep is not None:
+                keep(
+                    Snapshot(
+                        cpu.cycles,
+                        cpu.PC,
+                        tuple(cpu.RF),
+                        cpu.tables(),
+                        [event for _, event in hits if event is not None],
+                    )
+                )
+
+            if hits or (end is not None and cpu.cycles >= end):
+                break
+
+        return hits
+
+    def step(self, cycles=1):
+        return self.run(cycles)
+
+    def show(self, back=0):
+        # the snapshot this many cycles before the last one
+        if back >= len(self.snapshots):
+            return f"only {len(self.snapshots)} cycles are kept"
+
+        return render(self.snapshots[-1 - back])
+
+
+def render(snapshot: Snapshot):
+    from columnar import columnar
+
+    lines = [f"CYCLE {snapshot.cycle}, PC {snapshot.PC}", f"RF {list(snapshot.RF)}"]
+
+    for name, (header, rows) in snapshot.tables.items():
+        lines.append(name)
+        lines.append(columnar(rows, header, no_borders=True) if rows else "empty")
+
+    lines.append("EVENTS")
+    lines.extend(str(event) for event in snapshot.events)
+
+    return "\n".join(lines)
+
+
+commands = """c                continue until a breakpoint hits
+s [n]            step n cycles, 1 by default
+p [n]            show the snapshot n cycles back, the last one by default
+h                list the cycles kept
+b [spec]         add a breakpoint, or list them
+d spec           delete a breakpoint
+stats            print the stats of the processor as it is now
+q                drop the breakpoints and run to the end"""
+
+
+"""
+Drive the debugger from the terminal until the program halts, only stopping where a breakpoint hits
+"""
+
+
+def interact(debugger: Debugger):
+    cpu = debugger.cpu
+    hits = debugger.run()
+
+    while cpu.running():
+        for breakpoint, event in hits:
+            print(f"{breakpoint.spec} hit in cycle {cpu.cycles}" + ("" if event is None else f": {event}"))
+
+        try:
+            command, _, arg = input("(debug) ").strip().partition(" ")
+        except EOFError:
+            command, arg = "q", ""
+        hits = []
+
+        try:
+            if command == "c":
+                hits = debugger.run()
+            elif command == "s":
+                hits = debugger.step(int(arg) if arg else 1)
+                print(debugger.show())
+            elif command == "p":
+                print(debugger.show(int(arg) if arg else 0))
+            elif command == "h":
+                print([snapshot.cycle for snapshot in debugger.snapshots])
+            elif command == "b" and arg:
+                debugger.add(parse_breakpoint(arg, cpu.symbols))
+            elif command == "b":
+                print([breakpoint.spec for breakpoint in debugger.breakpoints()])
+            elif command == "d":
+                debugger.remove(parse_breakpoint(arg, cpu.symbols))
+            elif command == "stats":
+                cpu.print_stats()
+            elif command == "q":
+                debugger.clear()
+                debugger.run()
+            else:
+                print(commands)
+        except ValueError as e:
+            print(e)
@@ -0,0 +1,552 @@
+from typing import *
+from processor import Processor
+from assembler import OPCODES
+from instruction import arithmetic
+
+
+"""
+Instruction semantics. Every opcode has a factory that takes the register file, the memory, a predecoded
+instruction and its pc, and returns a closure with the operands bound in. Calling the closure performs the
+architectural update and returns the pc of the next instruction, so the run loop is one call per instruction
+with no decoding left in it. The int() conversions of imul, mod and idiv only matter for the floats div
+leaves behind, plain ints skip them.
+"""
+
+
+def add(RF, MEM, i, pc):
+    rd, rs, rt, next_pc = i.rd, i.rs, i.rt, pc + 1
+
+    def op():
+        RF[rd] = RF[rs] + RF[rt]
+        return next_pc
+
+    return op
+
+
+def sub(RF, MEM, i, pc):
+    rd, rs, rt, next_pc = i.rd, i.rs, i.rt, pc + 1
+
+    def op():
+        RF[rd] = RF[rs] - RF[rt]
+        return next_pc
+
+    return op
+
+
+def mul(RF, MEM, i, pc):
+    rd, rs, rt, next_pc = i.rd, i.rs, i.rt, pc + 1
+
+    def op():
+        RF[rd] = RF[rs] * RF[rt]
+        return next_pc
+
+    return op
+
+
+def imul(RF, MEM, i, pc):
+    rd, rs, rt, next_pc = i.rd, i.rs, i.rt, pc + 1
+
+    def op():
+        a, b = RF[rs], RF[rt]
+        RF[rd] = a * b if type(a) is int and type(b) is int else int(int(a) * int(b))
+        return next_pc
+
+    return op
+
+
+def mod(RF, MEM, i, pc):
+    rd, rs, rt, next_pc = i.rd, i.rs, i.rt, pc + 1
+
+    def op():
+        a, b = RF[rs], RF[rt]
+        RF[rd] = a % b if type(a) is int and type(b) is int else int(int(a) % int(b))
+        return next_pc
+
+    return op
+
+
+def div(RF, MEM, i, pc):
+    rd, rs, rt, next_pc = i.rd, i.rs, i.rt, pc + 1
+
+    def op():
+        RF[rd] = RF[rs] / RF[rt]
+        return next_pc
+
+    return op
+
+
+def idiv(RF, MEM, i, pc):
+    rd, rs, rt, next_pc = i.rd, i.rs, i.rt, pc + 1
+
+    def op():
+        a, b = RF[rs], RF[rt]
+        RF[rd] = int(a / b) if type(a) is int and type(b) is int else int(int(a) / int(b))
+        return next_pc
+
+    return op
+
+
+def addi(RF, MEM, i, pc):
+    rt, rs, imm, next_pc = i.rt, i.rs, i.imm, pc + 1
+
+    def op():
+        RF[rt] = RF[rs] + imm
+        return next_pc
+
+    return op
+
+
+def lw(RF, MEM, i, pc):
+    rt, rs, imm, next_pc, load = i.rt, i.rs, i.imm, pc + 1, MEM.load
+
+    if MEM.count:
+
+        def op():
+            RF[rt] = load(RF[rs] + imm)
+            return next_pc
+
+        return op
+
+    # reads of written pages are done in place, anything else goes through MEM.load
+    pages, bits, mask = MEM.pages, MEM.page_bits, MEM.mask
+
+    def op():
+        a = RF[rs] + imm
+        p = pages.get(a >> bits)
+        RF[rt] = p.data[a & mask] if p is not None and p.data is not None else load(a)
+        return next_pc
+
+    return op
+
+
+def sw(RF, MEM, i, pc):
+    rt, rs, imm, next_pc, store = i.rt, i.rs, i.imm, pc + 1, MEM.store
+
+    def op():
+        store(RF[rs] + imm, RF[rt])
+        return next_pc
+
+    return op
+
+
+def beq(RF, MEM, i, pc):
+    rs, rt, target, next_pc = i.rs, i.rt, i.imm, pc + 1
+
+    def op():
+        return target if RF[rs] == RF[rt] else next_pc
+
+    return op
+
+
+def bne(RF, MEM, i, pc):
+    rs, rt, target, next_pc = i.rs, i.rt, i.imm, pc + 1
+
+    def op():
+        return target if RF[rs] != RF[rt] else next_pc
+
+    return op
+
+
+def blt(RF, MEM, i, pc):
+    rs, rt, target, next_pc = i.rs, i.rt, i.imm, pc + 1
+
+    def op():
+        return target if RF[rs] < RF[rt] else next_pc
+
+    return op
+
+
+def ble(RF, MEM, i, pc):
+    rs, rt, target, next_pc = i.rs, i.rt, i.imm, pc + 1
+
+    def op():
+        return target if RF[rs] <= RF[rt] else next_pc
+
+    return op
+
+
+def j(RF, MEM, i, pc):
+    target = i.imm
+
+    def op():
+        return target
+
+    return op
+
+
+# dispatch table indexed by the opcode id of the predecoded image
+SEMANTICS = [globals()[opcode] for opcode in OPCODES]
+
+
+"""
+The same semantics as source, used to translate basic blocks. Register operands are filled in with the
+locals holding them, immediates as constants.
+"""
+
+EXPRESSIONS = {
+    "add": "{rs} + {rt}",
+    "sub": "{rs} - {rt}",
+    "mul": "{rs} * {rt}",
+    "imul": "{rs} * {rt} if type({rs}) is int and type({rt}) is int else int(int({rs}) * int({rt}))",
+    "mod": "{rs} % {rt} if type({rs}) is int and type({rt}) is int else int(int({rs}) % int({rt}))",
+    "div": "{rs} / {rt}",
+    "idiv": "int({rs} / {rt}) if type({rs}) is int and type({rt}) is int else int(int({rs}) / int({rt}))",
+    "addi": "{rs} + {imm}",
+}
+
+CONDITIONS = {
+    "beq": "{rs} == {rt}",
+    "bne": "{rs} != {rt}",
+    "blt": "{rs} < {rt}",
+    "ble": "{rs} <= {rt}",
+    "j": "True",
+}
+
+
+"""
+Translates straight line runs of the image into Python functions taking the register file and the memory
+and returning the next pc. Registers live in locals inside a block and are written back when it exits.
+
+A block ends at a branch or jump, before the target of any branch and after a write to register 31, so the
+halt check between blocks sees the same state as between instructions. Blocks start at the first
+instruction or a branch target or fall through. Compiling a block costs as much as interpreting a few
+thousand instructions, so a block is interpreted until its start has been reached HOT_BLOCK times and only
+compiled then, short runs never pay for it. If an instruction faults, the registers written earlier in its
+block are lost. The page counters are only updated inline when the memory counts, see memory.py.
+"""
+
+
+HOT_BLOCK = 2048
+
+
+class TranslationCache:
+    def __init__(self, image, count=False, threshold=HOT_BLOCK):
+        self.image = image
+        self.count = count
+        self.blocks: Dict[int, Tuple[Callable, int]] = {}  # start pc -> (function, instructions)
+
+        # every branch target and fall through starts a block
+        self.leaders = {0}
+        for pc, i in enumerate(image):
+            if i.opcode in CONDITIONS:
+                self.leaders.update([i.imm, pc + 1])
+        self.leaders = {pc for pc in self.leaders if pc < len(image)}
+
+        # start pc -> times it can still be reached before its block is compiled, the run loop counts down
+        self.cold: Dict[int, int] = {pc: threshold for pc in self.leaders}
+
+    def lookup(self, pc):
+        # the block starting at pc, compiled once its count ran out, None while it is still cold
+        block = self.blocks.get(pc)
+
+        if block is None and pc in self.leaders and self.cold[pc] <= 0:
+            block = self.blocks[pc] = self.translate(pc)
+
+        return block
+
+    """
+    The closures of the image with the start of every block counting down instead. Once a start is hot its
+    closure is replaced by one that runs the compiled block, so a run loop calling these needs no check of
+    its own. A block runs all its instructions in one call, the ones past the first are added up in skipped.
+    """
+
+    def entries(self, ops, RF, MEM):
+        entry_ops = list(ops)
+        skipped = [0]
+        cold = self.cold
+        lookup = self.lookup
+
+        def counting(pc, op):
+            left = cold[pc]
+
+            def enter():
+                nonlocal left
+                left -= 1
+                if left <= 0:
+                    cold[pc] = 0
+                    entry_ops[pc] = compiled(pc)
+                return op()
+
+            return enter
+
+        def compiled(pc):
+            block, length = lookup(pc)
+            extra = length - 1
+
+            def enter():
+                next_pc = block(RF, MEM)
+                skipped[0] += extra
+                return next_pc
+
+            return enter
+
+        for pc in self.leaders:
+            entry_ops[pc] = compiled(pc) if pc in self.blocks else counting(pc, ops[pc])
+
+        return entry_ops, skipped
+
+    def translate(self, start):
+        lines = []
+        loaded = set()
+        written = set()
+
+        def read(register):
+            if register not in loaded:
+                lines.append(f"    r{register} = RF[{register}]")
+                loaded.add(register)
+            return f"r{register}"
+
+        pc = start
+        exit = None
+
+        while exit is None:
+            i = self.image[pc]
+            lines.append(f"    # {pc}: {i.text.strip()}")
+            pc += 1
+
+            if i.opcode in CONDITIONS:
+                condition = CONDITIONS[i.opcode].format(
+                    rs=read(i.rs) if i.rs is not None else None,
+                    rt=read(i.rt) if i.rt is not None else None,
+                )
+                exit = f"return {i.imm} if {condition} else {pc}"
+
+            elif i.opcode == "sw":
+                # ints stored below the highest address written so far go straight into their page,
+                # anything else goes through MEM.store, which also moves the size up
+                lines += [
+                    f"    a = {read(i.rs)} + {i.imm}",
+                    "    p = pages.get(a >> bits)",
+                    f"    if a < size and p is not None and p.data is not None and type({read(i.rt)}) is int:",
+                    "        try:",
+                    f"            p.data[a & mask] = r{i.rt}",
+                    *(["            p.stores += 1"] if self.count else []),
+                    "        except OverflowError:",
+                    f"            MEM.store(a, r{i.rt})",
+                    "    else:",
+                    f"        MEM.store(a, r{i.rt})",
+                    "        size = MEM.size",
+                ]
+
+            elif i.opcode == "lw":
+                # reads of written pages are done in place, anything else goes through MEM.load
+                lines += [
+                    f"    a = {read(i.rs)} + {i.imm}",
+                    "    p = pages.get(a >> bits)",
+                    "    if p is not None and p.data is not None:",
+                    *(["        p.loads += 1"] if self.count else []),
+                    f"        r{i.rt} = p.data[a & mask]",
+                    "    else:",
+                    f"        r{i.rt} = MEM.load(a)",
+                ]
+                loaded.add(i.rt)
+                written.add(i.rt)
+
+                if i.rt == 31:
+                    exit = f"return {pc}"
+
+            else:
+                expression = EXPRESSIONS[i.opcode].format(
+                    rs=read(i.rs),
+                    rt=read(i.rt) if i.opcode in arithmetic else None,
+                    imm=i.imm,
+                )
+                target = i.rd if i.opcode in arithmetic else i.rt
+
+                lines.append(f"    r{target} = {expression}")
+                loaded.add(target)
+                written.add(target)
+
+                if target == 31:
+                    exit = f"return {pc}"
+
+            if exit is None and (pc in self.leaders or pc == len(self.image)):
+                exit = f"return {pc}"
+
+        lines += [f"    RF[{r}] = r{r}" for r in sorted(written)]
+        lines.append(f"    {exit}")
+
+        preamble = [
+            "def block(RF, MEM):",
+            "    pages, bits, mask, size = MEM.pages, MEM.page_bits, MEM.mask, MEM.size",
+        ]
+        source = "\n".join(preamble + lines) + "\n"
+        namespace = {}
+        exec(compile(source, f"<block {start}>", "exec"), namespace)
+
+        return namespace["block"], pc - start
+
+
+"""
+Executes the ISA without any pipeline timing, one instruction per cycle. Used as the golden reference
+for the other processors and to fast forward through long programs.
+"""
+
+
+class FunctionalProcessor(Processor):
+    cycle_accurate = False
+
+    def __init__(
+        self,
+        program,
+        symbols,
+        prediction_method=None,
+        instructions_per_cycle=1,
+        debug=False,
+        translate=True,
+    ):
+        super().__init__(program, symbols, debug)
+
+        self.RF = [0] * 32
+
+        # one closure per entry of the image, see SEMANTICS, and what they were bound to
+        self.ops = None
+        self.bound_to = (None, None, None)
+
+        # run whole basic blocks at a time where possible
+        self.translate = translate
+        self.translations = None
+        self.entry_ops = None  # see TranslationCache.entries
+
+    def invalidate(self):
+        # drop the closures and the translated blocks, needed if the image was changed in place
+        self.translations = None
+        self.ops = None
+        self.entry_ops = None
+
+    def bind(self):
+        # the closures hold on to the register file and the memory, so they are rebuilt when either is replaced
+        image, RF, MEM = self.bound_to
+        if self.ops is None or image is not self.image or RF is not self.RF or MEM is not self.MEM:
+            self.ops = [
+                SEMANTICS[i.op](self.RF, self.MEM, i, pc) for pc, i in enumerate(self.image)
+            ]
+            self.bound_to = (self.image, self.RF, self.MEM)
+            self.entry_ops = None
+
+        return self.ops
+
+    def cycle(self):
+        self.run(max_instructions=1)
+
+    """
+    Execute until the program halts, max_instructions have been executed or the pc reaches until_pc,
+    returns the number executed
+    """
+
+    def run(self, max_instructions=None, until_pc=None):
+        RF = self.RF
+        MEM = self.MEM
+        ops = self.bind()
+
+        pc = self.PC
+        budget = -1 if max_instructions is None else max_instructions
+        stop_pc = -1 if until_pc is None else until_pc
+        executed = 0
+
+        if self.translate:
+            translations = self.translations
+            if (
+                translations is None
+                or translations.image is not self.image
+                or translations.count != MEM.count
+            ):
+                self.translations = TranslationCache(self.image, MEM.count)
+                self.entry_ops = None
+
+            lookup = self.translations.lookup
+            leaders = self.translations.leaders
+            blocks = self.translations.blocks
+            cold = self.translations.cold
+        else:
+            lookup = None
+
+        skipped = None
+
+        try:
+            # nothing to check but the halt register, the starts of blocks count down by themselves
+            if lookup is None and budget == -1 and stop_pc == -1:
+                while RF[31] != 1:
+                    pc = ops[pc]()
+                    executed += 1
+
+            elif budget == -1 and stop_pc == -1:
+                if self.entry_ops is None:
+                    self.entry_ops = self.translations.entries(ops, RF, MEM)
+                entry_ops, skipped = self.entry_ops
+                skipped_before = skipped[0]
+
+                while RF[31] != 1:
+                    pc = entry_ops[pc]()
+                    executed += 1
+
+            while RF[31] != 1 and executed != budget and pc != stop_pc:
+                if lookup is not None and pc in leaders:
+                    translated = blocks.get(pc)
+                    if translated is None:
+                        cold[pc] -= 1
+                        if cold[pc] <= 0:
+                            translated = lookup(pc)
+
+                    # a block runs to its end, step through it if it would overshoot the budget or stop pc,
+                    # or if the pc is in the middle of one
+                    if translated is not None:
+                        block, length = translated
+                        if (budget == -1 or budget - executed >= length) and not (
+                            pc < stop_pc < pc + length
+                        ):
+                            pc = block(RF, MEM)
+                            executed += length
+                            continue
+
+                pc = ops[pc]()
+                executed += 1
+        except IndexError:
+            if not 0 <= pc < len(ops):
+                raise RuntimeError(
+                    f"PC out of bounds. PC={pc} for program of length {len(ops)}"
+                )
+            raise
+        finally:
+            if skipped is not None:
+                executed += skipped[0] - skipped_before
+
+            self.PC = pc
+            self.executed += executed
+            self.cycles += executed
+
+        return executed
+
+    def print_stats(self):
+        print(self.cycles)
+        print(self.RF)
+        print(self.MEM)
+
+
+"""
+Execute functionally up to start, either a label or a number of instructions, then hand the architectural
+state over to a detailed processor. The detailed processor runs warmup instructions to train its predictor
+before its stats are reset, so cycles and CPI only cover the region of interest.
+"""
+
+
+def fast_forward(program, symbols, processor, start, warmup=0, **kwargs):
+    if isinstance(start, str):
+        if start not in symbols:
+            raise RuntimeError(f"Label {start} not found in the program")
+        until_pc, max_instructions = symbols[start], None
+    else:
+        until_pc, max_instructions = None, start
+
+    functional = FunctionalProcessor(program, symbols)
+    functional.run(max_instructions=max_instructions, until_pc=until_pc)
+
+    cpu = processor(program, symbols, **kwargs)
+    cpu.restore(functional.RF, functional.MEM, functional.PC)
+
+    while cpu.running() and cpu.executed < warmup:
+        cpu.cycle()
+
+    cpu.reset_stats()
+
+    return cpu
@@ -0,0 +1,97 @@
+from typing import *
+
+
+# which kind of unit executes each opcode
+unit_kinds = {
+    **{opcode: "alu" for opcode in ["add", "sub", "addi"]},
+    **{opcode: "alu" for opcode in ["beq", "bne", "blt", "ble", "j"]},
+    **{opcode: "mul" for opcode in ["mul", "imul"]},
+    **{opcode: "div" for opcode in ["div", "idiv", "mod"]},
+}
+
+
+class FunctionalUnit:
+    def __init__(self, kind, latency, pipelined):
+        self.kind = kind
+        self.latency = latency
+        self.pipelined = pipelined
+
+        self.free_at = 0  # first cycle a new operation can start
+        self.busy_cycles = 0
+
+    def start(self, cycle):
+        # a pipelined unit takes a new operation every cycle, otherwise it is blocked until the result is out
+        self.free_at = cycle + (1 if self.pipelined else self.latency)
+        self.busy_cycles += self.latency
+
+
+"""
+Pool of functional units used by the scheduled processor. An operation can only be dispatched from the
+reservation station in a cycle where a unit of its kind is free, so the number of units acts as the number
+of dispatch ports.
+"""
+
+
+class FunctionalUnitPool:
+    def __init__(self, config=None):
+        # kind -> (count, latency, pipelined)
+        config = {"alu": (1, 1, True), "mul": (1, 1, True), "div": (1, 1, True), **(config or {})}
+
+        self.units: Dict[str, List[FunctionalUnit]] = {
+            kind: [FunctionalUnit(kind, latency, pipelined) for _ in range(count)]
+            for kind, (count, latency, pipelined) in config.items()
+        }
+
+        for kind, units in self.units.items():
+            if not units:
+                raise ValueError(f"Need at least one {kind} unit")
+
+    """
+    Parse a spec like "alu=2:1,mul=1:3,div=1:12:blocking", every kind is count:latency with an optional
+    blocking flag for units that are not pipelined
+    """
+
+    @staticmethod
+    def from_spec(spec):
+        config = {}
+
+        for field in spec.split(","):
+            kind, _, values = field.partition("=")
+            values = values.split(":")
+
+            if kind not in ["alu", "mul", "div"] or len(values) not in [2, 3]:
+                raise ValueError(f"Bad functional unit spec {field}")
+
+            if len(values) == 3 and values[2] != "blocking":
+                raise ValueError(f"Bad functional unit spec {field}")
+
+            config[kind] = (int(values[0]), int(values[1]), len(values) == 2)
+
+        return FunctionalUnitPool(config)
+
+    def latency(self, opcode):
+        return self.units[unit_kinds[opcode]][0].latency
+
+    def available(self, opcode, cycle):
+        return any(unit.free_at <= cycle for unit in self.units[unit_kinds[opcode]])
+
+    def start(self, opcode, cycle):
+        for unit in self.units[unit_kinds[opcode]]:
+            if unit.free_at <= cycle:
+                unit.start(cycle)
+                return unit.latency
+
+        raise RuntimeError(f"No free unit for {opcode} in cycle {cycle}")
+
+    def utilisation(self, cycles):
+        # fraction of the cycles each kind of unit was busy, averaged over the units
+        return {
+            kind: sum(unit.busy_cycles for unit in units) / (len(units) * max(cycles, 1))
+            for kind, units in self.units.items()
+        }
+
+    def __str__(self):
+        return "\n".join(
+            f"{kind}: {len(units)} x latency {units[0].latency}, {'pipelined' if units[0].pipelined else 'blocking'}"
+            for kind, units in self.units.items()
+        )
@@ -1,5 +1,3 @@
-import re
-
 arithmetic = ["add", "sub", "mul", "mod", "div", "imul", "idiv"]
 immediate = ["addi"]
 memory = ["lw", "sw"]
@@ -19,16 +17,36 @@ colours = [
 
 
 class Instruction:
+    __slots__ = (
+        "decoded",
+        "pc",
+        "instruction_string",
+        "opcode",
+        "operands",
+        "target_address",
+        "result",
+        "branch_target",
+        "finished",
+        "source_registers",
+        "target_register",
+        "immediate",
+        "colour",
+        "rs",
+        "rt",
+        "imm",
+    )
+
     def __str__(self):
         return self.instruction_string
 
-    def __init__(self, instruction_string, symbols, PC):
+    def __init__(self, decoded, PC):
 
-        self.symbols = symbols
-        self.instruction_string = instruction_string
+        self.decoded = decoded  # entry of the predecoded program image
+        self.pc = PC
+        self.instruction_string = decoded.text
 
         self.opcode = None
-        self.operand_str = None
+        self.operands = None
 
         # fields that may be computed during execution
         self.target_address = None  # for loads/stores
@@ -44,69 +62,20 @@ class Instruction:
         self.colour = colours[PC % len(colours)]
 
     def parse(self):
-        self.opcode = self.instruction_string.split()[0]
-        self.operand_str = self.instruction_string.split(self.opcode)[1].strip()
+        # the opcode was decoded together with the program image
+        self.opcode = self.decoded.opcode
 
         return self
 
     def collect_operands(self):
-        source_registers = []
-
-        # tag the registers with their respective roles
-        if self.opcode in arithmetic:
-
-            self.operands = self.parse_operands(
-                "^(?P<rd>\$\w*) (?P<rs>\$\w*) (?P<rt>\$\w*)$"
-            )
-
-        elif self.opcode in immediate:
-
-            self.operands = self.parse_operands(
-                "^(?P<rt>\$\w*) (?P<rs>\$\w*) (?P<imm>-*\d+)$"
-            )
-
-        elif self.opcode in memory:
-
-            self.operands = self.parse_operands(
-                "^(?P<rt>\$\w*) *(?P<imm>\w+)\((?P<rs>\$\w*|\d*)\)$"
-            )
-
-        elif self.opcode in branches:
-
-            self.operands = self.parse_operands(
-                "^(?P<rs>\$\w*) (?P<rt>\$\w*) (?P<imm>-*\d+|\$*\w*)$"
-            )
-
-        elif self.opcode in jumps:
-
-            # ! no source reg to worry about
-            self.operands = self.parse_operands("^(?P<imm>\w*)$")
-
-        else:
+        if self.opcode not in arithmetic + immediate + memory + branches + jumps:
             raise RuntimeError(
-                f"Collecting operands of {self.opcode} {self.operand_str} -> Not implemented"
+                f"Collecting operands of {self.instruction_string} -> Not implemented"
             )
 
-        return self
-
-    def parse_operands(self, pattern):
-        match = re.match(pattern, self.operand_str)
-        if not match:
-            raise RuntimeError(
-                f"Match broken for instruction {self.opcode} {self.operand_str}"
-            )
+        self.operands = self.decoded
 
-        operands = {}
-
-        for k, v in match.groupdict().items():
-            if v in self.symbols:
-                operands[k] = self.symbols[v]
-            elif v[0] == "$":
-                operands[k] = int(v[1:])
-            else:
-                operands[k] = int(v)
-
-        return operands
+        return self
 
     def fetch_source_registers(self):
         source_registers = []
@@ -114,49 +83,41 @@ class Instruction:
         # tag the registers with their respective roles
         if self.opcode in arithmetic:
 
-            self.operands = self.parse_operands(
-                "^(?P<rd>\$\w*) (?P<rs>\$\w*) (?P<rt>\$\w*)$"
-            )
+            self.operands = self.decoded
 
-            source_registers.append(self.operands["rs"])
-            source_registers.append(self.operands["rt"])
+            source_registers.append(self.operands.rs)
+            source_registers.append(self.operands.rt)
 
         elif self.opcode in immediate:
 
-            self.operands = self.parse_operands(
-                "^(?P<rt>\$\w*) (?P<rs>\$\w*) (?P<imm>-*\d+)$"
-            )
+            self.operands = self.decoded
 
-            source_registers.append(self.operands["rs"])
+            source_registers.append(self.operands.rs)
 
         elif self.opcode in memory:
 
-            self.operands = self.parse_operands(
-                "^(?P<rt>\$\w*) *(?P<imm>\w+)\((?P<rs>\$\w*|\d*)\)$"
-            )
+            self.operands = self.decoded
 
-            source_registers.append(self.operands["rs"])
+            source_registers.append(self.operands.rs)
 
         elif self.opcode in branches:
 
-            self.operands = self.parse_operands(
-                "^(?P<rs>\$\w*) (?P<rt>\$\w*) (?P<imm>-*\d+|\$*\w*)$"
-            )
+            self.operands = self.decoded
 
-            source_registers.append(self.operands["rs"])
-            source_registers.append(self.operands["rt"])
+            source_registers.append(self.operands.rs)
+            source_registers.append(self.operands.rt)
 
         elif self.opcode in jumps:
 
             # ! no source reg to worry about
-            self.operands = self.parse_operands("^(?P<imm>\w*)$")
+            self.operands = self.decoded
 
         elif self.opcode == "STALL":
             pass
 
         else:
             raise RuntimeError(
-                f"Fetching source registers of {self.opcode} {self.operand_str} -> Not implemented"
+                f"Fetching source registers of {self.instruction_string} -> Not implemented"
             )
 
         return source_registers
@@ -166,37 +127,37 @@ class Instruction:
         if self.opcode in arithmetic:
 
             # prefetching
-            self.target_register = self.operands["rd"]
-            self.rs = RF[self.operands["rs"]]
-            self.rt = RF[self.operands["rt"]]
+            self.target_register = self.operands.rd
+            self.rs = RF[self.operands.rs]
+            self.rt = RF[self.operands.rt]
 
         elif self.opcode in immediate:
 
             # prefetching
-            self.target_register = self.operands["rt"]
-            self.rs = RF[self.operands["rs"]]
-            self.imm = self.operands["imm"]
+            self.target_register = self.operands.rt
+            self.rs = RF[self.operands.rs]
+            self.imm = self.operands.imm
 
         elif self.opcode in memory:
 
             # prefetching
-            self.target_register = self.operands["rt"]
-            self.rs = RF[self.operands["rs"]]
-            self.imm = self.operands["imm"]
+            self.target_register = self.operands.rt
+            self.rs = RF[self.operands.rs]
+            self.imm = self.operands.imm
 
         elif self.opcode in branches:
 
             # prefetching
-            self.rs = RF[self.operands["rs"]]
-            self.rt = RF[self.operands["rt"]]
-            self.imm = self.operands["imm"]
+            self.rs = RF[self.operands.rs]
+            self.rt = RF[self.operands.rt]
+            self.imm = self.operands.imm
 
             self.evaluate_branch_condition()
 
         elif self.opcode in jumps:
 
             # prefetching
-            self.imm = self.operands["imm"]
+            self.imm = self.operands.imm
 
             self.evaluate_branch_condition()
 
@@ -205,7 +166,7 @@ class Instruction:
 
         else:
             raise RuntimeError(
-                f"Reading register file for {self.opcode} {self.operand_str} -> Not implemented"
+                f"Reading register file for {self.instruction_string} -> Not implemented"
             )
 
         return self
@@ -218,7 +179,7 @@ class Instruction:
     def evaluate_branch_condition(self):
         if self.opcode not in branches + jumps:
             raise RuntimeError(
-                f"You should not be calling this method when processing the instruction {self.opcode} {self.operand_str}"
+                f"You should not be calling this method when processing the instruction {self.instruction_string}"
             )
 
         if self.opcode == "beq":
@@ -293,6 +254,8 @@ class Instruction:
 
 
 class Stall(Instruction):
+    __slots__ = ()
+
     def __str__(self):
         return "STALL"
 
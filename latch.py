@@ -0,0 +1,83 @@
+"""
+Pipeline queue between two stages, backed by a ring buffer.
+
+Stages read the oldest entry with peek() and stage their changes with push() and pop(). Staged changes become
+visible only when the processor calls tick() at the end of the cycle, so every stage sees the state from the
+start of the cycle regardless of the order the stages run in.
+"""
+
+
+class Latch:
+    def __init__(self, capacity=8, limit=None):
+        self.buffer = [None] * capacity
+        self.head = 0  # oldest entry
+        self.size = 0  # visible entries
+
+        # entries the producer may have in the latch before it has to hold back, None for no limit
+        self.limit = limit
+
+        # staged pushes already sit in the buffer right after the visible entries
+        self.pushed = 0
+        self.popped = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        # oldest first
+        capacity = len(self.buffer)
+        for i in range(self.size):
+            yield self.buffer[(self.head + i) % capacity]
+
+    def __str__(self):
+        return str(list(self))
+
+    def full(self):
+        return self.limit is not None and self.size + self.pushed >= self.limit
+
+    def peek(self):
+        if self.size == 0:
+            raise IndexError("peek from an empty latch")
+
+        return self.buffer[self.head]
+
+    def push(self, val):
+        capacity = len(self.buffer)
+
+        if self.size + self.pushed == capacity:
+            self.grow()
+            capacity = len(self.buffer)
+
+        self.buffer[(self.head + self.size + self.pushed) % capacity] = val
+        self.pushed += 1
+
+    def pop(self):
+        self.popped += 1
+
+    def tick(self):
+        if self.popped:
+            if self.popped > self.size:
+                raise IndexError("pop from an empty latch")
+
+            self.head = (self.head + self.popped) % len(self.buffer)
+            self.size -= self.popped
+            self.popped = 0
+
+        self.size += self.pushed
+        self.pushed = 0
+
+    def grow(self):
+        capacity = len(self.buffer)
+        used = self.size + self.pushed
+
+        self.buffer = [
+            self.buffer[(self.head + i) % capacity] for i in range(used)
+        ] + [None] * (capacity * 2 - used)
+        self.head = 0
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+        self.pushed = 0
+        self.popped = 0
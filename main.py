@@ -1,11 +1,6 @@
 import argparse
-import assembler
-from simple_processor import SimpleProcessor
-from pipelined_processor import PipelinedProcessor
-from scheduled_processor import ScheduledProcessor
-from tests import tests
-import click
-import columnar
+import registry
+import simulation
 
 parser = argparse.ArgumentParser(
     description="Run a processor simulation for a given assembly program."
@@ -25,7 +20,7 @@ parser.add_argument(
     "--processor",
     required=True,
     help="Choose the kind of processor to simulate.",
-    choices=["simple", "pipelined", "scheduled"],
+    choices=list(registry.processors),
     dest="processor_type",
 )
 
@@ -34,7 +29,7 @@ parser.add_argument(
     "--predictor",
     required=True,
     help="Choose the branch prediction method.",
-    choices=["taken", "not_taken", "one_bit", "two_bit"],
+    choices=list(registry.predictors),
     dest="prediction_method",
 )
 
@@ -47,43 +42,310 @@ parser.add_argument(
     help="Debug mode to enable logging output and stepping throught the execution.",
 )
 
-args = parser.parse_args()
+debug_options = parser.add_argument_group(
+    "debugger", "Run at full speed until a breakpoint hits, then inspect the last cycles."
+)
+
+debug_options.add_argument(
+    "-b",
+    "--break",
+    dest="breakpoints",
+    action="append",
+    default=[],
+    help="Stop at pc=N, label=NAME, cycle=N, reg=N, mem=ADDRESS|LABEL or mispredict. Can be given more than once.",
+)
 
-try:
-    with open(args.filename.name) as f:
-        program = f.readlines()
-except:
-    raise RuntimeError(f"File {args.filename.name} not found, please check path.")
+debug_options.add_argument(
+    "--history",
+    dest="history",
+    type=int,
+    default=32,
+    help="Cycles kept as snapshots to look back at, 0 keeps none and runs fastest.",
+)
 
+parser.add_argument(
+    "-ff",
+    "--fast-forward",
+    dest="fast_forward",
+    default=None,
+    help="Execute functionally up to this label or number of instructions before simulating in detail.",
+)
 
-instructions, symbols = assembler.assemble(program)
+parser.add_argument(
+    "-w",
+    "--warmup",
+    dest="warmup",
+    type=int,
+    default=0,
+    help="Instructions simulated after fast forwarding before the stats start counting.",
+)
 
+parser.add_argument(
+    "--max-cycles",
+    dest="max_cycles",
+    type=int,
+    default=None,
+    help="Stop after this many cycles if the program has not halted by then.",
+)
 
-if args.processor_type == "simple":
-    processor = SimpleProcessor
-elif args.processor_type == "pipelined":
-    processor = PipelinedProcessor
-elif args.processor_type == "scheduled":
-    processor = ScheduledProcessor
-else:
-    raise RuntimeError("Processor type not implemented")
+parser.add_argument(
+    "--timeout",
+    dest="timeout",
+    type=float,
+    default=None,
+    help="Stop after this many seconds of simulating if the program has not halted by then.",
+)
+
+cache_options = parser.add_argument_group(
+    "data cache", "Model a data cache in the mem stage of the pipelined and scheduled processors."
+)
+
+cache_options.add_argument(
+    "--cache-size",
+    dest="cache_size",
+    type=int,
+    default=None,
+    help="Cache size in words, enables the cache.",
+)
+
+cache_options.add_argument(
+    "--cache-assoc", dest="cache_assoc", type=int, default=2, help="Associativity."
+)
+
+cache_options.add_argument(
+    "--cache-line", dest="cache_line", type=int, default=4, help="Line size in words."
+)
+
+cache_options.add_argument(
+    "--cache-policy",
+    dest="cache_policy",
+    default="lru",
+    choices=list(registry.cache_policies),
+    help="Replacement policy.",
+)
+
+cache_options.add_argument(
+    "--cache-hit", dest="cache_hit", type=int, default=1, help="Hit latency in cycles."
+)
+
+cache_options.add_argument(
+    "--cache-miss",
+    dest="cache_miss",
+    type=int,
+    default=10,
+    help="Miss latency in cycles.",
+)
+
+parser.add_argument(
+    "-fu",
+    "--functional-units",
+    dest="functional_units",
+    default=None,
+    help='Functional units as kind=count:latency[:blocking] for alu, mul and div, e.g. "alu=2:1,mul=1:3,div=1:12:blocking". Kinds left out get one single cycle unit.',
+)
+
+predictor_options = parser.add_argument_group(
+    "history predictors", "Size the gshare and tournament predictors of the scheduled processor."
+)
+
+predictor_options.add_argument(
+    "--history-bits",
+    dest="history_bits",
+    type=int,
+    default=None,
+    help="Global history length in branches, 8 by default.",
+)
+
+predictor_options.add_argument(
+    "--table-size",
+    dest="table_size",
+    type=int,
+    default=None,
+    help="Entries in every prediction table, 1024 by default.",
+)
+
+parser.add_argument(
+    "--trace",
+    dest="trace",
+    default=None,
+    help="Write a binary trace of the committed instructions to this file, read it with commit_trace.py.",
+)
+
+parser.add_argument(
+    "--counters",
+    dest="counters",
+    default=None,
+    help="Write the occupancy and stall counters of the scheduled processor to this JSON file.",
+)
+
+parser.add_argument(
+    "--timeline",
+    dest="timeline",
+    default=None,
+    help="Write when every instruction went through every stage to this file, as it runs.",
+)
+
+parser.add_argument(
+    "--timeline-format",
+    dest="timeline_format",
+    default="chrome",
+    choices=list(registry.timeline_writers),
+    help="Chrome trace event JSON for Perfetto, or a log for the Konata pipeline viewer.",
+)
+
+parser.add_argument(
+    "--report",
+    dest="report",
+    default="stats",
+    choices=list(registry.reporters),
+    help="What to print once the run is over: the stats tables, one summary line, or JSON.",
+)
+
+parser.add_argument(
+    "--memory-counters",
+    dest="memory_counters",
+    action="store_true",
+    help="Count the loads and stores to every memory page and report them, every access gets slower.",
+)
 
+profile_options = parser.add_argument_group(
+    "profiling", "Host time spent in each stage of the scheduled processor."
+)
+
+profile_options.add_argument(
+    "--profile",
+    dest="profile",
+    action="store_true",
+    help="Time every stage and print the breakdown with the stats.",
+)
 
-cpu = processor(
-    instructions, symbols, prediction_method=args.prediction_method, debug=args.debug
+profile_options.add_argument(
+    "--profile-memory",
+    dest="profile_memory",
+    action="store_true",
+    help="Also record the memory each stage allocates, much slower.",
 )
 
-# print(instructions, symbols)
+args = parser.parse_args()
+
+options = {}
+if args.cache_size is not None:
+    if args.processor_type not in ["pipelined", "scheduled"]:
+        parser.error("the data cache needs the pipelined or scheduled processor")
+
+    from cache import Cache
+
+    options["cache"] = Cache(
+        size=args.cache_size,
+        associativity=args.cache_assoc,
+        line_size=args.cache_line,
+        replacement=args.cache_policy,
+        hit_latency=args.cache_hit,
+        miss_latency=args.cache_miss,
+    )
+
+if args.functional_units is not None:
+    if args.processor_type not in ["simple", "scheduled"]:
+        parser.error("functional units need the simple or scheduled processor")
+
+    from functional_units import FunctionalUnitPool
+
+    try:
+        options["functional_units"] = FunctionalUnitPool.from_spec(
+            args.functional_units
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+for option in ["history_bits", "table_size"]:
+    if getattr(args, option) is not None:
+        if args.processor_type != "scheduled":
+            parser.error("only the scheduled processor predicts branches")
+
+        options[option] = getattr(args, option)
+
+if args.trace is not None:
+    if args.processor_type == "functional":
+        parser.error("the functional processor does not write a trace")
 
-while cpu.running():
-    cpu.cycle()
+    from commit_trace import TraceWriter
 
+    options["trace"] = TraceWriter(args.trace)
 
-test_result = (
-    click.style("PASSED", fg="green")
-    if tests[args.filename.name](cpu)
-    else click.style("FAILED", fg="red")
+if args.timeline is not None and args.processor_type == "functional":
+    parser.error("the functional processor has no pipeline to draw a timeline of")
+
+if args.counters is not None and args.processor_type != "scheduled":
+    parser.error("only the scheduled processor keeps occupancy counters")
+
+if args.profile or args.profile_memory:
+    if args.processor_type != "scheduled":
+        parser.error("only the scheduled processor can be profiled")
+
+    from stage_profile import StageProfile
+
+    options["profile"] = StageProfile(memory=args.profile_memory)
+
+if args.breakpoints:
+    if args.processor_type == "functional":
+        parser.error("the functional processor runs without cycles, it cannot be debugged")
+
+    if args.debug:
+        parser.error("breakpoints replace the step by step debug mode, use one or the other")
+
+    if args.max_cycles is not None or args.timeout is not None:
+        parser.error("the debugger runs until the program halts, it takes no budget")
+
+program = simulation.load_program(args.filename.name)
+
+start = None
+if args.fast_forward is not None:
+    start = int(args.fast_forward) if args.fast_forward.isdigit() else args.fast_forward
+
+# only the chosen processor is imported, see registry.py
+cpu = simulation.build(
+    program,
+    args.processor_type,
+    {"prediction_method": args.prediction_method, "debug": args.debug, **options},
+    start=start,
+    warmup=args.warmup,
 )
-cpu.print_stats()
-print({i: line for i, line in enumerate(cpu.program)})
-print(f"\nTEST RESULT: {test_result}\n")
+
+if args.memory_counters:
+    cpu.count_memory()
+
+if args.timeline is not None:
+    from timeline import Timeline
+
+    writer = registry.timeline_writer(args.timeline_format)
+    timeline = Timeline(cpu, writer(args.timeline))
+
+if args.breakpoints:
+    from debugger import Debugger, parse_breakpoint, interact
+
+    try:
+        breakpoints = [parse_breakpoint(spec, cpu.symbols) for spec in args.breakpoints]
+    except ValueError as e:
+        parser.error(str(e))
+
+    interact(Debugger(cpu, breakpoints, history=args.history))
+    status = "halted"
+else:
+    status = simulation.run(cpu, args.max_cycles, args.timeout)
+
+if args.trace is not None:
+    options["trace"].close()
+
+if args.timeline is not None:
+    timeline.close()
+
+if "profile" in options:
+    options["profile"].stop()
+
+if args.counters is not None:
+    cpu.counters.export(args.counters)
+
+registry.reporter(args.report)(cpu, args.filename.name)
+
+if status != "halted":
+    raise SystemExit(f"stopped after {cpu.cycles} cycles without halting: {status}")
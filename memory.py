@@ -0,0 +1,258 @@
+from array import array
+from typing import *
+
+"""
+Word addressed data memory made of fixed size pages that are only allocated when they are first written.
+Reading an address that was never written gives 0, so programs can use large and sparse address spaces.
+
+Pages are array('q') buffers. Integers in this ISA have no width and div gives floats, a page that has to
+hold a value outside the signed 64 bit range or a float is turned into a list so the value is kept exactly.
+Reading a page does not allocate it, the buffer comes with the first write.
+
+load() and store() are the accesses of the program. Indexing and slicing behave like the list the memory
+used to be, up to the highest address written. Counting the accesses per page costs every load and store,
+so only a CountingMemory does it, see Processor.count_memory and main.py --memory-counters.
+"""
+
+
+class Page:
+    __slots__ = ("data", "loads", "stores")
+
+    def __init__(self, data=None):
+        self.data = data
+        self.loads = 0
+        self.stores = 0
+
+
+class Memory:
+    count = False  # whether load() and store() count per page
+
+    def __init__(self, page_size=1024):
+        if page_size < 1 or page_size & (page_size - 1):
+            raise ValueError("Page size has to be a power of two")
+
+        self.page_size = page_size
+        self.page_bits = page_size.bit_length() - 1
+        self.mask = page_size - 1
+
+        self.pages: Dict[int, Page] = {}
+        self.size = 0  # one past the highest address written
+
+    @classmethod
+    def from_values(cls, values, page_size=1024):
+        memory = cls(page_size)
+        memory.write_block(0, values)
+        return memory
+
+    def copy(self):
+        # the contents, not the counters
+        memory = type(self)(self.page_size)
+        memory.pages = {
+            n: Page(page.data[:])
+            for n, page in self.pages.items()
+            if page.data is not None
+        }
+        memory.size = self.size
+        return memory
+
+    def page(self, address):
+        if address < 0:
+            raise IndexError(f"Memory address {address} out of range")
+
+        page = self.pages.get(address >> self.page_bits)
+        if page is None:
+            page = self.pages[address >> self.page_bits] = Page()
+
+        return page
+
+    def allocate(self, page):
+        page.data = array("q", bytes(8 * self.page_size))
+
+    def read(self, address):
+        if address < 0:
+            raise IndexError(f"Memory address {address} out of range")
+
+        page = self.pages.get(address >> self.page_bits)
+        if page is None or page.data is None:
+            return 0
+
+        return page.data[address & self.mask]
+
+    def write(self, address, value):
+        page = self.page(address)
+
+        if page.data is None:
+            self.allocate(page)
+
+        try:
+            page.data[address & self.mask] = value
+        except (TypeError, OverflowError):
+            page.data = list(page.data)
+            page.data[address & self.mask] = value
+
+        if address >= self.size:
+            self.size = address + 1
+
+    def load(self, address):
+        page = self.pages.get(address >> self.page_bits)
+        if page is None or page.data is None:
+            return self.read(address)
+
+        return page.data[address & self.mask]
+
+    def store(self, address, value):
+        page = self.pages.get(address >> self.page_bits)
+
+        if page is not None and page.data is not None and type(value) is int:
+            try:
+                page.data[address & self.mask] = value
+                if address >= self.size:
+                    self.size = address + 1
+                return
+            except OverflowError:
+                pass
+
+        self.write(address, value)
+
+    """
+    Bulk helpers for data sections, whole runs of a page are copied at once
+    """
+
+    def write_block(self, address, values):
+        values = list(values)
+
+        done = 0
+        while done < len(values):
+            offset = (address + done) & self.mask
+            n = min(self.page_size - offset, len(values) - done)
+            chunk = values[done : done + n]
+
+            page = self.page(address + done)
+            if page.data is None:
+                self.allocate(page)
+
+            try:
+                page.data[offset : offset + n] = array("q", chunk)
+            except (TypeError, OverflowError):
+                page.data = list(page.data)
+                page.data[offset : offset + n] = chunk
+
+            done += n
+
+        if values and address + len(values) > self.size:
+            self.size = address + len(values)
+
+    def read_block(self, address, count):
+        if address < 0:
+            raise IndexError(f"Memory address {address} out of range")
+
+        values = []
+        while len(values) < count:
+            offset = (address + len(values)) & self.mask
+            n = min(self.page_size - offset, count - len(values))
+            page = self.pages.get((address + len(values)) >> self.page_bits)
+
+            if page is None or page.data is None:
+                values += [0] * n
+            else:
+                values += list(page.data[offset : offset + n])
+
+        return values
+
+    def counting(self):
+        # the same pages and contents, counted from now on
+        memory = CountingMemory(self.page_size)
+        memory.pages = self.pages
+        memory.size = self.size
+        return memory
+
+    def page_counters(self):
+        # (first address of the page, loads, stores) of every page the program touched
+        return [
+            (n << self.page_bits, page.loads, page.stores)
+            for n, page in sorted(self.pages.items())
+            if page.loads or page.stores
+        ]
+
+    def reset_counters(self):
+        for page in self.pages.values():
+            page.loads = 0
+            page.stores = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, ix):
+        if isinstance(ix, slice):
+            start, stop, step = ix.indices(self.size)
+            if step == 1:
+                return self.read_block(start, max(stop - start, 0))
+            return [self.read(i) for i in range(start, stop, step)]
+
+        if ix < 0:
+            ix += self.size
+
+        return self.read(ix)
+
+    def __setitem__(self, ix, value):
+        if ix < 0:
+            ix += self.size
+
+        self.write(ix, value)
+
+    def __iter__(self):
+        return iter(self.read_block(0, self.size))
+
+    def __eq__(self, other):
+        if isinstance(other, Memory):
+            return self.size == other.size and list(self) == list(other)
+
+        return list(self) == list(other)
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return f"Memory({list(self)})"
+
+    def describe(self):
+        allocated = sum(page.data is not None for page in self.pages.values())
+        lines = [
+            f"MEMORY {self.size} words, {allocated} pages of {self.page_size} allocated"
+        ]
+
+        for start, loads, stores in self.page_counters():
+            lines.append(f"page {start}: loads {loads}, stores {stores}")
+
+        return "\n".join(lines)
+
+
+"""
+A memory that counts the loads and stores of the program per page. A page that is only read gets its
+counters but no buffer.
+"""
+
+
+class CountingMemory(Memory):
+    count = True
+
+    def load(self, address):
+        page = self.pages.get(address >> self.page_bits)
+        if page is None:
+            page = self.page(address)
+
+        page.loads += 1
+
+        if page.data is None:
+            return 0
+
+        return page.data[address & self.mask]
+
+    def store(self, address, value):
+        page = self.pages.get(address >> self.page_bits)
+        if page is None:
+            page = self.page(address)
+
+        page.stores += 1
+
+        super().store(address, value)
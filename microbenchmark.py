@@ -0,0 +1,114 @@
+import argparse
+import gc
+import timeit
+
+import simulation
+from latch import Latch
+
+"""
+Per cycle cost of the pipeline queues. The list version is how the processors used to update their queues:
+a tuple per update, applied through getattr/setattr by copying the list. The latch version stages the same
+push and pop in place and ticks every queue at the end of the cycle.
+"""
+
+queue_names = ["decode_queue", "issue_queue", "execute_queue", "mem_queue", "writeback_queue"]
+
+
+class ListPipeline:
+    def __init__(self, depth):
+        for name in queue_names:
+            setattr(self, name, [None] * depth)
+
+    def tick(self, updates):
+        for action, attr, val in updates:
+            current = getattr(self, attr)
+
+            if action == "pop":
+                setattr(self, attr, current[:-1])
+            elif action == "push":
+                setattr(self, attr, [val] + current)
+
+    def cycle(self):
+        updates = []
+        for name in queue_names:
+            val = getattr(self, name)[-1]
+            updates += [("pop", name, None)]
+            updates += [("push", name, val)]
+
+        self.tick(updates)
+
+
+class LatchPipeline:
+    def __init__(self, depth):
+        self.queues = []
+        for name in queue_names:
+            latch = Latch()
+            for _ in range(depth):
+                latch.push(None)
+            latch.tick()
+            self.queues.append(latch)
+
+    def cycle(self):
+        for latch in self.queues:
+            val = latch.peek()
+            latch.pop()
+            latch.push(val)
+
+        for latch in self.queues:
+            latch.tick()
+
+
+def per_cycle(pipeline, cycles):
+    # best of three, in nanoseconds
+    return min(timeit.repeat(pipeline.cycle, number=cycles, repeat=3)) / cycles * 1e9
+
+
+def simulate(filename, instructions_per_cycle):
+    # with the garbage collector off, like timeit
+    gc.disable()
+    try:
+        stats = simulation.simulate(
+            filename, "scheduled", {"instructions_per_cycle": instructions_per_cycle}
+        )
+    finally:
+        gc.enable()
+
+    return stats.elapsed / stats.cycles * 1e9
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the per cycle cost of the pipeline queues."
+    )
+
+    parser.add_argument(
+        "-n",
+        "--cycles",
+        type=int,
+        default=100000,
+        help="Number of cycles to time.",
+        dest="cycles",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--file",
+        default="programs/mat_mul.asm",
+        help="Program to time the scheduled processor on.",
+        dest="filename",
+    )
+
+    args = parser.parse_args()
+
+    for depth in [1, 4, 16]:
+        before = per_cycle(ListPipeline(depth), args.cycles)
+        after = per_cycle(LatchPipeline(depth), args.cycles)
+        print(
+            f"queue depth {depth:>2}: lists {before:8.0f} ns/cycle, latches {after:8.0f} ns/cycle"
+        )
+
+    for instructions_per_cycle in [1, 4]:
+        cost = simulate(args.filename, instructions_per_cycle)
+        print(
+            f"ScheduledProcessor -s {instructions_per_cycle} on {args.filename}: {cost:8.0f} ns/cycle"
+        )
@@ -0,0 +1,206 @@
+from typing import *
+
+"""
+Events the processors report at their stage boundaries, for tools that want to watch a run without the
+debug flag.
+
+An observer subclasses Observer and overrides the on_ methods of the events it cares about. The processors
+take a list of observers when they are built and bind one hook per event: None when nobody listens, the
+observer's own method when one does, or a small fan out when several do. A stage only builds the event
+when its hook is set, so a run without observers pays a None check and nothing else.
+
+Not every processor has every stage:
+
+    event       simple  pipelined  scheduled
+    fetch       yes     yes        yes
+    decode                         yes        into the issue queue
+    issue               yes        yes        into the execute queue, or into the ROB
+    dispatch                       yes        out of the RS or LSQ
+    execute     yes     yes        yes        the ALU or the memory access produced the result
+    writeback                      yes        the result is written back to the ROB
+    broadcast           yes        yes        a value forwarded by register, or by ROB tag on the CDB
+    commit      yes     yes        yes
+    flush               yes        yes        a taken branch in decode, or a misprediction
+    stall               yes        yes        a decode stall, or the stall reasons of pipeline_counters
+
+A flush reports how many instructions it squashed, those are always the youngest ones reported by a fetch
+and not committed yet.
+
+Tags are ROB entries of the scheduled processor and are reused once their entry commits.
+"""
+
+
+class FetchEvent(NamedTuple):
+    cycle: int
+    pc: int
+    opcode: str
+    predicted_pc: Optional[int] = None  # scheduled processor only
+
+
+class DecodeEvent(NamedTuple):
+    cycle: int
+    pc: int
+    opcode: str
+
+
+class IssueEvent(NamedTuple):
+    cycle: int
+    pc: int
+    opcode: str
+    tag: Optional[int] = None
+
+
+class DispatchEvent(NamedTuple):
+    cycle: int
+    pc: int
+    opcode: str
+    tag: int
+    queue: str  # "rs" or "lsq"
+
+
+class ExecuteEvent(NamedTuple):
+    cycle: int
+    pc: int
+    opcode: str
+    result: Optional[Union[int, float]]
+    tag: Optional[int] = None
+
+
+class WritebackEvent(NamedTuple):
+    cycle: int
+    pc: int
+    opcode: str
+    result: Optional[Union[int, float]]
+    tag: Optional[int] = None
+
+
+class BroadcastEvent(NamedTuple):
+    cycle: int
+    tag: int  # register number for the pipelined processor
+    value: Union[int, float]
+
+
+class CommitEvent(NamedTuple):
+    cycle: int
+    pc: int
+    opcode: str
+    result: Optional[Union[int, float]]
+    tag: Optional[int] = None
+    mispredicted: bool = False
+    register: Optional[int] = None  # the register written, if any
+    address: Optional[int] = None  # for loads and stores
+
+
+class FlushEvent(NamedTuple):
+    cycle: int
+    pc: int  # where fetch starts again
+    squashed: int  # instructions thrown away
+
+
+class StallEvent(NamedTuple):
+    cycle: int
+    reasons: Tuple[str, ...]
+    cycles: int = 1
+
+
+events = [
+    "fetch",
+    "decode",
+    "issue",
+    "dispatch",
+    "execute",
+    "writeback",
+    "broadcast",
+    "commit",
+    "flush",
+    "stall",
+]
+
+
+class Observer:
+    def on_fetch(self, event: FetchEvent):
+        pass
+
+    def on_decode(self, event: DecodeEvent):
+        pass
+
+    def on_issue(self, event: IssueEvent):
+        pass
+
+    def on_dispatch(self, event: DispatchEvent):
+        pass
+
+    def on_execute(self, event: ExecuteEvent):
+        pass
+
+    def on_writeback(self, event: WritebackEvent):
+        pass
+
+    def on_broadcast(self, event: BroadcastEvent):
+        pass
+
+    def on_commit(self, event: CommitEvent):
+        pass
+
+    def on_flush(self, event: FlushEvent):
+        pass
+
+    def on_stall(self, event: StallEvent):
+        pass
+
+
+def fan_out(handlers):
+    def hook(event):
+        for handler in handlers:
+            handler(event)
+
+    return hook
+
+
+"""
+One hook per event for the given observers, None where no observer has more than the no-op. An observer
+can also set one of its on_ attributes to None to leave that event out.
+"""
+
+
+def bind_hooks(observers) -> Dict[str, Optional[Callable]]:
+    hooks = {}
+
+    for event in events:
+        name = f"on_{event}"
+        handlers = []
+
+        for observer in observers:
+            method = getattr(observer, name, None)
+            if method is None or getattr(method, "__func__", None) is getattr(Observer, name):
+                continue
+            handlers.append(method)
+
+        if not handlers:
+            hooks[event] = None
+        elif len(handlers) == 1:
+            hooks[event] = handlers[0]
+        else:
+            hooks[event] = fan_out(handlers)
+
+    return hooks
+
+
+"""
+Keeps every event it sees, or only the kinds asked for. Handy for tests and quick looks.
+"""
+
+
+class EventLog(Observer):
+    def __init__(self, kinds=None):
+        self.events = []
+
+        for kind in events:
+            if kinds is not None and kind not in kinds:
+                setattr(self, f"on_{kind}", None)
+
+    def on_fetch(self, event):
+        self.events.append(event)
+
+    on_decode = on_issue = on_dispatch = on_execute = on_writeback = on_fetch
+    on_broadcast = on_commit = on_flush = on_stall = on_fetch
@@ -0,0 +1,211 @@
+import json
+from collections import Counter
+from typing import *
+
+"""
+Occupancy and stall counters of the scheduled processor, sampled once at the end of every cycle.
+
+Occupancy of the ROB, RS and LSQ and the depth of every pipeline queue are kept as histograms, cycles by the
+number of entries. With several instructions per cycle the stages run more than once in a cycle, a cycle only
+counts as a stall of a stage if the stage got nothing through in the whole cycle. It counts for every reason
+that held, so the reasons can overlap:
+
+    rob_full      issue had an instruction but no free ROB entry
+    rs_full       issue had an instruction but no free reservation station
+    operands      the RS held entries but none had its operands
+    units_busy    the RS had ready entries but no free functional unit for them
+    lsq_ordering  the LSQ held entries but none could go, waiting on an address, a value or an older store
+    flush         refetching after a misprediction, from the flush until the next commit
+
+Commits per cycle are kept as a histogram as well, its mean is the IPC at commit.
+"""
+
+ROB_FULL = 1
+RS_FULL = 2
+OPERANDS = 4
+UNITS_BUSY = 8
+LSQ_ORDERING = 16
+FLUSH = 32
+
+# progress, clears the stalls of the stage
+ISSUED = 64
+RS_DISPATCHED = 128
+LSQ_DISPATCHED = 256
+
+ANY_STALL = ROB_FULL | RS_FULL | OPERANDS | UNITS_BUSY | LSQ_ORDERING | FLUSH
+
+reasons = {
+    ROB_FULL: "rob_full",
+    RS_FULL: "rs_full",
+    OPERANDS: "operands",
+    UNITS_BUSY: "units_busy",
+    LSQ_ORDERING: "lsq_ordering",
+    FLUSH: "flush",
+}
+
+queues = [
+    "decode_queue",
+    "issue_queue",
+    "execute_queue",
+    "mem_queue",
+    "writeback_queue",
+]
+
+
+# histograms are lists indexed by the number of entries, cycles in each
+def mean(histogram: List[int]):
+    total = sum(histogram)
+    if total == 0:
+        return 0
+
+    return sum(k * v for k, v in enumerate(histogram)) / total
+
+
+def maximum(histogram: List[int]):
+    return max((k for k, v in enumerate(histogram) if v), default=0)
+
+
+def trim(histogram: List[int]):
+    # up to the largest value seen
+    return histogram[: maximum(histogram) + 1]
+
+
+def stall_reasons(stalls):
+    # the reasons left once the stages that got something through are cleared
+    if stalls & ISSUED:
+        stalls &= ~(ROB_FULL | RS_FULL)
+    if stalls & RS_DISPATCHED:
+        stalls &= ~(OPERANDS | UNITS_BUSY)
+    if stalls & LSQ_DISPATCHED:
+        stalls &= ~LSQ_ORDERING
+
+    return tuple(reason for bit, reason in reasons.items() if stalls & bit)
+
+
+class PipelineCounters:
+    def __init__(self, capacities: Dict[str, int]):
+        # structure -> number of entries, sizes the histograms of rob, rs and lsq
+        self.capacities = capacities
+        self.reset()
+
+    def reset(self):
+        self.cycles = 0
+
+        self.rob = [0] * (self.capacities["rob"] + 1)
+        self.rs = [0] * (self.capacities["rs"] + 1)
+        self.lsq = [0] * (self.capacities["lsq"] + 1)
+
+        # queues and commits have no fixed bound, they grow when needed
+        self.bound = 9
+        self.decode_queue = [0] * self.bound
+        self.issue_queue = [0] * self.bound
+        self.execute_queue = [0] * self.bound
+        self.mem_queue = [0] * self.bound
+        self.writeback_queue = [0] * self.bound
+        self.commits = [0] * self.bound
+
+        self.stalls = Counter()
+
+    def grow(self, bound):
+        for histogram in [*self.queues().values(), self.commits]:
+            histogram += [0] * (bound - len(histogram))
+
+        self.bound = bound
+
+    def queues(self):
+        return {queue: getattr(self, queue) for queue in queues}
+
+    """
+    Record the state at the end of a cycle, weighted by the number of cycles it lasted. This runs every
+    cycle, so the common case is kept to plain list updates.
+    """
+
+    def sample(
+        self,
+        rob,
+        rs,
+        lsq,
+        decode,
+        issue,
+        execute,
+        mem,
+        writeback,
+        committed,
+        stalls,
+        cycles=1,
+    ):
+        self.cycles += cycles
+
+        self.rob[rob] += cycles
+        self.rs[rs] += cycles
+        self.lsq[lsq] += cycles
+
+        if max(decode, issue, execute, mem, writeback, committed) >= self.bound:
+            self.grow(max(decode, issue, execute, mem, writeback, committed) + 1)
+
+        self.decode_queue[decode] += cycles
+        self.issue_queue[issue] += cycles
+        self.execute_queue[execute] += cycles
+        self.mem_queue[mem] += cycles
+        self.writeback_queue[writeback] += cycles
+        self.commits[committed] += cycles
+
+        if stalls & ANY_STALL:
+            for reason in stall_reasons(stalls):
+                self.stalls[reason] += cycles
+
+    def histograms(self):
+        return {
+            "rob": self.rob,
+            "rs": self.rs,
+            "lsq": self.lsq,
+            **self.queues(),
+        }
+
+    def as_dict(self):
+        # plain types only, so it can be dumped as JSON
+        return {
+            "cycles": self.cycles,
+            "occupancy": {
+                name: {
+                    "capacity": self.capacities.get(name),
+                    "mean": mean(histogram),
+                    "max": maximum(histogram),
+                    "histogram": trim(histogram),
+                }
+                for name, histogram in self.histograms().items()
+            },
+            "stall_cycles": {
+                reason: self.stalls[reason] for reason in reasons.values()
+            },
+            "commits_per_cycle": {
+                "mean": mean(self.commits),
+                "histogram": trim(self.commits),
+            },
+        }
+
+    def export(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def __str__(self):
+        cycles = max(self.cycles, 1)
+        lines = [f"OCCUPANCY over {self.cycles} cycles (mean, max, capacity)"]
+
+        for name, histogram in self.histograms().items():
+            capacity = self.capacities.get(name, "-")
+            lines.append(
+                f"{name:<16} {mean(histogram):8.2f} {maximum(histogram):5} {capacity:>5}"
+            )
+
+        lines.append("STALL CYCLES")
+        for reason in reasons.values():
+            lines.append(
+                f"{reason:<16} {self.stalls[reason]:8} {self.stalls[reason] / cycles:6.1%}"
+            )
+
+        lines.append(
+            f"COMMIT IPC {mean(self.commits):.3f}, cycles by commits {trim(self.commits)}"
+        )
+
+        return "\n".join(lines)
@@ -1,7 +1,16 @@
+from collections import deque
 from processor import Processor
+from latch import Latch
 from instruction import *
-import click
-from columnar import columnar
+from observers import (
+    FetchEvent,
+    IssueEvent,
+    ExecuteEvent,
+    BroadcastEvent,
+    CommitEvent,
+    FlushEvent,
+    StallEvent,
+)
 
 
 """
@@ -10,25 +19,22 @@ Instruction fetch module. Fetch next instruction, add it to the instruction queu
 
 
 class IF:
-    def __init__(self, program, symbols, debug):
+    def __init__(self, image, debug):
         self.debug = debug
 
-        self.program = program
-        self.symbols = symbols
+        self.image = image
 
     def run(self, PC, instruction_queue):
 
-        if PC >= len(self.program):
+        if PC >= len(self.image):
             return []
 
-        if PC > len(self.program) or PC < 0:
+        if PC > len(self.image) or PC < 0:
             raise RuntimeError(
-                f"PC out of bounds. PC={PC} for program of length {len(self.program)}"
+                f"PC out of bounds. PC={PC} for program of length {len(self.image)}"
             )
 
-        instruction_string = self.program[PC]
-
-        instruction = Instruction(instruction_string, self.symbols, PC)
+        instruction = Instruction(self.image[PC], PC)
 
         assert isinstance(instruction, Instruction)
 
@@ -95,7 +101,7 @@ class ID:
         if len(instruction_queue) > 0:
             # pop off instruction  queue
 
-            instruction = instruction_queue[-1]
+            instruction = instruction_queue.peek()
 
             parsed_instruction = instruction.parse()
 
@@ -135,7 +141,7 @@ class ID:
             # if this is a branch instruction, say we need to increment the PC
             if decoded_instruction.branch_target:
 
-                updates.append(("branch_executed", None, None))
+                updates.append(("branch_executed", None, decoded_instruction))
 
                 if decoded_instruction.branch_target != -1:
                     updates.append(("set", "PC", decoded_instruction.branch_target))
@@ -167,7 +173,7 @@ class EX:
 
         if len(execution_queue) > 0:
 
-            instruction = execution_queue[-1]
+            instruction = execution_queue.peek()
             computed_instruction = instruction.compute()
 
             if self.debug:
@@ -185,22 +191,39 @@ class EX:
 
 
 class MEM:
-    def __init__(self, debug):
+    def __init__(self, debug, cache=None):
         self.debug = debug
 
-    def run(self, MEM, memory_queue):
+        self.cache = cache
+        self.waiting_on = None  # load held in this stage until the cache returns its data
+        self.ready_at = None
+
+    def run(self, MEM, memory_queue, cycle):
         updates = []
 
         if len(memory_queue) > 0:
             # we care about the opcode to distinguish between a load and a store
-            instruction = memory_queue[-1]
+            instruction = memory_queue.peek()
+
+            if self.cache is not None and instruction.opcode == "lw":
+                if self.waiting_on is not instruction:
+                    self.waiting_on = instruction
+                    latency = self.cache.access(
+                        instruction.target_address, instruction.pc
+                    )
+                    self.ready_at = cycle + latency - 1
+
+                if cycle < self.ready_at:
+                    return updates
+
+                self.waiting_on = None
 
             updates.append(("pop", "memory_queue", None))
 
             if instruction.opcode == "lw":
                 # ! the load method fills the instruction's result field
 
-                instruction.result = MEM[instruction.target_address]
+                instruction.result = MEM.load(instruction.target_address)
 
                 # todo forward
 
@@ -208,7 +231,10 @@ class MEM:
 
             elif instruction.opcode == "sw":
 
-                # write to memory and finish
+                # write to memory and finish, stores only update the cache state
+                if self.cache is not None:
+                    self.cache.access(instruction.target_address, instruction.pc)
+
                 updates.append(("write_mem", "MEM", instruction))
 
             else:
@@ -226,7 +252,7 @@ class WB:
 
         if len(writeback_queue) > 0:
 
-            instruction = writeback_queue[-1]
+            instruction = writeback_queue.peek()
 
             if self.debug:
                 print(f"currently inside WB: {instruction.instruction_string}")
@@ -247,29 +273,43 @@ class PipelinedProcessor(Processor):
         prediction_method=None,
         instructions_per_cycle=1,
         debug=False,
+        cache=None,
+        trace=None,
+        observers=(),
     ):
-        super().__init__(program, symbols, debug)
+        super().__init__(program, symbols, debug, trace, observers)
 
         self.RF = [0] * 32
 
+        # optional data cache, without one every memory access takes a single cycle
+        self.cache = cache
+
         # ? appear in the order they would in the diagram
-        self.IF = IF(self.program, self.symbols, debug=debug)
-        self.instruction_queue = []
+        self.IF = IF(self.image, debug=debug)
+        self.instruction_queue = Latch()
         self.ID = ID(debug=debug)
-        self.execution_queue = []
+        self.execution_queue = Latch()
         self.EX = EX(debug=debug)
-        self.memory_queue = []
-        self.writeback_queue = []
-        self._MEM = MEM(debug=debug)
+        self.memory_queue = Latch()
+        self.writeback_queue = Latch()
+        self._MEM = MEM(debug=debug, cache=cache)
         self.WB = WB(debug=debug)
 
+        self.stalled = False  # decode stalled in the last cycle
+
         # self.WB = WB()
 
         # for debugging
-        self.instruction_queue_history = [0] * 5
-        self.execution_queue_history = [0] * 5
-        self.memory_queue_history = [0] * 5
-        self.writeback_queue_history = [0] * 5
+        self.instruction_queue_history = deque([0] * 5, maxlen=5)
+        self.execution_queue_history = deque([0] * 5, maxlen=5)
+        self.memory_queue_history = deque([0] * 5, maxlen=5)
+        self.writeback_queue_history = deque([0] * 5, maxlen=5)
+
+    def reset_stats(self):
+        super().reset_stats()
+
+        if self.cache is not None:
+            self.cache.reset_stats()
 
     def tick(self, updates):
 
@@ -279,31 +319,14 @@ class PipelinedProcessor(Processor):
             val,
         ) in updates:
 
-            if attr:
-                current = getattr(self, attr)
-
-            # ! keeping the history of all insgtructions for debugging
-            if (
-                attr
-                in [
-                    "instruction_queue",
-                    "execution_queue",
-                    "memory_queue",
-                    "execution_queue",
-                    "writeback_queue",
-                ]
-                and val
-            ):
-                history = getattr(self, f"{attr}_history")
-                setattr(self, f"{attr}_history", [val] + history)
-
             if action == "pop":
-                updated = current[:-1]
-                setattr(self, attr, updated)
+                getattr(self, attr).pop()
 
             elif action == "push":
-                updated = [val] + current
-                setattr(self, attr, updated)
+                getattr(self, attr).push(val)
+
+                # ! keeping the history of all insgtructions for debugging
+                getattr(self, f"{attr}_history").appendleft(val)
 
             # this will get called every instruction fetch
             elif action == "set":
@@ -317,6 +340,21 @@ class PipelinedProcessor(Processor):
                 self.executed += 1
                 instruction.finished = True
 
+                if self.trace is not None:
+                    self.trace.commit_instruction(self.cycles, instruction, self.MEM)
+
+                if self.on_commit is not None:
+                    self.on_commit(
+                        CommitEvent(
+                            self.cycles,
+                            instruction.pc,
+                            instruction.opcode,
+                            instruction.result,
+                            register=instruction.target_register,
+                            address=instruction.target_address,
+                        )
+                    )
+
             elif action == "write_mem":
                 assert isinstance(val, Instruction)
 
@@ -324,20 +362,65 @@ class PipelinedProcessor(Processor):
                 if instruction.opcode != "sw":
                     raise RuntimeError("Error handling a memory operation")
 
-                self.MEM[instruction.target_address] = self.RF[
-                    instruction.target_register
-                ]
+                self.MEM.store(
+                    instruction.target_address, self.RF[instruction.target_register]
+                )
                 self.executed += 1
 
                 instruction.finished = True
 
+                if self.trace is not None:
+                    self.trace.commit_instruction(self.cycles, instruction, self.MEM)
+
+                if self.on_commit is not None:
+                    self.on_commit(
+                        CommitEvent(
+                            self.cycles,
+                            instruction.pc,
+                            instruction.opcode,
+                            self.RF[instruction.target_register],
+                            address=instruction.target_address,
+                        )
+                    )
+
             elif action == "branch_executed":
                 self.executed += 1
 
+                if self.trace is not None:
+                    self.trace.commit_instruction(self.cycles, val, self.MEM)
+
+                if self.on_commit is not None:
+                    self.on_commit(CommitEvent(self.cycles, val.pc, val.opcode, None))
+
             else:
                 raise RuntimeError(f"Update type {action} not implemented")
 
+        # make the staged queue changes visible
+        self.instruction_queue.tick()
+        self.execution_queue.tick()
+        self.memory_queue.tick()
+        self.writeback_queue.tick()
+
+    def fetch_events(self, update_IF):
+        for action, attr, i in update_IF:
+            if action == "push":
+                self.on_fetch(FetchEvent(self.cycles, i.pc, i.decoded.opcode))
+
+    def details(self):
+        return {"stalls": self.num_stalls}
+
+    def tables(self):
+        rows = [
+            [name, i.pc, self.image[i.pc].text]
+            for name in ["instruction_queue", "execution_queue", "memory_queue", "writeback_queue"]
+            for i in getattr(self, name)
+        ]
+
+        return {"QUEUES": (["queue", "pc", "instruction"], rows)}
+
     def print_stats(self):
+        import click
+        from columnar import columnar
 
         queue_headers = ["name"] + [
             f"clock_{i}" for i in range(self.cycles, self.cycles + 5)
@@ -362,16 +445,16 @@ class PipelinedProcessor(Processor):
                 return click.style(str(i), fg="black")
 
         i_queue = ["FETCHED"] + [
-            kek(entry) for i, entry in enumerate(self.instruction_queue_history[:5])
+            kek(entry) for i, entry in enumerate(self.instruction_queue_history)
         ]
         e_queue = ["EXECUTION QUEUE"] + [
-            kek(entry) for i, entry in enumerate(self.execution_queue_history[:5])
+            kek(entry) for i, entry in enumerate(self.execution_queue_history)
         ]
         m_queue = ["MEM ACCESS"] + [
-            kek(entry) for i, entry in enumerate(self.memory_queue_history[:5])
+            kek(entry) for i, entry in enumerate(self.memory_queue_history)
         ]
         w_queue = ["REGS UPDATED"] + [
-            kek(entry) for i, entry in enumerate(self.writeback_queue_history[:5])
+            kek(entry) for i, entry in enumerate(self.writeback_queue_history)
         ]
 
         queue_data = [i_queue, e_queue, m_queue, w_queue]
@@ -396,11 +479,55 @@ class PipelinedProcessor(Processor):
 
         print(f"MEM: {self.MEM}")
 
+        if self.cache is not None:
+            print(self.cache)
+
         print(f"Cycles completed: {self.cycles}")
         print(f"Instructions executed: {self.executed}")
         print(f"Instructions per cycle: {self.executed / self.cycles}")
 
+    """
+    Jump over cycles in which nothing moves until a load waiting on the cache gets its data. Execute and
+    writeback have nothing left, and the front end is either done with the program or decode stalled last
+    cycle. A stalled decode waits on a register of an instruction that is not finished, which can only be in
+    the memory queue behind or at the load, so it stalls in every cycle until then. All that happens meanwhile
+    is the decoder ageing its forwarded registers and the stall count, both replayed for the skipped cycles.
+    """
+
+    def skip_idle(self):
+        if (
+            len(self.execution_queue)
+            or len(self.writeback_queue)
+            or len(self.memory_queue) == 0
+        ):
+            return
+
+        drained = self.PC >= len(self.image) and not len(self.instruction_queue)
+        if not (drained or self.stalled):
+            return
+
+        if self._MEM.waiting_on is not self.memory_queue.peek():
+            return
+
+        skipped = self._MEM.ready_at - 1 - self.cycles
+        if skipped <= 0:
+            return
+
+        for _ in range(min(skipped, self.ID.entry_max_age)):
+            self.ID.tick()
+
+        self.cycles += skipped
+
+        if self.stalled:
+            self.num_stalls += skipped
+
+            if self.on_stall is not None:
+                self.on_stall(StallEvent(self.cycles, ("operands",), skipped))
+
     def cycle(self):
+        if not self.debug:
+            self.skip_idle()
+
         self.cycles += 1
 
         update_IF = self.IF.run(PC=self.PC, instruction_queue=self.instruction_queue)
@@ -412,27 +539,55 @@ class PipelinedProcessor(Processor):
         )
 
         # stall for 1 cycle
+        self.stalled = stalling
         if stalling:
             self.num_stalls += 1
             update_ID = []
             update_IF = []
 
+            if self.on_stall is not None:
+                self.on_stall(StallEvent(self.cycles, ("operands",)))
+
         # refetch the instruction if there is a branch
         for action, attr, i in update_ID:
             if action == "set":
                 pc = i
+
+                # the sequential fetch of this cycle is thrown away
+                if self.on_fetch is not None:
+                    self.fetch_events(update_IF)
+
+                if self.on_flush is not None:
+                    self.on_flush(FlushEvent(self.cycles, pc, 1 if update_IF else 0))
+
                 # new fetch
                 update_IF = self.IF.run(PC=pc, instruction_queue=self.instruction_queue)
                 # do not duplicate the PC update
                 update_ID = update_ID[:-1]
 
+        if self.on_fetch is not None:
+            self.fetch_events(update_IF)
+
+        if self.on_issue is not None:
+            for action, attr, i in update_ID:
+                if action == "push":
+                    self.on_issue(IssueEvent(self.cycles, i.pc, i.opcode))
+
         update_EX = self.EX.run(
             execution_queue=self.execution_queue,
             memory_queue=self.memory_queue,
             writeback_queue=self.writeback_queue,
         )
 
-        update_MEM = self._MEM.run(MEM=self.MEM, memory_queue=self.memory_queue)
+        if self.on_execute is not None:
+            for action, attr, i in update_EX:
+                if action == "push":
+                    self.on_execute(ExecuteEvent(self.cycles, i.pc, i.opcode, i.result))
+                    break
+
+        update_MEM = self._MEM.run(
+            MEM=self.MEM, memory_queue=self.memory_queue, cycle=self.cycles
+        )
 
         update_WB = self.WB.run(RF=self.RF, writeback_queue=self.writeback_queue)
 
@@ -442,6 +597,11 @@ class PipelinedProcessor(Processor):
             if action == "push" and i.result:
                 self.ID.bypass(pair=(i.target_register, i.result))
 
+                if self.on_broadcast is not None:
+                    self.on_broadcast(
+                        BroadcastEvent(self.cycles, i.target_register, i.result)
+                    )
+
         # processor state update
         updates = update_IF + update_ID + update_EX + update_MEM + update_WB
         self.tick(updates)
@@ -1,24 +1,61 @@
 import re
 import sys
+import assembler
 from instruction import *
+from memory import Memory
+from observers import bind_hooks
 
 
 class Processor:
-    def __init__(self, program, symbols, debug=False):
+    # False for a processor that runs whole instructions without a pipeline, it has no events to report
+    cycle_accurate = True
+
+    def __init__(self, program, symbols, debug=False, trace=None, observers=()):
         self.symbols = symbols
         self.program = program
 
         self.PC = 0
 
-        self.MEM = []
+        self.MEM = Memory()
 
         self.cycles = 0
         self.executed = 0
         self.num_stalls = 0
         self.resolve_labels()
 
+        # decoded once, every processor fetches from here
+        self.image = assembler.predecode(self.program, self.symbols)
+
         self.debug = debug
 
+        # optional commit trace writer, see commit_trace.py
+        self.trace = trace
+
+        # one hook per event, None unless an observer listens to it, see observers.py
+        self.observers = list(observers)
+        self.bind_observers()
+
+    def bind_observers(self):
+        hooks = bind_hooks(self.observers)
+        self.on_fetch = hooks["fetch"]
+        self.on_decode = hooks["decode"]
+        self.on_issue = hooks["issue"]
+        self.on_dispatch = hooks["dispatch"]
+        self.on_execute = hooks["execute"]
+        self.on_writeback = hooks["writeback"]
+        self.on_broadcast = hooks["broadcast"]
+        self.on_commit = hooks["commit"]
+        self.on_flush = hooks["flush"]
+        self.on_stall = hooks["stall"]
+
+    """
+    Add an observer to a processor that is already built, e.g. one returned by fast_forward
+    """
+
+    def attach(self, observer):
+        self.observers.append(observer)
+        self.bind_observers()
+
     def resolve_labels(self):
         clean_program = []
         # PC_offset = 0
@@ -28,7 +65,7 @@ class Processor:
                 values = [int(x) for x in line.split()[1:]]
 
                 addr = len(self.MEM)
-                self.MEM += values
+                self.MEM.write_block(addr, values)
                 self.symbols[label] = addr  # bottom address of label
                 # PC_offset += 1
 
@@ -44,5 +81,50 @@ class Processor:
     def running(self):
         return self.RF[31] != 1
 
+    def run(self):
+        # simulate until the program halts
+        while self.running():
+            self.cycle()
+
+    """
+    Take over architectural state, e.g. from a fast forwarded functional run
+    """
+
+    def restore(self, RF, MEM, PC):
+        self.RF[: len(RF)] = RF
+        memory = MEM.copy() if isinstance(MEM, Memory) else Memory.from_values(MEM)
+        self.MEM = memory.counting() if self.MEM.count else memory
+        self.PC = PC
+
+    """
+    Count the loads and stores of every page of the data memory from now on, see memory.py. Off by default,
+    counting costs every access
+    """
+
+    def count_memory(self):
+        if not self.MEM.count:
+            self.MEM = self.MEM.counting()
+
+    def reset_stats(self):
+        self.cycles = 0
+        self.executed = 0
+        self.num_stalls = 0
+        self.MEM.reset_counters()
+
+    """
+    The buffers of the processor as name -> (header, rows), plain values only so the debugger can keep them
+    around cheaply and render them later
+    """
+
+    def tables(self):
+        return {}
+
+    """
+    Stats only this kind of processor keeps, plain values only, see simulation.details
+    """
+
+    def details(self):
+        return {}
+
     def print_stats(self):
         pass
@@ -0,0 +1,25 @@
+; int X[1] = {0}
+; int sum = 0, copies = 0
+; for (int i = 1; i <= 1500; i++) {
+;   X[0] = i;
+;   sum += X[0];
+;   copies += X[0];
+; }
+;
+; two loads and a store an iteration, enough to go round the load store queue of the scheduled processor
+; more than twice, and every load has to be forwarded the value of the store just before it
+
+.X: 0
+
+    addi $0 $0 1500         ; int n = 1500
+
+loop:
+    addi $1 $1 1            ; i++
+    sw $1 X($2)             ; X[0] = i
+    lw $3 X($2)             ; $3 = X[0]
+    add $4 $4 $3            ; sum += X[0]
+    lw $5 X($2)             ; $5 = X[0]
+    add $6 $6 $5            ; copies += X[0]
+    blt $1 $0 loop          ; if (i < n) loop again
+
+    addi $31 $31 1          ; set register 31 to 1 (halt)
@@ -0,0 +1,21 @@
+; registers and memory hold integers of any width, the results here do not fit in 64 bits
+;
+; long a = 2^32
+; long b = a * a           = 2^64
+; long c = b * b           = 2^128
+; A[0] = c
+; long d = A[0] - 1
+; float e = c / 2          = 2^127
+
+.A: 0
+
+    addi $1 $1 4294967296   ; a = 2^32
+    mul $2 $1 $1            ; b = a * a
+    mul $3 $2 $2            ; c = b * b
+    sw $3 A($0)             ; A[0] = c
+    lw $4 A($0)             ; $4 = A[0]
+    addi $4 $4 -1           ; d = A[0] - 1
+    addi $5 $5 2
+    div $6 $3 $5            ; e = c / 2
+
+    addi $31 $31 1          ; set register 31 to 1 (halt)
@@ -0,0 +1,71 @@
+import importlib
+
+"""
+Everything the command line picks by name. Entries are "module:attribute" strings, so reading the registry
+imports nothing and a run only imports the processor and the reporter it uses. Keeps main.py quick to start,
+which adds up over thousands of short runs.
+"""
+
+processors = {
+    "simple": "simple_processor:SimpleProcessor",
+    "pipelined": "pipelined_processor:PipelinedProcessor",
+    "scheduled": "scheduled_processor:ScheduledProcessor",
+    "functional": "functional_processor:FunctionalProcessor",
+}
+
+# the methods of the scheduled processor's Predictor, the other processors accept the name and ignore it
+predictors = {
+    "taken": "taken once the branch is in the target buffer",
+    "not_taken": "never taken, every branch flushes",
+    "one_bit": "the last outcome of the branch",
+    "two_bit": "a two bit saturating counter per branch",
+    "gshare": "two bit counters indexed by pc xor global history",
+    "tournament": "a chooser per branch picks gshare or a bimodal counter",
+}
+
+# the replacement policies of the data cache, main.py lists them without importing cache.py
+cache_policies = {
+    "lru": "cache:LRU",
+    "plru": "cache:PLRU",
+    "random": "cache:Random",
+}
+
+# what is printed once the run is over, see reporters.py
+reporters = {
+    "stats": "reporters:stats",
+    "summary": "reporters:summary",
+    "json": "reporters:json_report",
+}
+
+timeline_writers = {
+    "chrome": "timeline:ChromeTraceWriter",
+    "konata": "timeline:KonataWriter",
+}
+
+
+def load(entry):
+    module, _, attribute = entry.partition(":")
+    return getattr(importlib.import_module(module), attribute)
+
+
+def lookup(table, name, kind):
+    if name not in table:
+        raise RuntimeError(f"{kind} {name} not implemented")
+
+    return load(table[name])
+
+
+def processor(name):
+    return lookup(processors, name, "Processor type")
+
+
+def cache_policy(name):
+    return lookup(cache_policies, name, "Replacement policy")
+
+
+def reporter(name):
+    return lookup(reporters, name, "Reporter")
+
+
+def timeline_writer(name):
+    return lookup(timeline_writers, name, "Timeline format")
@@ -0,0 +1,68 @@
+from tests import tests
+
+"""
+What main.py prints once the run is over, picked with --report. Each reporter takes the processor and the
+program file. The presentation libraries are imported inside the reporter that uses them, so a run that only
+wants a number never pays for click and columnar.
+
+    stats      the stats tables of the processor, the program and the test result, in colour
+    summary    one plain line, cycles, instructions, CPI and the test result
+    json       the stats of simulation.py as JSON, for scripts
+
+With --memory-counters the stats and json reports also have the loads and stores of every memory page.
+"""
+
+
+def check(cpu, filename):
+    # None if tests.py has no check for the program
+    test = tests.get(filename)
+    return None if test is None else test(cpu)
+
+
+def stats(cpu, filename):
+    import click
+
+    passed = check(cpu, filename)
+    if passed is None:
+        test_result = "NO TEST"
+    else:
+        test_result = (
+            click.style("PASSED", fg="green")
+            if passed
+            else click.style("FAILED", fg="red")
+        )
+
+    cpu.print_stats()
+    if cpu.MEM.count:
+        print(cpu.MEM.describe())
+    print({i: line for i, line in enumerate(cpu.program)})
+    print(f"\nTEST RESULT: {test_result}\n")
+
+
+def summary(cpu, filename):
+    passed = check(cpu, filename)
+    result = {None: "NO TEST", True: "PASSED", False: "FAILED"}[passed]
+    cpi = cpu.cycles / cpu.executed if cpu.executed else float("inf")
+
+    print(
+        f"{filename} {type(cpu).__name__} cycles={cpu.cycles} executed={cpu.executed} cpi={cpi:.3f} {result}"
+    )
+
+
+def json_report(cpu, filename):
+    import json
+    from simulation import details
+
+    print(
+        json.dumps(
+            {
+                "program": filename,
+                "processor": type(cpu).__name__,
+                "cycles": cpu.cycles,
+                "executed": cpu.executed,
+                "passed": check(cpu, filename),
+                "RF": list(cpu.RF),
+                "details": details(cpu),
+            }
+        )
+    )
@@ -1,10 +1,52 @@
-import re
+import bisect
+import heapq
+from collections import Counter
 from typing import *
 from processor import Processor
-from columnar import columnar
+from memory import Memory
+from latch import Latch
+from assembler import DecodedInstruction
+from functional_units import unit_kinds
+from stage_profile import timed
+from pipeline_counters import (
+    PipelineCounters,
+    ROB_FULL,
+    RS_FULL,
+    OPERANDS,
+    UNITS_BUSY,
+    LSQ_ORDERING,
+    FLUSH,
+    ISSUED,
+    RS_DISPATCHED,
+    LSQ_DISPATCHED,
+    ANY_STALL,
+    stall_reasons,
+)
+from observers import (
+    FetchEvent,
+    DecodeEvent,
+    IssueEvent,
+    DispatchEvent,
+    ExecuteEvent,
+    WritebackEvent,
+    BroadcastEvent,
+    CommitEvent,
+    FlushEvent,
+    StallEvent,
+)
 
 
 class Instruction:
+    __slots__ = (
+        "opcode",
+        "target_register",
+        "source_reg1",
+        "source_reg2",
+        "immediate",
+        "fetched_at_pc",
+        "prediction",
+    )
+
     def __str__(self):
         if self.opcode in ["lw", "sw"]:
             if self.opcode == "lw":
@@ -27,6 +69,7 @@ class Instruction:
         source_reg2,
         immediate,
         fetched_at_pc,
+        prediction=None,
     ):
         self.opcode = opcode
         self.target_register = target_register
@@ -34,6 +77,7 @@ class Instruction:
         self.source_reg2 = source_reg2
         self.immediate = immediate
         self.fetched_at_pc = fetched_at_pc
+        self.prediction = prediction  # what the history predictors guessed at fetch
 
     def writes_regs(self):
         if self.is_store():
@@ -57,6 +101,17 @@ class Instruction:
 
 
 class ReorderBufferEntry:
+    __slots__ = (
+        "opcode",
+        "destination",
+        "value",
+        "fetched_at_pc",
+        "pc",
+        "done",
+        "prediction",
+        "id",
+    )
+
     def __str__(self):
         return f"ROB Entry for op: {self.opcode}, dest: {self.destination}, val:{'Not ready' if self.value is None else self.value}"
 
@@ -70,6 +125,7 @@ class ReorderBufferEntry:
         self.fetched_at_pc = fetched_at_pc
         self.pc = None  # the place in the program from where we should fetch the next instruction
         self.done = done
+        self.prediction = None
         # self.dispatched = False
         # self.allowed = 1
         # self.counter = 0
@@ -79,6 +135,8 @@ class ReorderBufferEntry:
 
 class ReorderBuffer:
     def __str__(self):
+        from columnar import columnar
+
         data = []
         header = [
             "commit pointer",
@@ -109,19 +167,34 @@ class ReorderBuffer:
 
         return f"REORDER BUFFER\n{rob_table}"
 
-    def __init__(self):
-        self.entries = [None] * 32  # equal to number of registers
+    def __init__(self, size=32):
+        self.entries = [None] * size  # equal to number of registers
+
+        self.commit_pointer = 0
+        self.issue_pointer = 0
+
+        self.allocated = 0  # entries added since the last reset
+        self.occupied = 0  # entries issued and not committed yet
+
+    """
+    Squash everything in flight, only the slots used since the last reset are cleared
+    """
+
+    def reset(self):
+        used = min(self.allocated, len(self.entries))
+        self.entries[:used] = [None] * used
 
         self.commit_pointer = 0
         self.issue_pointer = 0
 
+        self.allocated = 0
+        self.occupied = 0
+
     def lookup(self, ix):
         return self.entries[ix]
 
     def is_available(self):
-        return True
-        occupied = len([e for e in self.entries if e is not None and e.destination])
-        return occupied < len(self.entries)
+        return self.occupied < len(self.entries)
 
     def add(self, instruction: Instruction, pc: int) -> Tuple[ReorderBufferEntry, int]:
 
@@ -139,6 +212,8 @@ class ReorderBuffer:
             done=False,
         )
 
+        entry.prediction = instruction.prediction
+
         # note down the next pc we should fetch after this instruction
         if instruction.is_branch():
             entry.pc = instruction.immediate
@@ -151,6 +226,8 @@ class ReorderBuffer:
         entry_pointer = self.issue_pointer
 
         self.issue_pointer += 1
+        self.allocated += 1
+        self.occupied += 1
 
         if self.issue_pointer == len(self.entries):
             self.issue_pointer = 0
@@ -177,6 +254,7 @@ class ReorderBuffer:
 
     def free(self):
 
+        self.occupied -= 1
         self.commit_pointer += 1
 
         if self.commit_pointer == len(self.entries):
@@ -249,6 +327,20 @@ class RegisterFile:
 
 
 class LoadStoreQueueEntry:
+    __slots__ = (
+        "opcode",
+        "dest_tag",
+        "target_address",
+        "offset",
+        "tag_base",
+        "base",
+        "tag_value",
+        "value",
+        "dispatched",
+        "id",
+        "seq",
+    )
+
     def __str__(self):
         return f"LSQ Entry for op: {self.opcode}, target_address: {self.target_address}, rob_pointer: {self.dest_tag}"
 
@@ -272,24 +364,23 @@ class LoadStoreQueueEntry:
 
         # metadata
         self.dispatched = False
-        self.id = None
+        self.id = None  # slot in the queue
+        self.seq = None  # age, slots are reused once the queue goes round
 
-    def is_ready(self, queue):
+    def is_ready(self, lsq):
         # load is ready if there are no previous stores in the queue with the same address
         # or if
         if self.opcode == "lw":
 
+            # an older store without an address yet could be writing to ours
+            if lsq.unresolved_older_store(self):
+                return False
+
             # see if there is any previous stores with a matching address
-            prev_stores = [
-                e
-                for e in queue[: self.id]
-                if e is not None
-                and e.target_address == self.target_address
-                and e.opcode == "sw"
-            ]
+            prev_store = lsq.youngest_older_store(self)
 
             # if there are no previous stores we need to hit the memory if we have an address
-            if not prev_stores:
+            if prev_store is None:
                 return self.target_address is not None and not self.dispatched
 
             # todo otherwise we wait for an address to be forwarded to us
@@ -319,6 +410,8 @@ Integrates an address unit
 
 class LoadStoreQueue:
     def __str__(self):
+        from columnar import columnar
+
         data = []
         header = [
             "commit pointer",
@@ -359,7 +452,7 @@ class LoadStoreQueue:
                         e.base,
                         e.tag_value,
                         e.value,
-                        e.is_ready(self.entries),
+                        e.is_ready(self),
                         e.dispatched,
                     ]
                 )
@@ -368,43 +461,118 @@ class LoadStoreQueue:
 
         return f"LOAD STORE QUEUE\n{lsq_table}"
 
-    def __init__(self):
-        self.entries = [None] * 2048
+    def __init__(self, size=2048):
+        self.entries = [None] * size
+        self.commit_pointer = 0
+        self.issue_pointer = 0
+
+        # entries ever added and freed, the seq of an entry is the number added before it. Slot ids start
+        # again from 0 every time the ring goes round so only the seq tells which of two entries is older
+        self.allocated = 0
+        self.freed = 0
+
+        # address -> (seq, id) of the live stores and loads with that target address, oldest first
+        self.stores_by_address: Dict[Optional[int], List[Tuple[int, int]]] = {}
+        self.loads_by_address: Dict[Optional[int], List[Tuple[int, int]]] = {}
+
+        # rob tag -> ids of the entries that have an operand tagged with it
+        self.waiting: Dict[int, Set[int]] = {}
+
+        # ids of the entries not dispatched yet, oldest first
+        self.pending: List[int] = []
+
+        # loads whose store forwarding has to be worked out again
+        self.dirty: Set[int] = set()
+
+    """
+    Squash everything in flight, only the live entries are visited
+    """
+
+    def reset(self):
+        for by_address in [self.stores_by_address, self.loads_by_address]:
+            for ixs in by_address.values():
+                for _, ix in ixs:
+                    self.entries[ix] = None
+
         self.commit_pointer = 0
         self.issue_pointer = 0
+        self.freed = self.allocated
+
+        self.stores_by_address = {}
+        self.loads_by_address = {}
+        self.waiting = {}
+        self.pending = []
+        self.dirty = set()
+
+    def index(self, by_address, e: LoadStoreQueueEntry):
+        bisect.insort(by_address.setdefault(e.target_address, []), (e.seq, e.id))
+
+    def unindex(self, by_address, e: LoadStoreQueueEntry):
+        ixs = by_address[e.target_address]
+        ixs.remove((e.seq, e.id))
+        if not ixs:
+            del by_address[e.target_address]
+
+    # ids of the loads to the address that are younger than the entry with this seq
+    def younger_loads(self, address, seq):
+        loads = self.loads_by_address.get(address, [])
+        return [ix for _, ix in loads[bisect.bisect_left(loads, (seq + 1,)) :]]
+
+    def youngest_older_store(self, load: LoadStoreQueueEntry):
+        stores = self.stores_by_address.get(load.target_address)
+        if not stores:
+            return None
+
+        pos = bisect.bisect_left(stores, (load.seq,))
+        if pos == 0:
+            return None
+
+        return self.entries[stores[pos - 1][1]]
+
+    def unresolved_older_store(self, load: LoadStoreQueueEntry):
+        stores = self.stores_by_address.get(None)
+        return bool(stores) and stores[0][0] < load.seq
 
     # performs load store forwarding
     def forward_store(self, lsq_entry_to_commit: LoadStoreQueueEntry, value):
-        next_entries = [
-            e
-            for e in self.entries[lsq_entry_to_commit.id :]
-            if e is not None and e.opcode == "lw"
-        ]
-
-        for e in next_entries:
-            if e.target_address == lsq_entry_to_commit.target_address:
-                e.value = value
+        for ix in self.younger_loads(
+            lsq_entry_to_commit.target_address, lsq_entry_to_commit.seq
+        ):
+            self.entries[ix].value = value
 
     """
     This can hydrate the base and produce a target address or a value for the store instruction
     """
 
     def capture(self, tag, value):
-        # iterate over the entries, check both tags and set the correspoding value, while unsetting the tag
-        for e in [e for e in self.entries if e is not None]:
-            if (
-                e.tag_base is not None
-                and e.tag_value is not None
-                and e.tag_base == e.tag_value
-            ):
-                raise RuntimeError("Tags match, reimplement")
+        # only visit the entries waiting on this tag, set the correspoding value
+        # once captured they stop listening, a later instruction may reuse the rob tag
+        for ix in self.waiting.pop(tag, ()):
+            e = self.entries[ix]
 
             if e.opcode == "sw" and e.tag_value == tag:
                 e.value = value
+                self.dirty.update(self.younger_loads(e.target_address, e.seq))
+
             if e.tag_base == tag:
-                self.entries[e.id].base = value
+                by_address = (
+                    self.stores_by_address if e.opcode == "sw" else self.loads_by_address
+                )
+                self.unindex(by_address, e)
+
+                if e.opcode == "sw":
+                    self.dirty.update(self.younger_loads(e.target_address, e.seq))
+
+                e.base = value
                 e.target_address = value + e.offset
 
+                self.index(by_address, e)
+
+                if e.opcode == "sw":
+                    self.dirty.update(self.younger_loads(e.target_address, e.seq))
+                else:
+                    self.dirty.add(e.id)
+
     def lookup(self, ix):
         return self.entries[ix]
 
@@ -473,10 +641,30 @@ class LoadStoreQueue:
                 value=value,
             )
 
+        if (
+            entry.tag_base is not None
+            and entry.tag_value is not None
+            and entry.tag_base == entry.tag_value
+        ):
+            raise RuntimeError("Tags match, reimplement")
+
         entry.id = self.issue_pointer
+        entry.seq = self.allocated
         self.entries[self.issue_pointer] = entry
         entry_pointer = self.issue_pointer
 
+        if entry.opcode == "sw":
+            self.index(self.stores_by_address, entry)
+        else:
+            self.index(self.loads_by_address, entry)
+            self.dirty.add(entry.id)
+
+        for tag in {entry.tag_base, entry.tag_value} - {None}:
+            self.waiting.setdefault(tag, set()).add(entry.id)
+
+        self.pending.append(entry.id)
+
+        self.allocated += 1
         self.issue_pointer += 1
 
         if self.issue_pointer == len(self.entries):
@@ -484,50 +672,69 @@ class LoadStoreQueue:
 
         return entry
 
-    # sometimes loads are added to the queue after the stores have comitted. we need to try to hydrate every store on the queue
+    # sometimes loads are added to the queue after the stores have comitted. we need to try to hydrate every load
+    # whose address, or an older store to that address, changed since the last time
     def hydrate_loads(self):
-        # for every uncommitted load, call hydrate with preious store
-        loads = [
-            e
-            for e in self.entries
-            if e is not None and e.opcode == "lw" and e.id >= self.commit_pointer
-        ]
+        for ix in self.dirty:
+            load = self.entries[ix]
 
-        for load in loads:
-            prev_stores = [
-                e for e in self.entries[: load.id] if e is not None and e.opcode == "sw"
-            ]
+            # without an address there is nothing to forward from, stores with no address are not a match
+            if load.target_address is None:
+                load.value = None
+                continue
 
-            if prev_stores:
-                for store in prev_stores:
-                    if load.target_address == store.target_address:
-                        load.value = store.value
+            store = self.youngest_older_store(load)
 
-            # self.forward_store(load, load.value)
+            if store is not None:
+                load.value = store.value
 
-    def get_next_ready(self):
+        self.dirty.clear()
+
+    def occupancy(self):
+        return self.allocated - self.freed
+
+    def has_ready(self):
         self.hydrate_loads()
 
-        ready_entry_ixs = [
-            i
-            for i, e in enumerate(self.entries)
-            if e is not None and e.is_ready(self.entries)
-        ]
+        return any(self.entries[ix].is_ready(self) for ix in self.pending)
 
-        if not ready_entry_ixs:
-            return None
+    def get_next_ready(self):
+        self.hydrate_loads()
 
-        ix = ready_entry_ixs[0]
-        first = self.entries[ix]
+        for ix in self.pending:
+            first = self.entries[ix]
 
-        self.entries[ix].dispatched = True
+            if first.is_ready(self):
+                first.dispatched = True
+                self.pending.remove(ix)
 
-        return first
+                return first
+
+        return None
 
     def free(self):
+        entry = self.entries[self.commit_pointer]
+
+        if entry.opcode == "sw":
+            self.unindex(self.stores_by_address, entry)
+            self.dirty.update(self.younger_loads(entry.target_address, entry.seq))
+        else:
+            self.unindex(self.loads_by_address, entry)
+            self.dirty.discard(entry.id)
+
+        for tag in {entry.tag_base, entry.tag_value} - {None}:
+            waiting = self.waiting.get(tag)
+            if waiting is not None:
+                waiting.discard(entry.id)
+                if not waiting:
+                    del self.waiting[tag]
+
+        if entry.id in self.pending:
+            self.pending.remove(entry.id)
 
         self.entries[self.commit_pointer] = None
 
+        self.freed += 1
         self.commit_pointer += 1
 
         if self.commit_pointer == len(self.entries):
@@ -535,6 +742,17 @@ class LoadStoreQueue:
 
 
 class ReservationStationEntry:
+    __slots__ = (
+        "opcode",
+        "dest_tag",
+        "tag1",
+        "tag2",
+        "val1",
+        "val2",
+        "id",
+        "latency",
+    )
+
     def __str__(self):
         return f"RS Entry for op: {self.opcode}, rob_tag: {self.dest_tag}, tag1: {self.tag1}, tag2: {self.tag2}, val1: {self.val1}, val2: {self.val2}"
 
@@ -551,6 +769,10 @@ class ReservationStationEntry:
         self.val1 = val1  # source reg 1
         self.val2 = val2  # source reg 2 OR immediate
 
+        # metadata
+        self.id = None  # slot in the reservation station
+        self.latency = 1  # set by the functional unit it is dispatched to
+
         # self.dispatched = False
         # self.allowed = 1
         # self.counter = 0
@@ -561,6 +783,8 @@ class ReservationStationEntry:
 
 class ReservationStation:
     def __str__(self):
+        from columnar import columnar
+
         data = []
         header = [
             "opcode",
@@ -585,17 +809,46 @@ class ReservationStation:
 
         return f"RESERVATION STATION\n{rs_table}"
 
-    def __init__(self):
-        self.entries = [None] * 265
+    def __init__(self, size=265):
+        self.entries = [None] * size
+
+        # min-heaps of slot indices, the lowest slot is always taken first
+        self.free_slots = list(range(size))
+        self.ready_slots = []
+
+        # rob tag -> slots of the entries that have an operand tagged with it
+        self.waiting: Dict[int, Set[int]] = {}
+
+        self.occupied: Set[int] = set()
+
+    """
+    Squash everything in flight, only the occupied slots are visited
+    """
+
+    def reset(self):
+        for ix in self.occupied:
+            self.entries[ix] = None
+            heapq.heappush(self.free_slots, ix)
+
+        self.occupied = set()
+        self.ready_slots = []
+        self.waiting = {}
 
     def capture(self, tag, value):
-        # iterate over the entries, check both tags and set the correspoding value, while unsetting the tag
-        for e in [e for e in self.entries if e is not None]:
+        # only visit the entries waiting on this tag, set the correspoding value
+        # once captured they stop listening, a later instruction may reuse the rob tag
+        for ix in self.waiting.pop(tag, ()):
+            e = self.entries[ix]
+            was_ready = e.is_ready()
+
             if e.tag1 == tag:
                 e.val1 = value
             if e.tag2 == tag:
                 e.val2 = value
 
+            if not was_ready and e.is_ready():
+                heapq.heappush(self.ready_slots, ix)
+
     def add(
         self,
         instruction: Instruction,
@@ -618,32 +871,67 @@ class ReservationStation:
                 instruction.opcode, rob_pointer, t1, t2, v1, v2
             )
 
-        # loop over and look for empty slot
-        if None in self.entries:
-            ix = self.entries.index(None)
+        # take the lowest empty slot
+        if self.free_slots:
+            ix = heapq.heappop(self.free_slots)
+            entry.id = ix
             self.entries[ix] = entry
+            self.occupied.add(ix)
+
+            for tag in {entry.tag1, entry.tag2} - {None}:
+                self.waiting.setdefault(tag, set()).add(ix)
+
+            if entry.is_ready():
+                heapq.heappush(self.ready_slots, ix)
 
         return entry
 
-    def get_next_ready(self):
-        ready_entry_ixs = [
-            i for i, e in enumerate(self.entries) if e is not None and e.is_ready()
-        ]
+    """
+    Take the lowest ready slot. With accept only entries it returns True for are taken, the rest stay ready
+    """
 
-        if not ready_entry_ixs:
+    def get_next_ready(self, accept=None):
+        if not self.ready_slots:
             return None
 
-        ix = ready_entry_ixs[0]
+        if accept is None:
+            ix = heapq.heappop(self.ready_slots)
+        else:
+            # the heap is only ordered at the top, pop until an entry can go
+            skipped = []
+            ix = None
+            while self.ready_slots:
+                candidate = heapq.heappop(self.ready_slots)
+                if accept(self.entries[candidate].opcode):
+                    ix = candidate
+                    break
+                skipped.append(candidate)
+
+            for candidate in skipped:
+                heapq.heappush(self.ready_slots, candidate)
+
+            if ix is None:
+                return None
+
         first = self.entries[ix]
 
         # free the station
         self.entries[ix] = None
+        self.occupied.discard(ix)
+        heapq.heappush(self.free_slots, ix)
+
+        for tag in {first.tag1, first.tag2} - {None}:
+            waiting = self.waiting.get(tag)
+            if waiting is not None:
+                waiting.discard(ix)
+                if not waiting:
+                    del self.waiting[tag]
 
         return first
 
 
 class Predictor:
-    def __init__(self, prediction_method: str):
+    def __init__(self, prediction_method: str, history_bits=8, table_size=1024):
         self.predicted_pc = None
 
         self.prediction_method = prediction_method
@@ -658,6 +946,19 @@ class Predictor:
 
         self.branch_distances = []
 
+        # global history predictors, two bit saturating counters starting weakly not taken
+        self.table_size = table_size
+        self.history_mask = (1 << history_bits) - 1
+        self.history = 0  # speculative, shifted at fetch
+        self.retired_history = 0  # shifted at commit, the history is restored from it on a miss
+
+        self.pht: List[int] = [1] * table_size  # gshare, indexed by pc xor history
+        self.bimodal: List[int] = [1] * table_size  # indexed by pc
+        self.chooser: List[int] = [1] * table_size  # tournament, 2 and 3 pick gshare
+
+        # guess of the last predict call for the history predictors, travels with the instruction to commit
+        self.last_prediction = None
+
     def not_taken(self, pc):
 
         predicted_pc = pc + 1
@@ -668,7 +969,47 @@ class Predictor:
         return predicted_pc
 
     def taken(self, pc):
-        raise RuntimeError("not implemented")
+        # branches are only known once they are in the btb, the rest fall through
+        if pc not in self.btb:
+            self.last_prediction = None
+            return pc + 1
+
+        self.last_prediction = True
+        return self.btb[pc]
+
+    def gshare(self, pc):
+        return self.predict_with_history(pc)
+
+    def tournament(self, pc):
+        return self.predict_with_history(pc)
+
+    def predict_with_history(self, pc):
+        if pc not in self.btb:
+            self.last_prediction = None
+            return pc + 1
+
+        gshare_ix = (pc ^ self.history) % self.table_size
+        bimodal_ix = pc % self.table_size
+
+        gshare_taken = self.pht[gshare_ix] >= 2
+        bimodal_taken = self.bimodal[bimodal_ix] >= 2
+
+        if self.prediction_method == "tournament" and self.chooser[bimodal_ix] < 2:
+            taken = bimodal_taken
+        else:
+            taken = gshare_taken
+
+        self.history = ((self.history << 1) | taken) & self.history_mask
+
+        self.last_prediction = (
+            gshare_ix,
+            bimodal_ix,
+            gshare_taken,
+            bimodal_taken,
+            taken,
+        )
+
+        return self.btb[pc] if taken else pc + 1
 
     def one_bit(self, pc):
 
@@ -705,11 +1046,57 @@ class Predictor:
 
         return sum(distances) / len(distances)
 
+    def reset_stats(self):
+        # keep the tables, forget what was counted so far
+        self.predicted = 0
+        self.misses = 0
+        self.branch_distances = []
+
     def prediction_accuracy(self):
         if self.predicted == 0:
             return 1
         return 1 - (self.misses / self.predicted)
 
+    """
+    Train the history predictors with the outcome of a committed branch, unlike the bimodal schemes above
+    the counters are updated on every branch, using the guess the instruction carried from fetch
+    """
+
+    def check_with_history(self, rob_entry: ReorderBufferEntry, taken):
+        # the target of a branch never changes, remember it so the branch can be predicted next time
+        self.btb[rob_entry.fetched_at_pc] = rob_entry.pc
+
+        if rob_entry.prediction is None:
+            # not in the btb at fetch, fell through
+            return not taken
+
+        (
+            gshare_ix,
+            bimodal_ix,
+            gshare_taken,
+            bimodal_taken,
+            predicted_taken,
+        ) = rob_entry.prediction
+
+        self.pht[gshare_ix] = self.saturate(self.pht[gshare_ix], taken)
+
+        if self.prediction_method == "tournament":
+            self.bimodal[bimodal_ix] = self.saturate(self.bimodal[bimodal_ix], taken)
+
+            # move the chooser towards whichever was right when they disagree
+            if gshare_taken != bimodal_taken:
+                self.chooser[bimodal_ix] = self.saturate(
+                    self.chooser[bimodal_ix], gshare_taken == taken
+                )
+
+        self.retired_history = ((self.retired_history << 1) | taken) & self.history_mask
+
+        return predicted_taken == taken
+
+    @staticmethod
+    def saturate(counter, up):
+        return min(counter + 1, 3) if up else max(counter - 1, 0)
+
     """
     Returns the updated bit and wether we should switch the prediction
     """
@@ -783,6 +1170,23 @@ class Predictor:
                 self.misses += 1
                 success = False
 
+            if self.prediction_method == "taken":
+                # fetch only went to the target if the branch was in the btb
+                success = (rob_entry.prediction is not None) == taken
+                self.btb[rob_entry.fetched_at_pc] = rob_entry.pc
+
+                if not success:
+                    self.misses += 1
+
+            if self.prediction_method in ["gshare", "tournament"]:
+                success = self.check_with_history(rob_entry, taken)
+
+                if not success:
+                    self.misses += 1
+
+                    # everything younger is flushed, so is their history
+                    self.history = self.retired_history
+
             return success, correct_pc
 
         # otherwise we are always predicting correctly
@@ -790,29 +1194,27 @@ class Predictor:
 
 
 class Decoder:
-    def __init__(self, symbols):
-        self.symbols = symbols
-
-    def decode(self, instruction_string: str, fetched_at_pc: int) -> Instruction:
-
-        # separate opcode and operand string
-        opcode = instruction_string.split()[0]
-        operand_str = instruction_string.split(opcode)[1].strip()
+    def decode(
+        self, decoded: DecodedInstruction, fetched_at_pc: int, prediction=None
+    ) -> Instruction:
 
         target_register, source_registers, immediate = self.fetch_register_names(
-            opcode, operand_str
+            decoded
         )
 
         return Instruction(
-            opcode,
+            decoded.opcode,
             target_register,
             source_registers[0],
             source_registers[1],
             immediate,
             fetched_at_pc,
+            prediction,
         )
 
-    def fetch_register_names(self, opcode, operand_str):
+    def fetch_register_names(self, decoded: DecodedInstruction):
+        opcode = decoded.opcode
+
         target_register = None
         source_registers = [None] * 2
         immediate = None
@@ -820,85 +1222,48 @@ class Decoder:
         # tag the registers with their respective roles
         if opcode in ["add", "sub", "mul", "mod", "div", "imul", "idiv"]:
 
-            operands = self.parse_operands(
-                operand_str, "^(?P<rd>\$\w*) (?P<rs>\$\w*) (?P<rt>\$\w*)$"
-            )
-
-            target_register = operands["rd"]
-            source_registers[0] = operands["rs"]
-            source_registers[1] = operands["rt"]
+            target_register = decoded.rd
+            source_registers[0] = decoded.rs
+            source_registers[1] = decoded.rt
 
         elif opcode in ["addi"]:
 
-            operands = self.parse_operands(
-                operand_str, "^(?P<rt>\$\w*) (?P<rs>\$\w*) (?P<imm>-*\d+)$"
-            )
-
-            target_register = operands["rt"]
-            source_registers[0] = operands["rs"]
-            immediate = operands["imm"]
+            target_register = decoded.rt
+            source_registers[0] = decoded.rs
+            immediate = decoded.imm
 
         elif opcode in ["lw", "sw"]:
 
-            operands = self.parse_operands(
-                operand_str, "^(?P<rt>\$\w*) *(?P<imm>\w+)\((?P<rs>\$\w*|\d*)\)$"
-            )
-
             if opcode == "lw":
-                target_register = operands["rt"]
-                source_registers[0] = operands["rs"]
-                immediate = operands["imm"]
+                target_register = decoded.rt
+                source_registers[0] = decoded.rs
+                immediate = decoded.imm
 
             if opcode == "sw":
-                source_registers[0] = operands["rt"]
-                source_registers[1] = operands["rs"]
-                immediate = operands["imm"]
+                source_registers[0] = decoded.rt
+                source_registers[1] = decoded.rs
+                immediate = decoded.imm
 
         elif opcode in ["beq", "bne", "blt", "ble"]:
 
-            operands = self.parse_operands(
-                operand_str, "^(?P<rs>\$\w*) (?P<rt>\$\w*) (?P<imm>-*\d+|\$*\w*)$"
-            )
-            source_registers[0] = operands["rs"]
-            source_registers[1] = operands["rt"]
-            immediate = operands["imm"]
+            source_registers[0] = decoded.rs
+            source_registers[1] = decoded.rt
+            immediate = decoded.imm
 
         elif opcode in ["j"]:
             # ! no source reg to worry about
-            operands = self.parse_operands(operand_str, "^(?P<imm>\w*)$")
-            immediate = operands["imm"]
+            immediate = decoded.imm
 
         elif opcode == "STALL":
             pass
 
         else:
             raise RuntimeError(
-                f"Fetching source registers of {opcode} {operand_str} -> Not implemented"
+                f"Fetching source registers of {decoded.text} -> Not implemented"
             )
 
         return target_register, source_registers, immediate
 
-    def parse_operands(self, operand_str, pattern):
-
-        match = re.match(pattern, operand_str)
-
-        if not match:
-            raise RuntimeError(
-                f"Match broken for instruction {self.opcode} {operand_str}"
-            )
-
-        operands = {}
-
-        for k, v in match.groupdict().items():
-            if v in self.symbols:
-                operands[k] = self.symbols[v]
-            elif v[0] == "$":
-                operands[k] = int(v[1:])
-            else:
-                operands[k] = int(v)
-
-        return operands
-
     @staticmethod
     def is_mem(opcode: str):
         return opcode in ["lw", "sw"]
@@ -969,158 +1334,314 @@ class ALU:
         return result
 
 
+# most entries in the decode and issue queues, any limit from two up still moves one instruction a step
+FRONT_END_QUEUE = 8
+
+
 class ScheduledProcessor(Processor):
     def __init__(
-        self, program, symbols, prediction_method, instructions_per_cycle=8, debug=False
+        self,
+        program,
+        symbols,
+        prediction_method,
+        instructions_per_cycle=8,
+        debug=False,
+        cache=None,
+        functional_units=None,
+        trace=None,
+        history_bits=8,
+        table_size=1024,
+        profile=None,
+        observers=(),
     ):
-        super().__init__(program, symbols, debug)
+        super().__init__(program, symbols, debug, trace, observers)
 
         self.RF = [0] * 33
 
         self.rf = RegisterFile()
-        self.decoder = Decoder(symbols)
-        self.predictor = Predictor(prediction_method)
+        self.decoder = Decoder()
+        self.predictor = Predictor(prediction_method, history_bits, table_size)
 
         self.alu = ALU()
 
-        self.decode_queue = []
-        self.issue_queue = []
-        self.execute_queue = []
-        self.mem_queue = []
+        # optional pool of functional units, without one every operation executes in a single step
+        self.units = functional_units
+        self.executing = []  # (cycle the result is out, rob tag, value)
+
+        # the front end holds back once the next queue is full, so a stalled issue stops fetch and decode
+        self.decode_queue = Latch(limit=FRONT_END_QUEUE)
+        self.issue_queue = Latch(limit=FRONT_END_QUEUE)
+        self.execute_queue = Latch()
+        self.mem_queue = Latch()
 
-        self.writeback_queue = []
+        self.writeback_queue = Latch()
 
         self.rob = ReorderBuffer()
         self.rs = ReservationStation()
         self.lsq = LoadStoreQueue()
 
+        # optional data cache, without one every memory access takes a single cycle
+        self.cache = cache
+        self.loads_in_flight = []  # (cycle the data arrives, rob tag, value)
+
         self.instructions_per_cycle = instructions_per_cycle
 
         self.debug = debug
-        self.finished = []
+        self.finished = Counter()  # committed instructions by opcode
 
-    def tick(self, updates):
-        for (
-            action,
-            attr,
-            val,
-        ) in updates:
+        # occupancy and stalls, sampled at the end of every cycle
+        self.counters = PipelineCounters(
+            {"rob": len(self.rob.entries), "rs": len(self.rs.entries), "lsq": len(self.lsq.entries)}
+        )
+        self.stalls = 0  # reasons seen this cycle, and which stages got something through
+        self.committed = 0  # instructions committed this cycle
+        self.refilling = False  # flushed and nothing committed since
+
+        # optional StageProfile, only then the timed cycle replaces the plain one
+        self.profile = profile
+        if profile is not None:
+            profile.start()
+            self.cycle = self.profiled_cycle
+
+    def tick(self):
+        # make the changes staged by this iteration visible
+        self.decode_queue.tick()
+        self.issue_queue.tick()
+        self.execute_queue.tick()
+        self.mem_queue.tick()
+        self.writeback_queue.tick()
 
-            # get the correct queue
-            current = getattr(self, attr)
+    def cycle(self):
+        if not self.debug:
+            self.skip_idle()
 
-            if action == "pop":
+        self.cycles += 1
 
-                updated = current[:-1]
-                setattr(self, attr, updated)
+        for _ in range(self.instructions_per_cycle):
 
-            elif action == "push":
+            self.fetch()
 
-                updated = [val] + current
-                setattr(self, attr, updated)
+            self.decode()
 
-            # this will get called every instruction fetch
-            elif action == "set":
-                setattr(self, attr, val)
+            self.issue()
 
-            else:
-                raise RuntimeError(f"Update type {action} not implemented")
+            self.dispatch()
 
-    def cycle(self):
-        self.cycles += 1
+            self.execute()
+
+            self.mem()
+
+            flushing_flag = self.writeback()
+
+            # flushed the pipeline, update nothing
+            if flushing_flag:
+                break
+
+            self.tick()
+
+            if self.debug:
+                self.print_stats()
+                txt = input("Press enter for next instruction")
+        else:
+            self.RF = self.rf.ARF
 
-        updates = []
+        self.count_cycle()
+
+    """
+    Same as cycle, with every stage timed into the profile
+    """
+
+    def profiled_cycle(self):
+        profile = self.profile
+
+        if not self.debug:
+            timed(profile, "skip_idle", self.skip_idle)
+
+        self.cycles += 1
+        profile.cycles += 1
 
         for _ in range(self.instructions_per_cycle):
 
-            fetch_update = self.fetch()
+            timed(profile, "fetch", self.fetch)
 
-            decode_update = self.decode()
+            timed(profile, "decode", self.decode)
 
-            issue_update = self.issue()
+            timed(profile, "issue", self.issue)
 
-            dispatch_update = self.dispatch()
+            timed(profile, "dispatch", self.dispatch)
 
-            execute_update = self.execute()
+            timed(profile, "execute", self.execute)
 
-            mem_update = self.mem()
+            timed(profile, "mem", self.mem)
 
-            writeback_update, flushing_flag = self.writeback()
+            flushing_flag = timed(profile, "writeback", self.writeback)
 
             # flushed the pipeline, update nothing
             if flushing_flag:
-                return
-
-            updates = (
-                fetch_update
-                + decode_update
-                + issue_update
-                + dispatch_update
-                + execute_update
-                + mem_update
-                + writeback_update
-            )
-
-            self.tick(updates)
+                break
 
+            timed(profile, "tick", self.tick)
 
             if self.debug:
                 self.print_stats()
                 txt = input("Press enter for next instruction")
+        else:
+            self.RF = self.rf.ARF
+
+        self.count_cycle()
+
+    def count_cycle(self, cycles=1):
+        stalls = self.stalls
+        if self.refilling:
+            stalls |= FLUSH
+
+        self.counters.sample(
+            self.rob.occupied,
+            len(self.rs.occupied),
+            self.lsq.occupancy(),
+            self.decode_queue.size,
+            self.issue_queue.size,
+            self.execute_queue.size,
+            self.mem_queue.size,
+            self.writeback_queue.size,
+            self.committed,
+            stalls,
+            cycles,
+        )
+
+        if self.on_stall is not None and stalls & ANY_STALL:
+            reasons = stall_reasons(stalls)
+            if reasons:
+                self.on_stall(StallEvent(self.cycles, reasons, cycles))
+
+        self.stalls = 0
+        self.committed = 0
 
-        self.RF = self.rf.ARF
     """
-        1. fetch the instruction string from the program
-        2. increment the PC
+    Jump over cycles in which no stage can do anything: fetch has run past the end of the program or its
+    queue is full, decode and issue are empty or blocked, nothing can commit or dispatch and the rest of the
+    work is waiting on multi cycle operations. That happens at the end of the program and whenever a full
+    ROB or reservation station holds up the front end. The cycle before the first operation finishes is the
+    last idle one.
+    """
+
+    def skip_idle(self):
+        if (
+            (self.PC < len(self.image) and not self.decode_queue.full())
+            or (len(self.decode_queue) and not self.issue_queue.full())
+            or len(self.execute_queue)
+            or len(self.mem_queue)
+            or len(self.writeback_queue)
+        ):
+            return
+
+        issue_blocked = 0
+        if len(self.issue_queue):
+            if not self.rob.is_available():
+                issue_blocked = ROB_FULL
+            elif not self.issue_queue.peek().is_mem() and not self.rs.free_slots:
+                issue_blocked = RS_FULL
+            else:
+                return
+
+        if self.rob.can_commit() or self.lsq.has_ready():
+            return
+
+        events = [l[0] for l in self.loads_in_flight] + [op[0] for op in self.executing]
+
+        if self.rs.ready_slots:
+            # ready operations are waiting on a busy unit
+            if self.units is None:
+                return
+
+            for ix in self.rs.ready_slots:
+                units = self.units.units[unit_kinds[self.rs.entries[ix].opcode]]
+                events.append(min(unit.free_at for unit in units))
+
+        if events and min(events) - 1 > self.cycles:
+            skipped = min(events) - 1 - self.cycles
+            self.cycles += skipped
+
+            # the skipped cycles all look like the one before them
+            self.stalls |= issue_blocked
+            if self.rs.occupied:
+                self.stalls |= UNITS_BUSY if self.rs.ready_slots else OPERANDS
+            if self.lsq.pending:
+                self.stalls |= LSQ_ORDERING
+
+            self.count_cycle(skipped)
+
+    """
+        1. fetch the predecoded instruction from the program image
+        2. increment the PC, no other stage reads it so this is not staged
 
     """
 
     def fetch(self):
-        if self.PC >= len(self.program):
-            return []
+        if self.PC >= len(self.image) or self.decode_queue.full():
+            return
 
-        if self.PC > len(self.program) or self.PC < 0:
+        if self.PC > len(self.image) or self.PC < 0:
             raise RuntimeError(
-                f"PC out of bounds. PC={self.PC} for program of length {len(self.program)}"
+                f"PC out of bounds. PC={self.PC} for program of length {len(self.image)}"
             )
 
-        instruction_string = self.program[self.PC]
+        decoded = self.image[self.PC]
         predicted_pc = self.predictor.predict(self.PC)
 
-        return [
-            ("push", "decode_queue", (instruction_string, self.PC)),
-            ("set", "PC", predicted_pc),
-        ]
+        if self.on_fetch is not None:
+            self.on_fetch(FetchEvent(self.cycles, self.PC, decoded.opcode, predicted_pc))
 
-    def decode(self):
+        self.decode_queue.push((decoded, self.PC, self.predictor.last_prediction))
+        self.PC = predicted_pc
 
-        updates = []
+    def decode(self):
 
-        if len(self.decode_queue) > 0:
+        if len(self.decode_queue) > 0 and not self.issue_queue.full():
 
-            # parse the instruction string, compose and return an instance of the instruction class with the fields
-            instruction_string, fetched_at_pc = self.decode_queue[-1]
-            updates += [("pop", "decode_queue", None)]
+            # take the predecoded entry, compose and return an instance of the instruction class with the fields
+            decoded, fetched_at_pc, prediction = self.decode_queue.peek()
+            self.decode_queue.pop()
 
             # note down the predicted pc
-            instruction = self.decoder.decode(instruction_string, fetched_at_pc)
+            instruction = self.decoder.decode(decoded, fetched_at_pc, prediction)
 
-            updates += [("push", "issue_queue", instruction)]
+            if self.on_decode is not None:
+                self.on_decode(DecodeEvent(self.cycles, fetched_at_pc, decoded.opcode))
 
-        return updates
+            self.issue_queue.push(instruction)
 
     def issue(self):
-        updates = []
 
         # if we have an available ROB and available RS entry
-        if (len(self.issue_queue) > 0) and self.rob.is_available():
+        if len(self.issue_queue) > 0:
+
+            if not self.rob.is_available():
+                self.stalls |= ROB_FULL
+                return
 
             # parse the instruction string, compose and return an instance of the instruction class with the fields
-            instruction = self.issue_queue[-1]
-            updates += [("pop", "issue_queue", None)]
+            instruction = self.issue_queue.peek()
+
+            if not instruction.is_mem() and not self.rs.free_slots:
+                self.stalls |= RS_FULL
+                return
+
+            self.issue_queue.pop()
+            self.stalls |= ISSUED
 
             # add to rob
             rob_entry, rob_entry_pointer = self.rob.add(instruction, self.PC)
+
+            if self.on_issue is not None:
+                self.on_issue(
+                    IssueEvent(
+                        self.cycles,
+                        instruction.fetched_at_pc,
+                        instruction.opcode,
+                        rob_entry_pointer,
+                    )
+                )
             # add to reservation station
             if instruction.is_mem():
                 lsq_entry = self.lsq.add(
@@ -1135,45 +1656,95 @@ class ScheduledProcessor(Processor):
             if instruction.writes_regs():
                 self.rf.remap(instruction.target_register, rob_entry_pointer)
 
-        return updates
-
     def dispatch(self):
-        updates = []
         # find instruction to dispatch from RS
-        rs_entry = self.rs.get_next_ready()
+        if self.units is None:
+            rs_entry = self.rs.get_next_ready()
+        else:
+            # only send an operation out if a unit of its kind can take it this cycle
+            rs_entry = self.rs.get_next_ready(
+                lambda opcode: self.units.available(opcode, self.cycles)
+            )
+
         lsq_entry = self.lsq.get_next_ready()
 
+        if rs_entry is not None:
+            self.stalls |= RS_DISPATCHED
+        elif self.rs.occupied:
+            self.stalls |= UNITS_BUSY if self.rs.ready_slots else OPERANDS
+
+        if lsq_entry is not None:
+            self.stalls |= LSQ_DISPATCHED
+        elif self.lsq.pending:
+            self.stalls |= LSQ_ORDERING
+
+        if self.on_dispatch is not None:
+            for entry, queue in [(rs_entry, "rs"), (lsq_entry, "lsq")]:
+                if entry is not None:
+                    self.on_dispatch(
+                        DispatchEvent(
+                            self.cycles,
+                            self.rob.lookup(entry.dest_tag).fetched_at_pc,
+                            entry.opcode,
+                            entry.dest_tag,
+                            queue,
+                        )
+                    )
+
         if rs_entry:
-            updates += [("push", "execute_queue", rs_entry)]
+            if self.units is not None:
+                rs_entry.latency = self.units.start(rs_entry.opcode, self.cycles)
 
-        if lsq_entry:
-            updates += [("push", "mem_queue", lsq_entry)]
+            self.execute_queue.push(rs_entry)
 
-        # go over both RS and LSQ and return any ready values, free up the space accordingly
-        # ready values are those with both value fields available
-        return updates
+        if lsq_entry:
+            self.mem_queue.push(lsq_entry)
 
     def execute(self):
-        updates = []
+
+        # multi cycle operations whose result is out
+        if self.executing:
+            done = [op for op in self.executing if op[0] <= self.cycles]
+            if done:
+                self.executing = [op for op in self.executing if op[0] > self.cycles]
+                for _, rob_tag, result in done:
+                    self.writeback_queue.push((rob_tag, result))
+
         if len(self.execute_queue) > 0:
 
-            rs_entry = self.execute_queue[-1]
-            updates += [("pop", "execute_queue", None)]
+            rs_entry = self.execute_queue.peek()
+            self.execute_queue.pop()
 
             rob_tag = rs_entry.dest_tag
 
             result = self.alu.execute(rs_entry)
-            updates += [("push", "writeback_queue", (rob_tag, result))]
 
-        return updates
+            if self.on_execute is not None:
+                self.execute_event(rob_tag, result)
+
+            if self.units is not None and rs_entry.latency > 1:
+                self.executing.append(
+                    (self.cycles + rs_entry.latency - 1, rob_tag, result)
+                )
+            else:
+                self.writeback_queue.push((rob_tag, result))
 
     def mem(self):
 
-        updates = []
+        # loads waiting on the cache whose data has arrived
+        if self.loads_in_flight:
+            arrived = [l for l in self.loads_in_flight if l[0] <= self.cycles]
+            if arrived:
+                self.loads_in_flight = [
+                    l for l in self.loads_in_flight if l[0] > self.cycles
+                ]
+                for _, rob_tag, result in arrived:
+                    self.writeback_queue.push((rob_tag, result))
+
         if len(self.mem_queue) > 0:
 
-            lsq_entry = self.mem_queue[-1]
-            updates += [("pop", "mem_queue", None)]
+            lsq_entry = self.mem_queue.peek()
+            self.mem_queue.pop()
 
             rob_tag = lsq_entry.dest_tag
 
@@ -1182,44 +1753,77 @@ class ScheduledProcessor(Processor):
                 # hit memory if we have to
                 if lsq_entry.value is None:
                     # loading
-                    # fetching outside of memory due to branch misprediction, ignore this because we flush in a couple of cycles
-                    if lsq_entry.target_address >= len(self.MEM):
-                        result = -420
+                    # a wrong path load can compute a negative address, whatever it reads gets flushed
+                    if lsq_entry.target_address < 0:
+                        result = 0
                     else:
-                        result = self.MEM[lsq_entry.target_address]
-
-                    updates += [("push", "writeback_queue", (rob_tag, result))]
+                        result = self.MEM.load(lsq_entry.target_address)
+
+                    if self.on_execute is not None:
+                        self.execute_event(rob_tag, result)
+
+                    latency = 1
+                    if self.cache is not None:
+                        latency = self.cache.access(
+                            lsq_entry.target_address,
+                            self.rob.lookup(rob_tag).fetched_at_pc,
+                        )
+
+                    if latency > 1:
+                        self.loads_in_flight.append(
+                            (self.cycles + latency - 1, rob_tag, result)
+                        )
+                    else:
+                        self.writeback_queue.push((rob_tag, result))
 
                 # or we just pass the value straight up
                 else:
-                    updates += [("push", "writeback_queue", (rob_tag, lsq_entry.value))]
+                    if self.on_execute is not None:
+                        self.execute_event(rob_tag, lsq_entry.value)
+
+                    self.writeback_queue.push((rob_tag, lsq_entry.value))
 
             elif lsq_entry.opcode == "sw":
 
-                updates += [("push", "writeback_queue", (rob_tag, lsq_entry.value))]
+                if self.on_execute is not None:
+                    self.execute_event(rob_tag, lsq_entry.value)
+
+                self.writeback_queue.push((rob_tag, lsq_entry.value))
 
             else:
                 raise ValueError("Something is really wrong with the mem component")
 
-        return updates
+    """
+    Returns True if the pipeline was flushed
+    """
 
     def writeback(self):
-        updates = []
+        wrote_back = len(self.writeback_queue) > 0
 
-        if len(self.writeback_queue) > 0:
+        if wrote_back:
 
             # update the rob and boradcast
 
-            rob_tag, result = self.writeback_queue[-1]
-            updates += [("pop", "writeback_queue", None)]
+            rob_tag, result = self.writeback_queue.peek()
 
             # 1. broadcast the finished value to the reservation station and lsq
             if result is not None:
                 self.broadcast(rob_tag, result)
 
+                if self.on_broadcast is not None:
+                    self.on_broadcast(BroadcastEvent(self.cycles, rob_tag, result))
+
             # mark rob entry as done and hydrate the value
             self.rob.done(rob_tag, result)
 
+            if self.on_writeback is not None:
+                entry = self.rob.lookup(rob_tag)
+                self.on_writeback(
+                    WritebackEvent(
+                        self.cycles, entry.fetched_at_pc, entry.opcode, result, rob_tag
+                    )
+                )
+
         if self.rob.can_commit():
 
             rob_entry_to_commit = self.rob.lookup(self.rob.commit_pointer)
@@ -1228,31 +1832,49 @@ class ScheduledProcessor(Processor):
             success, correct_pc = self.predictor.check(rob_entry_to_commit)
 
             if not success:
+                if self.trace is not None:
+                    self.trace_commit(rob_entry_to_commit, None, correct_pc, True)
+
+                if self.on_commit is not None:
+                    self.on_commit(self.commit_event(rob_entry_to_commit, True))
+
                 self.flush_pipeline(pc=correct_pc)
                 self.executed += 1
-                self.finished.append(rob_entry_to_commit.opcode)
-                return [], True
+                self.finished[rob_entry_to_commit.opcode] += 1
+                self.committed += 1
+                self.refilling = True
+                return True
+
+            lsq_entry_to_commit = None
 
             # committing memory operations
             if Decoder.is_mem(rob_entry_to_commit.opcode):
 
                 lsq_entry_to_commit = self.lsq.lookup(self.lsq.commit_pointer)
 
+                # nothing to commit yet, the written back value stays on the queue for the next iteration
                 if lsq_entry_to_commit is None:
-                    return [], False
+                    return False
 
                 # stores get put to writeback queue in mem cycle
                 if rob_entry_to_commit.opcode == "sw":
                     # perform the store
-                    self.MEM[
-                        lsq_entry_to_commit.target_address
-                    ] = rob_entry_to_commit.value
+                    self.MEM.store(
+                        lsq_entry_to_commit.target_address, rob_entry_to_commit.value
+                    )
 
                     # notify all the loads with matching address of the value, this allows them to dispatch
                     self.lsq.forward_store(
                         lsq_entry_to_commit, rob_entry_to_commit.value
                     )
 
+                    # stores drain through a write buffer, they only update the cache state
+                    if self.cache is not None:
+                        self.cache.access(
+                            lsq_entry_to_commit.target_address,
+                            rob_entry_to_commit.fetched_at_pc,
+                        )
+
                 self.lsq.free()
 
             # committing everything else
@@ -1262,9 +1884,65 @@ class ScheduledProcessor(Processor):
             self.rob.free()
 
             self.executed += 1
-            self.finished.append(rob_entry_to_commit.opcode)
+            self.finished[rob_entry_to_commit.opcode] += 1
+            self.committed += 1
+            self.refilling = False
+
+            if self.trace is not None:
+                self.trace_commit(rob_entry_to_commit, lsq_entry_to_commit, correct_pc)
+
+            if self.on_commit is not None:
+                self.on_commit(self.commit_event(rob_entry_to_commit, lsq_entry=lsq_entry_to_commit))
+
+        if wrote_back:
+            self.writeback_queue.pop()
+
+        return False
+
+    def execute_event(self, rob_tag, result):
+        entry = self.rob.lookup(rob_tag)
+        self.on_execute(ExecuteEvent(self.cycles, entry.fetched_at_pc, entry.opcode, result, rob_tag))
+
+    def commit_event(self, rob_entry, mispredicted=False, lsq_entry=None):
+        if Decoder.is_branch(rob_entry.opcode):
+            return CommitEvent(
+                self.cycles,
+                rob_entry.fetched_at_pc,
+                rob_entry.opcode,
+                None,
+                rob_entry.id,
+                mispredicted,
+            )
 
-        return updates, False
+        return CommitEvent(
+            self.cycles,
+            rob_entry.fetched_at_pc,
+            rob_entry.opcode,
+            rob_entry.value,
+            rob_entry.id,
+            register=None if rob_entry.destination == 32 else rob_entry.destination,
+            address=None if lsq_entry is None else lsq_entry.target_address,
+        )
+
+    def trace_commit(self, rob_entry, lsq_entry, correct_pc, mispredicted=False):
+        if Decoder.is_branch(rob_entry.opcode):
+            self.trace.commit(
+                self.cycles,
+                rob_entry.fetched_at_pc,
+                rob_entry.opcode,
+                target=correct_pc,
+                taken=bool(rob_entry.value),
+                mispredicted=mispredicted,
+            )
+        else:
+            self.trace.commit(
+                self.cycles,
+                rob_entry.fetched_at_pc,
+                rob_entry.opcode,
+                register=None if rob_entry.destination == 32 else rob_entry.destination,
+                result=rob_entry.value,
+                address=None if lsq_entry is None else lsq_entry.target_address,
+            )
 
     def broadcast(self, tag, value):
         # call the capture methods of the queues
@@ -1276,19 +1954,51 @@ class ScheduledProcessor(Processor):
 
         return v != 1
 
+    def restore(self, RF, MEM, PC):
+        self.rf.ARF[: len(RF)] = RF
+        self.RF = self.rf.ARF
+        memory = MEM.copy() if isinstance(MEM, Memory) else Memory.from_values(MEM)
+        self.MEM = memory.counting() if self.MEM.count else memory
+        self.PC = PC
+
+    def reset_stats(self):
+        super().reset_stats()
+        self.finished = Counter()
+        self.predictor.reset_stats()
+
+        if self.cache is not None:
+            self.cache.reset_stats()
+
+        if self.profile is not None:
+            self.profile.reset()
+
+        self.counters.reset()
+
     def flush_pipeline(self, pc):
+        if self.on_flush is not None:
+            # everything younger than the mispredicted branch, which commits, including what the front end
+            # staged in this iteration
+            squashed = self.rob.occupied - 1 + sum(
+                queue.size - queue.popped + queue.pushed
+                for queue in [self.decode_queue, self.issue_queue]
+            )
+            self.on_flush(FlushEvent(self.cycles, pc, squashed))
+
         # reset everything
         self.rf.reset_mappings()
-        self.decode_queue = []
-        self.issue_queue = []
-        self.execute_queue = []
-        self.mem_queue = []
+        self.decode_queue.clear()
+        self.issue_queue.clear()
+        self.execute_queue.clear()
+        self.mem_queue.clear()
 
-        self.writeback_queue = []
+        self.writeback_queue.clear()
 
-        self.rob = ReorderBuffer()
-        self.rs = ReservationStation()
-        self.lsq = LoadStoreQueue()
+        self.rob.reset()
+        self.rs.reset()
+        self.lsq.reset()
+
+        self.loads_in_flight = []
+        self.executing = []
 
         # set the pc
         self.PC = pc
@@ -1296,6 +2006,41 @@ class ScheduledProcessor(Processor):
         # increment executed to count the branch
         # self.executed += 1
 
+    def details(self):
+        return {
+            "prediction_accuracy": self.predictor.prediction_accuracy(),
+            "average_branch_distance": self.predictor.average_branch_distance(),
+            "committed": dict(self.finished),
+            "counters": self.counters.as_dict(),
+        }
+
+    def tables(self):
+        # occupied entries only, oldest first
+        rob = []
+        ix = self.rob.commit_pointer
+        for _ in range(self.rob.occupied):
+            e = self.rob.entries[ix]
+            rob.append([e.id, self.image[e.fetched_at_pc].text, e.destination, e.value, e.done])
+            ix = (ix + 1) % len(self.rob.entries)
+
+        rs = [
+            [ix, e.opcode, e.dest_tag, e.tag1, e.tag2, e.val1, e.val2]
+            for ix, e in ((ix, self.rs.entries[ix]) for ix in sorted(self.rs.occupied))
+        ]
+
+        lsq = []
+        ix = self.lsq.commit_pointer
+        for _ in range(self.lsq.occupancy()):
+            e = self.lsq.entries[ix]
+            lsq.append([e.id, e.opcode, e.dest_tag, e.target_address, e.tag_value, e.value, e.dispatched])
+            ix = (ix + 1) % len(self.lsq.entries)
+
+        return {
+            "ROB": (["id", "instruction", "destination", "value", "done"], rob),
+            "RS": (["slot", "opcode", "rob tag", "tag 1", "tag 2", "value 1", "value 2"], rs),
+            "LSQ": (["id", "opcode", "rob tag", "address", "source tag", "value", "dispatched"], lsq),
+        }
+
     def print_stats(self):
         print(f"CYCLE: {self.cycles}")
         print(self.RF)
@@ -1308,4 +2053,16 @@ class ScheduledProcessor(Processor):
         print(f"LSQ COMMIT POINTER -> {self.lsq.commit_pointer}")
         print(self.lsq)
 
+        if self.cache is not None:
+            print(self.cache)
+
+        if self.units is not None:
+            print(self.units)
+            print(f"UNIT UTILISATION {self.units.utilisation(self.cycles)}")
+
+        print(self.counters)
+
+        if self.profile is not None:
+            print(self.profile)
+
         print({i: line for i, line in enumerate(self.program)})
@@ -1,5 +1,7 @@
 from processor import Processor
 from instruction import Instruction
+from functional_units import unit_kinds
+from observers import FetchEvent, ExecuteEvent, CommitEvent
 
 
 class SimpleProcessor(Processor):
@@ -10,16 +12,20 @@ class SimpleProcessor(Processor):
         prediction_method=None,
         instructions_per_cycle=1,
         debug=False,
+        functional_units=None,
+        trace=None,
+        observers=(),
     ):
-        super().__init__(program, symbols, debug)
+        super().__init__(program, symbols, debug, trace, observers)
 
         self.RF = [0] * 32
 
+        # optional pool of functional units, only their latencies matter without overlap
+        self.units = functional_units
+
     def cycle(self):
         def fetch(self):
-            instruction_string = self.program[self.PC]
-
-            blank_instruction = Instruction(instruction_string, self.symbols, self.PC)
+            blank_instruction = Instruction(self.image[self.PC], self.PC)
 
             self.PC += 1
             return blank_instruction
@@ -38,9 +44,9 @@ class SimpleProcessor(Processor):
         def mem_access(self, i):
 
             if i.opcode == "lw":
-                return self.MEM[i.target_address]
+                return self.MEM.load(i.target_address)
             elif i.opcode == "sw":
-                self.MEM[i.target_address] = self.RF[i.target_register]
+                self.MEM.store(i.target_address, self.RF[i.target_register])
                 self.executed += 1
 
             else:
@@ -54,6 +60,11 @@ class SimpleProcessor(Processor):
         # Fetch
         blank_instruction = fetch(self)
 
+        if self.on_fetch is not None:
+            self.on_fetch(
+                FetchEvent(self.cycles, blank_instruction.pc, blank_instruction.decoded.opcode)
+            )
+
         # Decode
         decoded_instruction = decode(self, blank_instruction)
 
@@ -62,11 +73,27 @@ class SimpleProcessor(Processor):
             if decoded_instruction.branch_target != -1:
                 self.PC = decoded_instruction.branch_target
             self.executed += 1
+
+            if self.trace is not None:
+                self.trace.commit_instruction(self.cycles, decoded_instruction, self.MEM)
+
+            if self.on_commit is not None:
+                self.on_commit(self.commit_event(decoded_instruction))
             return
 
         # Execute
         computed_instruction = decoded_instruction.compute()
 
+        if self.on_execute is not None:
+            self.on_execute(
+                ExecuteEvent(
+                    self.cycles,
+                    computed_instruction.pc,
+                    computed_instruction.opcode,
+                    computed_instruction.result,
+                )
+            )
+
         # Mem acess
         if computed_instruction.target_address is not None:
             result = mem_access(self, computed_instruction)
@@ -76,10 +103,33 @@ class SimpleProcessor(Processor):
         if computed_instruction.result is not None:
             write_back(self, computed_instruction)
 
-        self.cycles += 5
+        # one cycle per stage, execute takes as long as the unit doing it
+        if self.units is not None and computed_instruction.opcode in unit_kinds:
+            self.cycles += 4 + self.units.latency(computed_instruction.opcode)
+        else:
+            self.cycles += 5
+
+        if self.trace is not None:
+            self.trace.commit_instruction(self.cycles, computed_instruction, self.MEM)
+
+        if self.on_commit is not None:
+            self.on_commit(self.commit_event(computed_instruction))
 
+    def commit_event(self, i):
+        # stores report the value they wrote
+        if i.opcode == "sw":
+            return CommitEvent(
+                self.cycles, i.pc, i.opcode, self.RF[i.target_register], address=i.target_address
+            )
+
+        return CommitEvent(
+            self.cycles, i.pc, i.opcode, i.result, register=i.target_register, address=i.target_address
+        )
 
     def print_stats(self):
         print(self.cycles)
         print(self.RF)
         print(self.MEM)
+
+        if self.units is not None:
+            print(self.units)
@@ -0,0 +1,247 @@
+import time
+from typing import *
+
+import assembler
+import registry
+
+from tests import tests
+
+"""
+Run programs from Python instead of the command line. simulate runs one program on one processor and returns
+its Stats, batch runs many jobs in this process and assembles every program only once.
+
+Both take a budget, max_cycles and timeout in seconds, so a program that never sets $31 stops instead of
+spinning forever. The Stats of a run that ran out of budget have the status "max_cycles" or "timeout" and
+the state the processor had at that point.
+
+    from simulation import simulate, batch, Job
+
+    stats = simulate("programs/pi.asm", "scheduled", {"prediction_method": "gshare"}, max_cycles=10000)
+    print(stats.status, stats.cycles, stats.cpi)
+
+    for stats in batch([Job(f, "scheduled", {"instructions_per_cycle": s}) for f in files for s in [1, 4]]):
+        ...
+
+The config is passed to the processor as keyword arguments, options holding state (a Cache, a
+FunctionalUnitPool, a TraceWriter) need a fresh instance for every run.
+"""
+
+# check the wall clock every this many cycles, or instructions of the functional processor
+TIMEOUT_CHECK_INTERVAL = 1024
+FUNCTIONAL_CHUNK = 65536
+
+
+class Program(NamedTuple):
+    name: str
+    instructions: List[str]
+    symbols: Dict[str, int]
+
+
+def load_program(filename) -> Program:
+    try:
+        with open(filename) as f:
+            lines = f.readlines()
+    except:
+        raise RuntimeError(f"File {filename} not found, please check path.")
+
+    instructions, symbols = assembler.assemble(lines)
+    return Program(filename, instructions, symbols)
+
+
+class Stats(NamedTuple):
+    program: str
+    processor: str
+    status: str  # "halted", "max_cycles", "timeout" or "failed"
+    cycles: int
+    executed: int
+    elapsed: float  # host seconds spent simulating
+    passed: Optional[bool]  # the check of tests.py, None if the program has none or did not halt
+    RF: List[int]
+    details: Dict[str, Any]  # processor specific, see details
+
+    @property
+    def cpi(self):
+        return self.cycles / self.executed if self.executed else float("inf")
+
+    @property
+    def ipc(self):
+        return self.executed / self.cycles if self.cycles else 0.0
+
+    def as_dict(self):
+        return {**self._asdict(), "cpi": self.cpi, "ipc": self.ipc}
+
+
+def details(cpu) -> Dict[str, Any]:
+    # plain values only, the stats outlive the processor
+    result = cpu.details()
+
+    if getattr(cpu, "cache", None) is not None:
+        result["cache_hit_rate"] = cpu.cache.hit_rate()
+
+    if getattr(cpu, "units", None) is not None:
+        result["unit_utilisation"] = cpu.units.utilisation(cpu.cycles)
+
+    if cpu.MEM.count:
+        result["memory_pages"] = [
+            {"address": start, "loads": loads, "stores": stores}
+            for start, loads, stores in cpu.MEM.page_counters()
+        ]
+
+    return result
+
+
+"""
+Run until the program halts or a budget runs out, returns the status. Cycles can jump past max_cycles
+when the processor skips idle cycles, the run stops at the first cycle at or past it.
+"""
+
+
+def run(cpu, max_cycles=None, timeout=None):
+    if not cpu.cycle_accurate:
+        return run_functional(cpu, max_cycles, timeout)
+
+    if max_cycles is None and timeout is None:
+        cpu.run()
+        return "halted"
+
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    checked = 0
+
+    while cpu.running():
+        if max_cycles is not None and cpu.cycles >= max_cycles:
+            return "max_cycles"
+
+        checked += 1
+        if deadline is not None and checked == TIMEOUT_CHECK_INTERVAL:
+            checked = 0
+            if time.perf_counter() > deadline:
+                return "timeout"
+
+        cpu.cycle()
+
+    return "halted"
+
+
+def run_functional(cpu, max_cycles, timeout):
+    # one instruction a cycle, run in chunks so the clock can be checked in between
+    deadline = None if timeout is None else time.perf_counter() + timeout
+
+    while cpu.running():
+        chunk = FUNCTIONAL_CHUNK if deadline is not None else None
+
+        if max_cycles is not None:
+            if cpu.cycles >= max_cycles:
+                return "max_cycles"
+            left = max_cycles - cpu.cycles
+            chunk = left if chunk is None else min(chunk, left)
+
+        cpu.run(max_instructions=chunk)
+
+        if deadline is not None and cpu.running() and time.perf_counter() > deadline:
+            return "timeout"
+
+    return "halted"
+
+
+"""
+Build the processor of a run without running it, for callers that need the processor itself, like main.py.
+The program can be a file name, the config is passed to the processor like for simulate.
+"""
+
+
+def build(
+    program: Union[str, Program],
+    processor: Union[str, type] = "scheduled",
+    config: Optional[Dict[str, Any]] = None,
+    start=None,
+    warmup=0,
+    observers=(),
+):
+    if isinstance(program, str):
+        program = load_program(program)
+
+    if isinstance(processor, str):
+        processor = registry.processor(processor)
+
+    config = {"prediction_method": "two_bit", **(config or {})}
+    if not processor.cycle_accurate and observers:
+        raise RuntimeError("the functional processor reports no events")
+    if observers:
+        config["observers"] = observers
+
+    # the processor adds the data labels to the symbols, keep the program reusable
+    symbols = dict(program.symbols)
+
+    # optionally fast forward functionally to a label or a number of instructions first, see fast_forward
+    if start is not None:
+        from functional_processor import fast_forward
+
+        return fast_forward(
+            program.instructions, symbols, processor, start, warmup=warmup, **config
+        )
+
+    return processor(program.instructions, symbols, **config)
+
+
+def simulate(
+    program: Union[str, Program],
+    processor: Union[str, type] = "scheduled",
+    config: Optional[Dict[str, Any]] = None,
+    max_cycles=None,
+    timeout=None,
+    start=None,
+    warmup=0,
+    observers=(),
+) -> Stats:
+    if isinstance(program, str):
+        program = load_program(program)
+
+    cpu = build(program, processor, config, start, warmup, observers)
+
+    began = time.perf_counter()
+    status = run(cpu, max_cycles, timeout)
+    elapsed = time.perf_counter() - began
+
+    check = tests.get(program.name)
+
+    return Stats(
+        program=program.name,
+        processor=type(cpu).__name__,
+        status=status,
+        cycles=cpu.cycles,
+        executed=cpu.executed,
+        elapsed=elapsed,
+        passed=check(cpu) if check is not None and status == "halted" else None,
+        RF=list(cpu.RF),
+        details=details(cpu),
+    )
+
+
+class Job(NamedTuple):
+    program: str
+    processor: Union[str, type] = "scheduled"
+    config: Optional[Dict[str, Any]] = None
+
+
+"""
+Run the jobs one after the other and yield their stats as they finish. A job that raises gives Stats with
+the status "failed" and the error in the details, the other jobs still run. The budgets apply to every job.
+"""
+
+
+def batch(jobs: Iterable[Job], max_cycles=None, timeout=None) -> Iterator[Stats]:
+    programs: Dict[str, Program] = {}
+
+    for job in jobs:
+        job = Job(*job)
+
+        try:
+            if job.program not in programs:
+                programs[job.program] = load_program(job.program)
+
+            yield simulate(
+                programs[job.program], job.processor, job.config, max_cycles, timeout
+            )
+        except Exception as e:
+            name = job.processor if isinstance(job.processor, str) else job.processor.__name__
+            yield Stats(job.program, name, "failed", 0, 0, 0.0, None, [], {"error": str(e)})
@@ -0,0 +1,127 @@
+import time
+from typing import *
+
+"""
+Host time, and optionally memory, spent in each stage of the scheduled processor. The processor only
+switches to its profiled cycle when it is given a StageProfile, so an unprofiled run has no timers at all.
+
+Memory is measured with tracemalloc as the change in traced memory across a stage, so it is what the stage
+kept alive (entries, latches, results), not everything it touched. Tracing slows the run down a lot, the
+times of a run with memory=True are only good relative to each other.
+"""
+
+stages = [
+    "skip_idle",
+    "fetch",
+    "decode",
+    "issue",
+    "dispatch",
+    "execute",
+    "mem",
+    "writeback",
+    "tick",
+]
+
+# the structures each stage mostly works on, to point at what to optimise
+structures = {
+    "skip_idle": "queues, ROB, LSQ",
+    "fetch": "image, predictor",
+    "decode": "decoder",
+    "issue": "ROB, RS, LSQ, rename",
+    "dispatch": "RS, LSQ, functional units",
+    "execute": "ALU, functional units",
+    "mem": "LSQ, cache, memory",
+    "writeback": "CDB, ROB commit, predictor",
+    "tick": "latches",
+}
+
+
+class StageProfile:
+    def __init__(self, memory=False):
+        self.memory = memory
+
+        self.started_tracing = False
+        self.bias = 0  # what reading the traced memory allocates itself
+        self.reset()
+
+    def reset(self):
+        self.seconds: Dict[str, float] = {stage: 0.0 for stage in stages}
+        self.allocated: Dict[str, int] = {stage: 0 for stage in stages}
+        self.cycles = 0
+
+    def start(self):
+        # tracemalloc pulls in pickle, only memory profiles pay for it
+        import tracemalloc
+
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+        if self.memory:
+            self.bias = reading_cost()
+
+    def stop(self):
+        if self.started_tracing:
+            import tracemalloc
+
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def total(self):
+        return sum(self.seconds.values())
+
+    def report(self):
+        total = max(self.total(), 1e-12)
+        cycles = max(self.cycles, 1)
+
+        lines = [f"STAGE PROFILE over {self.cycles} cycles, {self.total():.4f}s"]
+
+        for stage in sorted(stages, key=self.seconds.get, reverse=True):
+            line = (
+                f"{stage:<10} {self.seconds[stage]:9.4f}s {self.seconds[stage] / total:6.1%}"
+                f" {self.seconds[stage] / cycles * 1e6:9.2f} us/cycle"
+            )
+
+            if self.memory:
+                line += f" {self.allocated[stage] / 1024:10.1f} KiB"
+
+            lines.append(f"{line}   {structures[stage]}")
+
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.report()
+
+
+def reading_cost():
+    # reading the traced memory allocates an int, which the second reading sees
+    import tracemalloc
+
+    before = tracemalloc.get_traced_memory()[0]
+    after = tracemalloc.get_traced_memory()[0]
+    return after - before
+
+
+"""
+Run one stage under the profile, returns what the stage returned
+"""
+
+
+def timed(profile: StageProfile, stage, method):
+    clock = time.perf_counter
+
+    if profile.memory:
+        import tracemalloc
+
+        start = clock()
+        before = tracemalloc.get_traced_memory()[0]
+        result = method()
+        after = tracemalloc.get_traced_memory()[0]
+        profile.seconds[stage] += clock() - start
+        profile.allocated[stage] += after - before - profile.bias
+    else:
+        start = clock()
+        result = method()
+        profile.seconds[stage] += clock() - start
+
+    return result
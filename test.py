@@ -1,3 +1,4 @@
+import io
 from os import listdir
 from os.path import isfile, join
 from columnar import columnar
@@ -6,12 +7,19 @@ from tqdm import tqdm
 import click
 import time
 
-import assembler
 from simple_processor import SimpleProcessor
 from pipelined_processor import PipelinedProcessor
 from scheduled_processor import ScheduledProcessor
+from functional_processor import FunctionalProcessor
 
-from tests import tests
+from stage_profile import StageProfile
+from debugger import Debugger, parse_breakpoint
+from cache import Cache
+from functional_units import FunctionalUnitPool
+from commit_trace import TraceWriter
+import registry
+from simulation import load_program
+from tests import tests, matches_reference
 
 parser = argparse.ArgumentParser(description="Run the test suite for all programs")
 
@@ -28,44 +36,67 @@ parser.add_argument(
     "--predictor",
     required=True,
     help="Choose the branch prediction method.",
-    choices=["taken", "not_taken", "one_bit", "two_bit"],
+    choices=list(registry.predictors),
     dest="prediction_method",
 )
 
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Print the time spent in each stage of the scheduled processor.",
+    dest="profile",
+)
+
 args = parser.parse_args()
 
 
 files = [k for k in tests.keys()]
-processors = [SimpleProcessor, PipelinedProcessor, ScheduledProcessor]
+# assembled once, every processor runs the same programs
+programs = {ffile: load_program(ffile) for ffile in files}
+# the functional processor goes first, its runs are the golden reference for the others
+processors = [
+    FunctionalProcessor,
+    SimpleProcessor,
+    PipelinedProcessor,
+    ScheduledProcessor,
+]
 names = [proc.__name__ for proc in processors]
 tables_data = []
+references = {}
+profiles = {}
 
 for processor in tqdm(processors):
     data = []
     
     for ffile in tqdm(files):
-        try:
-            with open(ffile) as f:
-                program = f.readlines()
-        except:
-            raise RuntimeError(f"File {ffile} not found, please check path.")
+        program = programs[ffile]
+
+        options = {}
 
-        instructions, symbols = assembler.assemble(program)
+        # every run of the cycle level processors writes a trace, one record per instruction it finished
+        if processor is not FunctionalProcessor:
+            options["trace"] = TraceWriter(io.BytesIO())
+
+        if args.profile and processor is ScheduledProcessor:
+            options["profile"] = profiles[ffile] = StageProfile()
 
         cpu = processor(
-            instructions,
-            symbols,
+            program.instructions,
+            dict(program.symbols),
             prediction_method=args.prediction_method,
             instructions_per_cycle=args.instructions_per_cycle,
+            **options,
         )
 
         start = time.time()
 
-        while cpu.running():
-            cpu.cycle()
+        cpu.run()
 
         end = time.time()
 
+        if isinstance(cpu, FunctionalProcessor):
+            references[ffile] = cpu
+
         elapsed_simple = end - start
 
         row = [
@@ -73,6 +104,14 @@ for processor in tqdm(processors):
             click.style("PASSED", fg="green")
             if tests[ffile](cpu)
             else click.style("FAILED", fg="red"),
+            click.style("MATCH", fg="green")
+            if matches_reference(cpu, references[ffile])
+            else click.style("MISMATCH", fg="red"),
+            "-"
+            if cpu.trace is None
+            else click.style("COMPLETE", fg="green")
+            if len(cpu.trace) == cpu.executed
+            else click.style("INCOMPLETE", fg="red"),
             "{:#.4f}".format(elapsed_simple),
             cpu.cycles,
             cpu.executed,
@@ -93,6 +132,8 @@ for processor in tqdm(processors):
 header = [
     "filename",
     "test result",
+    "reference",
+    "trace",
     "elapsed (s)",
     "cycles",
     "instructions executed",
@@ -109,3 +150,132 @@ for table_data, proc_name in zip(tables_data, names):
     table = columnar(table_data, h, no_borders=True)
     print(click.style(proc_name, fg="cyan"))
     print(table)
+
+for ffile, profile in profiles.items():
+    print(click.style(ffile, fg="cyan"))
+    print(profile)
+
+
+"""
+Idle cycle skipping. Each program runs again on the pipelined and scheduled processors with a slow cache, and
+slow multiply and divide units for the scheduled one, so the pipeline keeps waiting in the middle of the
+program. Every run is repeated step by step with skip_idle switched off, both have to end in the same state
+after the same number of cycles.
+"""
+
+
+def idle_run(processor, program, skip):
+    options = {
+        "cache": Cache(
+            size=16, associativity=2, line_size=4, replacement="lru", hit_latency=1, miss_latency=40
+        )
+    }
+    if processor is ScheduledProcessor:
+        options["functional_units"] = FunctionalUnitPool.from_spec("mul=1:20,div=1:30:blocking")
+
+    cpu = processor(
+        program.instructions,
+        dict(program.symbols),
+        prediction_method=args.prediction_method,
+        instructions_per_cycle=args.instructions_per_cycle,
+        **options,
+    )
+
+    # cycles jumped over, and how many of them before fetch ran past the end of the program
+    skipped = [0, 0]
+    skip_idle = cpu.skip_idle
+
+    def counted_skip_idle():
+        before = cpu.cycles
+        skip_idle()
+        skipped[0] += cpu.cycles - before
+        if cpu.PC < len(cpu.image):
+            skipped[1] += cpu.cycles - before
+
+    cpu.skip_idle = counted_skip_idle if skip else (lambda: None)
+    cpu.run()
+
+    stalls = cpu.num_stalls if processor is PipelinedProcessor else cpu.counters.as_dict()
+    return (cpu.cycles, cpu.executed, cpu.RF[:32], cpu.MEM, stalls), skipped
+
+
+for processor in [PipelinedProcessor, ScheduledProcessor]:
+    data = []
+
+    for ffile in files:
+        stepped, _ = idle_run(processor, programs[ffile], False)
+        state, skipped = idle_run(processor, programs[ffile], True)
+
+        data.append(
+            [
+                ffile,
+                click.style("SAME", fg="green")
+                if state == stepped
+                else click.style("DIFFERENT", fg="red"),
+                stepped[0],
+                state[0],
+                skipped[0],
+                skipped[1],
+            ]
+        )
+
+    header = [
+        "filename",
+        "skipping",
+        "cycles step by step",
+        "cycles",
+        "cycles skipped",
+        "skipped mid-program",
+    ]
+    print(click.style(f"{processor.__name__} skipping idle cycles", fg="cyan"))
+    print(columnar(data, header, no_borders=True))
+
+
+"""
+Debugger snapshots. The debugger stops bubblesort at a cycle breakpoint and shows the buffers from a few
+cycles before, those have to be what a second run stopped at that earlier cycle holds.
+"""
+
+data = []
+for processor in [SimpleProcessor, PipelinedProcessor, ScheduledProcessor]:
+    program = programs["programs/bubblesort.asm"]
+
+    def build():
+        return processor(
+            program.instructions,
+            dict(program.symbols),
+            prediction_method=args.prediction_method,
+            instructions_per_cycle=args.instructions_per_cycle,
+        )
+
+    cpu = build()
+    debugger = Debugger(cpu, [parse_breakpoint("cycle=60", cpu.symbols)], history=8)
+    debugger.run()
+    snapshot = debugger.snapshots[-6]
+
+    again = build()
+    while again.cycles < snapshot.cycle:
+        again.cycle()
+
+    rendered = debugger.show(5)
+    data.append(
+        [
+            processor.__name__,
+            cpu.cycles,
+            snapshot.cycle,
+            ", ".join(snapshot.tables) or "-",
+            click.style("SAME", fg="green")
+            if snapshot.tables == again.tables()
+            and all(name in rendered for name in snapshot.tables)
+            else click.style("DIFFERENT", fg="red"),
+        ]
+    )
+
+print(click.style("Debugger snapshots", fg="cyan"))
+print(
+    columnar(
+        data,
+        ["processor", "stopped at cycle", "shown cycle", "buffers", "buffers shown"],
+        no_borders=True,
+    )
+)
@@ -186,4 +186,21 @@ tests = {
     ),
     "programs/scheduling_block.asm": (lambda cpu: cpu.RF[12] == -88),
     "programs/simple_bubblesort.asm": (lambda cpu: cpu.MEM == [1, 2, 3, 3, 3, 4]),
+    "programs/store_forwarding.asm": (
+        lambda cpu: cpu.RF[4] == 1125750 and cpu.RF[6] == 1125750
+    ),
+    "programs/wide_values.asm": (
+        lambda cpu: cpu.MEM == [2 ** 128]
+        and cpu.RF[4] == 2 ** 128 - 1
+        and cpu.RF[6] == 2.0 ** 127
+    ),
 }
+
+
+"""
+Final architectural state of a processor compared to the FunctionalProcessor run of the same program
+"""
+
+
+def matches_reference(cpu, reference):
+    return cpu.MEM == reference.MEM and cpu.RF[:32] == reference.RF[:32]
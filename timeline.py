@@ -0,0 +1,280 @@
+import json
+from collections import deque
+from typing import *
+
+from observers import Observer
+
+"""
+When every instruction went through every stage, written out while the processor runs so long runs can be
+exported. The timeline listens to the observer hooks, the instructions it keeps are only the ones in flight,
+every instruction is written out and dropped once it commits or is squashed.
+
+Fetch and decode carry no ROB tag, so an instruction is matched to its fetch by pc, the oldest instruction in
+flight at that pc that has not reached the stage yet. The front end is in order, so that is always the right
+one. From issue on the scheduled processor reports the ROB tag, which is exact.
+
+Two formats are written:
+
+    chrome    Chrome trace event JSON, open it in Perfetto or chrome://tracing. Every stage of an
+              instruction is a slice, one cycle shows as one microsecond and instructions are spread over a
+              few lanes so the rows stay readable
+    konata    a Kanata log for the Konata pipeline viewer, one row per instruction
+"""
+
+stages = ["fetch", "decode", "issue", "dispatch", "execute", "writeback", "commit"]
+
+
+class Record:
+    __slots__ = ("id", "pc", "text", "tag", "stages")
+
+    def __init__(self, id, pc, text):
+        self.id = id  # in fetch order
+        self.pc = pc
+        self.text = text
+        self.tag = None  # ROB tag once issued, scheduled processor only
+        self.stages: Dict[str, int] = {}  # stage -> cycle it was entered, in order
+
+
+class Timeline(Observer):
+    def __init__(self, cpu, writer):
+        self.image = cpu.image
+        self.writer = writer
+
+        self.front: Deque[Record] = deque()  # fetched and not issued yet, oldest first
+        self.issued: Deque[Record] = deque()  # issued without a tag, oldest first
+        self.by_tag: Dict[int, Record] = {}
+
+        self.fetched = 0
+        self.cycle = 0
+
+        cpu.attach(self)
+
+    def in_flight(self):
+        return len(self.front) + len(self.issued) + len(self.by_tag)
+
+    def enter(self, record, stage, cycle):
+        record.stages[stage] = cycle
+        self.cycle = cycle
+        self.writer.stage(record, stage, cycle)
+
+    def find(self, event, stage):
+        # the record an event is about, None if it was fetched before the timeline was attached
+        if event.tag is not None:
+            return self.by_tag.get(event.tag)
+
+        for records in [self.issued, self.front]:
+            for record in records:
+                if record.pc == event.pc and stage not in record.stages:
+                    return record
+
+        return None
+
+    def on_fetch(self, event):
+        record = Record(self.fetched, event.pc, self.image[event.pc].text)
+        self.fetched += 1
+
+        self.front.append(record)
+        self.enter(record, "fetch", event.cycle)
+
+    def on_decode(self, event):
+        for record in self.front:
+            if record.pc == event.pc and "decode" not in record.stages:
+                self.enter(record, "decode", event.cycle)
+                return
+
+    def on_issue(self, event):
+        for record in self.front:
+            if record.pc == event.pc and "issue" not in record.stages:
+                self.front.remove(record)
+
+                if event.tag is None:
+                    self.issued.append(record)
+                else:
+                    record.tag = event.tag
+                    self.by_tag[event.tag] = record
+
+                self.enter(record, "issue", event.cycle)
+                return
+
+    def on_dispatch(self, event):
+        record = self.find(event, "dispatch")
+        if record is not None:
+            self.enter(record, "dispatch", event.cycle)
+
+    def on_execute(self, event):
+        record = self.find(event, "execute")
+        if record is not None:
+            self.enter(record, "execute", event.cycle)
+
+    def on_writeback(self, event):
+        record = self.find(event, "writeback")
+        if record is not None:
+            self.enter(record, "writeback", event.cycle)
+
+    def on_commit(self, event):
+        record = self.find(event, "commit")
+        if record is None:
+            return
+
+        self.enter(record, "commit", event.cycle)
+        self.drop(record)
+        self.writer.retire(record, event.cycle, squashed=False)
+
+    def on_flush(self, event):
+        self.cycle = event.cycle
+
+        # the youngest instructions in flight are the squashed ones
+        records = sorted(
+            [*self.front, *self.issued, *self.by_tag.values()], key=lambda r: r.id
+        )
+        squashed = records[len(records) - event.squashed :] if event.squashed else []
+
+        for record in squashed:
+            self.drop(record)
+            self.writer.retire(record, event.cycle, squashed=True)
+
+        self.writer.flush(event)
+
+    def drop(self, record):
+        if record.tag is not None:
+            del self.by_tag[record.tag]
+        elif record in self.issued:
+            self.issued.remove(record)
+        else:
+            self.front.remove(record)
+
+    """
+    Whatever is still in flight when the program halts never commits, it is written out as squashed
+    """
+
+    def close(self):
+        for record in sorted(
+            [*self.front, *self.issued, *self.by_tag.values()], key=lambda r: r.id
+        ):
+            self.writer.retire(record, self.cycle, squashed=True)
+
+        self.front.clear()
+        self.issued.clear()
+        self.by_tag.clear()
+
+        self.writer.close()
+
+
+class ChromeTraceWriter:
+    def __init__(self, path, lanes=16):
+        self.f = open(path, "w")
+        self.lanes = lanes
+        self.first = True
+
+        self.f.write("[\n")
+
+    def write(self, event):
+        if not self.first:
+            self.f.write(",\n")
+        self.first = False
+
+        self.f.write(json.dumps(event))
+
+    def stage(self, record, stage, cycle):
+        # slices need their end, they are written when the instruction retires
+        pass
+
+    def retire(self, record, cycle, squashed):
+        entered = list(record.stages.items())
+        ends = [c for _, c in entered[1:]] + [cycle + 1]
+
+        for (stage, start), end in zip(entered, ends):
+            self.write(
+                {
+                    "name": stage,
+                    "cat": "squashed" if squashed else "committed",
+                    "ph": "X",
+                    "ts": start,
+                    "dur": end - start,
+                    "pid": 0,
+                    "tid": record.id % self.lanes,
+                    "args": {"id": record.id, "pc": record.pc, "instruction": record.text},
+                }
+            )
+
+    def flush(self, event):
+        self.write(
+            {
+                "name": "flush",
+                "ph": "i",
+                "s": "g",
+                "ts": event.cycle,
+                "pid": 0,
+                "tid": 0,
+                "args": {"pc": event.pc, "squashed": event.squashed},
+            }
+        )
+
+    def close(self):
+        self.f.write("\n]\n")
+        self.f.close()
+
+
+# short stage names, Konata draws them inside the cycles
+konata_stages = {
+    "fetch": "F",
+    "decode": "Dc",
+    "issue": "Is",
+    "dispatch": "Ds",
+    "execute": "X",
+    "writeback": "Wb",
+    "commit": "Cm",
+}
+
+
+class KonataWriter:
+    def __init__(self, path):
+        self.f = open(path, "w")
+        self.cycle = None
+        self.retired = 0
+
+        self.f.write("Kanata\t0004\n")
+
+    def advance(self, cycle):
+        # the log is in cycle order, every line happens at the cycle of the last C line
+        if self.cycle is None:
+            self.f.write(f"C=\t{cycle}\n")
+        elif cycle > self.cycle:
+            self.f.write(f"C\t{cycle - self.cycle}\n")
+        else:
+            return
+
+        self.cycle = cycle
+
+    def stage(self, record, stage, cycle):
+        self.advance(cycle)
+
+        if stage == "fetch":
+            self.f.write(f"I\t{record.id}\t{record.id}\t0\n")
+            self.f.write(f"L\t{record.id}\t0\t{record.pc}: {record.text}\n")
+        else:
+            previous = list(record.stages)[-2]
+            self.f.write(f"E\t{record.id}\t0\t{konata_stages[previous]}\n")
+
+        self.f.write(f"S\t{record.id}\t0\t{konata_stages[stage]}\n")
+
+    def retire(self, record, cycle, squashed):
+        self.advance(cycle)
+
+        last = next(reversed(record.stages))
+        self.f.write(f"E\t{record.id}\t0\t{konata_stages[last]}\n")
+
+        if squashed:
+            self.f.write(f"R\t{record.id}\t0\t1\n")
+        else:
+            self.f.write(f"R\t{record.id}\t{self.retired}\t0\n")
+            self.retired += 1
+
+    def flush(self, event):
+        pass
+
+    def close(self):
+        self.f.close()
+
+
+writers = {"chrome": ChromeTraceWriter, "konata": KonataWriter}